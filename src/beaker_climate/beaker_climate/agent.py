@@ -69,7 +69,8 @@ class ClimateDataUtilityAgent(BeakerAgent):
         Returns:
             str: All available pangeo catalogs with descriptions.
         """
-        response = await agent.context.evaluate("__pangeo_info")
+        code = agent.context.get_code("get_catalog_info")
+        response = await agent.context.evaluate(code)
         return response
 
     @tool 
@@ -126,40 +127,74 @@ class ClimateDataUtilityAgent(BeakerAgent):
 
 
     @tool()
-    async def search_pangeo(self, catalog: str, keywords: dict, agent: AgentRef) -> list:
+    async def search_pangeo(self, catalog: str, keywords: dict, agent: AgentRef, limit: int = 25) -> dict:
         """
         Search the catalog using keywords.
-        This returns a list of datasets in the catalog that match.
+        This returns the number of datasets in the catalog that match, the names of the first ones,
+        and how many matching datasets there are for the most common values of each attribute.
         You will use this before getting a dataset with get_pangeo_dataset tool.
+        If there are many matches, narrow the search with the attribute counts rather than paging through all of them.
         
         Args:
             catalog (str): the catalog you've loaded with load_catalog
             keywords (Optional[dict]): Specific search parameter attributes (e.g., variable_id='tas', experiment_id='historical')
                                 Valid keys include: 'activity_id', 'experiment_id', 'variable_id', 
                                 'source_id', 'table_id', 'grid_label'            
+            limit (Optional[int]): how many dataset names to return, 25 by default
+
+        Returns:
+            dict: 'total' matches, the first dataset names as 'keys', 'next_offset' to page from, and 'facets' counts
+        """
+        code = agent.context.get_code("search", {"catalog": catalog, "keywords": keywords, "limit": limit})
+        response = await agent.context.evaluate(code)
+        return response["return"]
+
+    @tool()
+    async def page_pangeo_results(self, offset: int, agent: AgentRef, limit: int = 25, columns: list = None) -> dict:
+        """
+        Get more results of the last search_pangeo search.
+        Use the 'next_offset' of the previous page as offset.
+        
+        Args:
+            offset (int): position of the first dataset name to return
+            limit (Optional[int]): how many dataset names to return, 25 by default
+            columns (Optional[list]): attributes to return for each dataset, e.g. ['source_id', 'member_id']
 
         Returns:
-            list: a list of search results by dataset name (converted from a pandas dataframe)
+            dict: 'total' matches, the dataset names as 'keys', 'next_offset', and 'rows' of attributes if columns were given
         """
-        code = agent.context.get_code("search", {"catalog": catalog, "keywords": keywords})
+        code = agent.context.get_code("search_page", {"offset": offset, "limit": limit, "columns": columns})
         response = await agent.context.evaluate(code)
         return response["return"]
     
     
     @tool()
-    async def get_pangeo_dataset(self, variable_name: str, name: str, agent: AgentRef) -> str:
+    async def get_pangeo_dataset(self, variable_name: str, name: str, agent: AgentRef,
+                                 bbox: list = None, time_range: list = None, variables: list = None) -> str:
         """
         Get a dataset from the prior search and loads it to a given variable.
         This should be used after the search_pangeo tool.
+        When the user only needs a region, a period or some variables, pass them here rather than
+        selecting them afterwards: only the matching part of the dataset is then referenced, which
+        keeps very large (e.g. high resolution ocean) datasets quick to load.
         
         Args:
             variable_name: the target variable name to save the dataset to
             name: the dataset from the search results
+            bbox (Optional[list]): [west, south, east, north] in degrees, e.g. [-80, 0, 0, 70]
+            time_range (Optional[list]): [start, end] dates, e.g. ['1990-01', '1999-12']
+            variables (Optional[list]): names of the data variables to keep, e.g. ['tas']
         
         Returns:
             str: The dataset, or an error message
         """
-        code = agent.context.get_code("get_dataset", {'name': name, "variable_name": variable_name})
+        code = agent.context.get_code("get_dataset", {
+            'name': name,
+            "variable_name": variable_name,
+            "bbox": bbox,
+            "time_range": time_range,
+            "variables": variables,
+        })
         response = await agent.context.evaluate(code)
         return response["return"]
 
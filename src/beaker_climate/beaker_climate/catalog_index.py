@@ -0,0 +1,229 @@
+import bisect
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens of a catalog value or a keyword query."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def is_text_column(series: pd.Series) -> bool:
+    """Whether a catalog column holds strings (object, string or categorical dtype)."""
+    dtype = series.dtype
+    return (
+        dtype == object
+        or pd.api.types.is_string_dtype(dtype)
+        or isinstance(dtype, pd.CategoricalDtype)
+    )
+
+
+def group_positions(codes: np.ndarray, n_codes: int) -> List[np.ndarray]:
+    """
+    Row positions of every code, as views into a single stable argsort.
+
+    Parameters:
+    -----------
+    codes : np.ndarray
+        Integer code of each row, -1 for missing values
+    n_codes : int
+        Number of distinct codes
+
+    Returns:
+    --------
+    List[np.ndarray]
+        Sorted row positions for each code
+    """
+    dtype = np.int32 if len(codes) < np.iinfo(np.int32).max else np.int64
+    order = np.argsort(codes, kind='stable').astype(dtype, copy=False)
+    missing = int((codes < 0).sum())
+    counts = np.bincount(codes[codes >= 0], minlength=n_codes)
+    offsets = np.concatenate([[0], np.cumsum(counts)]) + missing
+    return [order[offsets[code]:offsets[code + 1]] for code in range(n_codes)]
+
+
+def union(arrays: List[np.ndarray], size: int) -> np.ndarray:
+    """Sorted union of row position arrays over a frame of `size` rows."""
+    if not arrays:
+        return np.empty(0, dtype=np.int64)
+    if len(arrays) == 1:
+        return arrays[0]
+    mask = np.zeros(size, dtype=bool)
+    for positions in arrays:
+        mask[positions] = True
+    return np.flatnonzero(mask)
+
+
+class KeywordIndex:
+    """
+    Token level inverted index over the text columns of a catalog dataframe.
+
+    Each distinct column value is tokenized once; a token points at the (column, value)
+    pairs it occurs in, and the row positions of a token are materialized from the
+    per-column value groups the first time it is looked up.
+
+    Example Usage:
+    -------------
+    >>> index = KeywordIndex(cat.df)
+    >>> rows = index.search('surface temp')  # rows with a token starting with 'surface' and one starting with 'temp'
+    >>> cat.df.iloc[rows]
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Optional[List[str]] = None):
+        self.size = len(df)
+        self.groups: Dict[str, List[np.ndarray]] = {}
+        sources: Dict[str, List[Tuple[str, int]]] = {}
+        for column in columns or [c for c in df.columns if is_text_column(df[c])]:
+            codes, uniques = pd.factorize(df[column])
+            self.groups[column] = group_positions(codes, len(uniques))
+            for code, value in enumerate(uniques):
+                for token in set(tokenize(value)):
+                    sources.setdefault(token, []).append((column, code))
+        self.sources = sources
+        self.vocabulary = sorted(sources)
+        self.postings: Dict[str, np.ndarray] = {}
+
+    def positions(self, token: str) -> np.ndarray:
+        """Sorted row positions of the rows containing `token`."""
+        positions = self.postings.get(token)
+        if positions is None:
+            positions = union(
+                [self.groups[column][code] for column, code in self.sources.get(token, [])],
+                self.size,
+            )
+            self.postings[token] = positions
+        return positions
+
+    def expand(self, term: str) -> List[str]:
+        """Indexed tokens that start with `term`."""
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = start
+        while end < len(self.vocabulary) and self.vocabulary[end].startswith(term):
+            end += 1
+        return self.vocabulary[start:end]
+
+    def match(self, term: str, prefix: bool = True) -> np.ndarray:
+        tokens = self.expand(term) if prefix else [term]
+        return union([self.positions(token) for token in tokens], self.size)
+
+    def search(self, keywords: str, prefix: bool = True) -> np.ndarray:
+        """
+        Row positions matching every term of a keyword query.
+
+        Parameters:
+        -----------
+        keywords : str
+            Free text; split into terms the same way catalog values are tokenized
+        prefix : bool
+            Match tokens starting with each term rather than only whole tokens
+
+        Returns:
+        --------
+        np.ndarray
+            Sorted row positions, usable with `df.iloc`
+        """
+        terms = tokenize(keywords)
+        if not terms:
+            return np.arange(self.size)
+        result = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            positions = self.match(term, prefix)
+            result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+
+def intersect(arrays: List[np.ndarray]) -> np.ndarray:
+    """Intersection of sorted, duplicate free row position arrays, smallest first."""
+    result = None
+    for positions in sorted(arrays, key=len):
+        result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+        if len(result) == 0:
+            break
+    return result
+
+
+class FacetIndex:
+    """
+    Per-column value -> row position index over the facet columns of a catalog dataframe.
+
+    Conjunctions of facet filters resolve by intersecting position arrays, and the value
+    counts of any set of rows come from a bincount over the stored value codes.
+
+    Example Usage:
+    -------------
+    >>> index = FacetIndex(cat.df, ['source_id', 'experiment_id', 'variable_id'])
+    >>> rows = index.select({'experiment_id': ['historical', 'ssp585'], 'variable_id': 'tas'})
+    >>> index.counts('source_id', rows)
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: List[str]):
+        self.size = len(df)
+        self.columns = [column for column in columns if column in df.columns]
+        self.codes: Dict[str, np.ndarray] = {}
+        self.uniques: Dict[str, np.ndarray] = {}
+        self.lookup: Dict[str, Dict] = {}
+        self.groups: Dict[str, List[np.ndarray]] = {}
+        for column in self.columns:
+            codes, uniques = pd.factorize(df[column])
+            uniques = np.asarray(uniques, dtype=object)
+            self.codes[column] = codes.astype(np.int32, copy=False)
+            self.uniques[column] = uniques
+            self.lookup[column] = {value: code for code, value in enumerate(uniques)}
+            self.groups[column] = group_positions(codes, len(uniques))
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.lookup
+
+    def positions(self, column: str, value) -> np.ndarray:
+        """Sorted row positions where `column` equals `value`, or any of a list of values."""
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        codes = [self.lookup[column].get(v) for v in values]
+        return union([self.groups[column][code] for code in codes if code is not None], self.size)
+
+    def select(self, filters: Dict[str, object]) -> np.ndarray:
+        """
+        Row positions matching every filter.
+
+        Parameters:
+        -----------
+        filters : dict
+            Facet column -> value or list of values
+
+        Returns:
+        --------
+        np.ndarray
+            Sorted row positions, usable with `df.iloc`
+        """
+        if not filters:
+            return np.arange(self.size)
+        return intersect([self.positions(column, value) for column, value in filters.items()])
+
+    def counts(self, column: str, positions: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Number of rows per value of `column`, among `positions` (all rows by default)."""
+        codes = self.codes[column] if positions is None else self.codes[column][positions]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.uniques[column]))
+        present = np.flatnonzero(counts)
+        return {self.uniques[column][code]: int(counts[code]) for code in present}
+
+    def matches(self, df: pd.DataFrame, positions: np.ndarray, columns: Optional[List[str]] = None) -> bool:
+        """Whether the rows at `positions` hold the values of `df`, row for row, in every column."""
+        for column in columns or self.columns:
+            codes = self.codes[column][positions]
+            missing = codes < 0
+            values = df[column].to_numpy(dtype=object)
+            if not np.array_equal(missing, pd.isna(values)):
+                return False
+            if not (self.uniques[column][codes[~missing]] == values[~missing]).all():
+                return False
+        return True
+
+    def value_at(self, column: str, position: int):
+        code = self.codes[column][position]
+        return None if code < 0 else self.uniques[column][code]
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import yaml
+
+from .catalog_snapshot import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+NESTED_CATALOG_DRIVERS = ('intake.catalog.local.YAMLFileCatalog', 'yaml_file_cat')
+
+
+def file_stamp(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def build_catalog_info(master_path: str, depth: int = 5) -> Dict[str, Any]:
+    """
+    Names, descriptions and metadata of every entry below the categories of an intake
+    master catalog, read from the YAML files alone.
+
+    Nested YAML catalogs are followed, other entries (including intake-esm collections)
+    are listed without being opened, so nothing is fetched over the network.
+
+    Parameters:
+    -----------
+    master_path : str
+        Path of the master catalog, whose sources are the categories
+    depth : int
+        How many levels of nested catalogs to follow below a category
+
+    Returns:
+    --------
+    Dict[str, Any]
+        'entries': entry name -> {'description', 'metadata', 'category'}, and
+        'files': stamps of the YAML files read, to tell when the index is stale
+    """
+    files: Dict[str, list] = {}
+    entries: Dict[str, Dict[str, Any]] = {}
+
+    def read(path: str) -> Dict[str, Any]:
+        path = os.path.abspath(path)
+        files[path] = file_stamp(path)
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+
+    def nested_path(source: Dict[str, Any], catalog_dir: str) -> Optional[str]:
+        if source.get('driver') not in NESTED_CATALOG_DRIVERS:
+            return None
+        path = str((source.get('args') or {}).get('path', ''))
+        path = path.replace('{{CATALOG_DIR}}', catalog_dir).replace('{{ CATALOG_DIR }}', catalog_dir)
+        return path if '://' not in path and os.path.exists(path) else None
+
+    def walk(path: str, category: str, level: int):
+        catalog_dir = os.path.dirname(os.path.abspath(path))
+        for name, source in (read(path).get('sources') or {}).items():
+            source = source or {}
+            entries[name] = {
+                'description': source.get('description', ''),
+                'metadata': source.get('metadata') or {},
+                'category': category,
+            }
+            child = nested_path(source, catalog_dir)
+            if child is not None and level < depth:
+                walk(child, category, level + 1)
+
+    master_dir = os.path.dirname(os.path.abspath(master_path))
+    for category, source in (read(master_path).get('sources') or {}).items():
+        path = nested_path(source or {}, master_dir)
+        if path is None:
+            logger.warning(f"Category {category} of {master_path} isn't a local YAML catalog, skipping it")
+            continue
+        walk(path, category, 1)
+    return {'version': INDEX_VERSION, 'files': files, 'entries': entries}
+
+
+def is_current(index: Dict[str, Any]) -> bool:
+    """Whether none of the YAML files an index was built from changed since."""
+    if index.get('version') != INDEX_VERSION:
+        return False
+    try:
+        return all(file_stamp(path) == stamp for path, stamp in index['files'].items())
+    except OSError:
+        return False
+
+
+def load_catalog_info(master_path: str, cache_dir: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Entry info of a master catalog, from the on-disk index while its YAML files are
+    unchanged, rebuilding the index otherwise.
+
+    Parameters:
+    -----------
+    master_path : str
+        Path of the master catalog
+    cache_dir : str, optional
+        Where the index is kept. Defaults to the pangeo cache directory
+
+    Returns:
+    --------
+    Dict[str, Dict[str, Any]]
+        Entry name -> {'description', 'metadata', 'category'}
+    """
+    master_path = os.path.abspath(str(master_path))
+    name = hashlib.sha256(master_path.encode()).hexdigest()[:16]
+    index_path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, f"catalog-info-{name}.json")
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if is_current(index):
+            return index['entries']
+        logger.info(f"Catalog files changed, rebuilding {index_path}")
+    except (OSError, ValueError):
+        pass
+
+    index = build_catalog_info(master_path)
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(f"{index_path}.tmp", 'w') as f:
+            json.dump(index, f, default=str)
+        os.replace(f"{index_path}.tmp", index_path)
+    except OSError as e:
+        logger.warning(f"Failed to save catalog index {index_path}: {e}")
+    return index['entries']
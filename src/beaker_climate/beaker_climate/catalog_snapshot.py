@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import fsspec
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get(
+    'PANGEO_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'beaker_climate', 'pangeo')
+)
+# metadata fields that change whenever a remote object does, in order of preference
+FINGERPRINT_FIELDS = ('ETag', 'etag', 'md5Hash', 'LastModified', 'last_modified', 'updated', 'mtime', 'size')
+
+
+def remote_fingerprint(url: str) -> str:
+    """
+    Cheap change marker for a local or remote file, from its ETag or modification time.
+
+    Raises whatever the filesystem raises when the file can't be reached.
+    """
+    fs, path = fsspec.core.url_to_fs(url)
+    info = fs.info(path)
+    parts = [f"{field}={info[field]}" for field in FINGERPRINT_FIELDS if info.get(field) is not None]
+    if not parts:
+        raise ValueError(f"No ETag or modification time available for {url}")
+    return ';'.join(parts)
+
+
+def read_descriptor(url: str) -> Optional[Dict[str, Any]]:
+    """The ESM collection JSON at `url`, or None if it isn't one."""
+    if not str(url).endswith('.json'):
+        return None
+    with fsspec.open(str(url), 'r') as f:
+        return json.load(f)
+
+
+def resolve_catalog_file(url: str, descriptor: Dict[str, Any]) -> Optional[str]:
+    """The CSV a collection descriptor points to, resolved relative to the descriptor."""
+    catalog_file = descriptor.get('catalog_file')
+    if catalog_file is None or '://' in catalog_file or os.path.isabs(catalog_file):
+        return catalog_file
+    return f"{str(url).rsplit('/', 1)[0]}/{catalog_file}"
+
+
+def categorize(df: pd.DataFrame, max_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    Converts string columns with few distinct values to categoricals.
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        Catalog dataframe
+    max_ratio : float
+        Columns whose distinct values exceed this fraction of the rows stay as strings
+
+    Returns:
+    --------
+    pd.DataFrame
+        The dataframe with categorical columns where they save memory
+    """
+    converted = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        if not (series.dtype == object or pd.api.types.is_string_dtype(series.dtype)):
+            continue
+        try:
+            distinct = series.nunique(dropna=True)
+        except TypeError:
+            # unhashable values, e.g. lists in columns with iterables
+            continue
+        if distinct <= max_ratio * max(len(series), 1):
+            converted[column] = series.astype('category')
+    return df.assign(**converted) if converted else df
+
+
+def remove_unused_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drops the categories no row uses from the categorical columns of a catalog subset.
+
+    Subsets keep the categories of the whole catalog, and groupby on pandas < 3 defaults to
+    observed=False, so intake-esm keys and value counts would include values with no rows.
+    """
+    converted = {
+        column: df[column].cat.remove_unused_categories()
+        for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)
+    }
+    return df.assign(**converted) if converted else df
+
+
+class CatalogSnapshot:
+    """
+    Local Parquet copy of an ESM catalog dataframe, with the collection descriptor and the
+    precomputed unique values stored next to it.
+
+    A snapshot is valid while the fingerprints of the descriptor and its catalog CSV are
+    unchanged. If they can't be checked (e.g. offline), an existing snapshot is used as is.
+    """
+
+    def __init__(self, url: str, cache_dir: Optional[str] = None):
+        self.url = str(url)
+        directory = cache_dir or DEFAULT_CACHE_DIR
+        name = hashlib.sha256(self.url.encode()).hexdigest()[:16]
+        self.data_path = os.path.join(directory, f"{name}.parquet")
+        self.meta_path = os.path.join(directory, f"{name}.json")
+
+    def fingerprint(self, descriptor: Dict[str, Any]) -> str:
+        parts = [remote_fingerprint(self.url)]
+        catalog_file = resolve_catalog_file(self.url, descriptor)
+        if catalog_file is not None:
+            parts.append(remote_fingerprint(catalog_file))
+        return '|'.join(parts)
+
+    def read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != SNAPSHOT_VERSION or not os.path.exists(self.data_path):
+            return None
+        return meta
+
+    def load(self) -> Optional[Tuple[pd.DataFrame, Dict[str, Any], Dict[str, List[str]]]]:
+        """
+        Returns the snapshot's dataframe, collection descriptor and unique values, or None
+        when there is no valid snapshot.
+        """
+        meta = self.read_meta()
+        if meta is None:
+            return None
+        try:
+            current = self.fingerprint(meta['esmcat'])
+        except Exception as e:
+            logger.warning(f"Could not check catalog {self.url} for changes, using snapshot: {e}")
+            current = meta['fingerprint']
+        if current != meta['fingerprint']:
+            logger.info(f"Catalog {self.url} changed since it was snapshotted")
+            return None
+        try:
+            df = pd.read_parquet(self.data_path)
+        except Exception as e:
+            logger.warning(f"Failed to read catalog snapshot {self.data_path}: {e}")
+            return None
+        return df, meta['esmcat'], meta['unique_values']
+
+    def save(self, df: pd.DataFrame, descriptor: Dict[str, Any], unique_values: Dict[str, List[str]]):
+        """Writes a snapshot if possible, logging why not otherwise."""
+        try:
+            fingerprint = self.fingerprint(descriptor)
+        except Exception as e:
+            logger.warning(f"Not snapshotting catalog {self.url}, its version can't be checked: {e}")
+            return
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'url': self.url,
+            'fingerprint': fingerprint,
+            'created': time.time(),
+            'esmcat': descriptor,
+            'unique_values': {key: [str(v) for v in values] for key, values in unique_values.items()},
+        }
+        tmp_paths = [f"{self.data_path}.tmp", f"{self.meta_path}.tmp"]
+        # the catalog is loaded already, failing to snapshot it only costs the next load
+        try:
+            os.makedirs(os.path.dirname(self.data_path), exist_ok=True)
+            df.to_parquet(tmp_paths[0], index=False)
+            with open(tmp_paths[1], 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_paths[0], self.data_path)
+            os.replace(tmp_paths[1], self.meta_path)
+        except Exception as e:
+            logger.warning(f"Not snapshotting catalog {self.url}: {e}")
+            for path in tmp_paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,255 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+import fsspec
+from fsspec import AbstractFileSystem
+
+from .catalog_snapshot import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = int(os.environ.get('PANGEO_CHUNK_CACHE_BYTES', str(10 * 1024 ** 3)))
+# zarr metadata is small and may change when a store is extended, so it is always fetched
+METADATA_KEYS = ('.zmetadata', '.zarray', '.zattrs', '.zgroup', 'zarr.json')
+# cache hits whose access times are buffered before they are written to the index
+ACCESS_FLUSH_EVERY = 256
+
+
+class ChunkCache:
+    """
+    On-disk LRU cache of zarr chunks, shared by every session on the machine.
+
+    Chunks are stored as files named after the hash of their full URL, with an sqlite index
+    of sizes and access times. When the cache grows past `max_bytes`, the least recently
+    used chunks are removed until it is back under 90% of the budget.
+
+    Reads stay off the disk index: access times are buffered and written every
+    `ACCESS_FLUSH_EVERY` hits, and the cache size is kept as a running total that is only
+    summed from the index (which other sessions also write to) before evicting.
+
+    Example Usage:
+    -------------
+    >>> cache = ChunkCache(max_bytes=20 * 1024 ** 3)
+    >>> ds = xr.open_dataset(cache.mapper('gs://cmip6/...', {'token': 'anon'}), engine='zarr', chunks={})
+    >>> cache.stats()
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'chunks')
+        self.max_bytes = max_bytes if max_bytes is not None else DEFAULT_MAX_BYTES
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            os.path.join(self.directory, 'index.sqlite'), timeout=30, check_same_thread=False
+        )
+        # no fsync per commit, the index is rebuilt from misses if a crash loses the tail
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS chunks_accessed ON chunks(accessed)')
+        self.connection.commit()
+        self.total = self.total_bytes()
+        self.accessed: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_hit = 0
+        self.bytes_missed = 0
+
+    def path_for(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+                self.accessed.pop(key, None)
+                self.forget(key)
+                self.connection.commit()
+            return None
+        with self.lock:
+            self.hits += 1
+            self.bytes_hit += len(data)
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= ACCESS_FLUSH_EVERY:
+                self.flush_access()
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.bytes_missed += len(data)
+            self.accessed.pop(key, None)
+            self.forget(key)
+            self.connection.execute(
+                'INSERT INTO chunks (key, size, accessed) VALUES (?, ?, ?)',
+                (key, len(data), time.time()),
+            )
+            self.total += len(data)
+            self.connection.commit()
+            if self.total > self.max_bytes:
+                self.evict()
+
+    def forget(self, key: str):
+        """Drops the index entry of a chunk, if any, from the index and the running total."""
+        row = self.connection.execute('SELECT size FROM chunks WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self.connection.execute('DELETE FROM chunks WHERE key = ?', (key,))
+            self.total -= row[0]
+
+    def flush_access(self):
+        """Writes the buffered access times to the index."""
+        if not self.accessed:
+            return
+        self.connection.executemany(
+            'UPDATE chunks SET accessed = ? WHERE key = ?',
+            [(accessed, key) for key, accessed in self.accessed.items()],
+        )
+        self.connection.commit()
+        self.accessed.clear()
+
+    def flush(self):
+        with self.lock:
+            self.flush_access()
+
+    def total_bytes(self) -> int:
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM chunks').fetchone()[0]
+
+    def evict(self):
+        """Removes least recently used chunks until the cache is under 90% of its budget."""
+        self.flush_access()
+        # other sessions share the index, so the running total is only an estimate
+        total = self.total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        target = 0.9 * self.max_bytes
+        removed = []
+        for key, size in self.connection.execute('SELECT key, size FROM chunks ORDER BY accessed'):
+            if total <= target:
+                break
+            removed.append(key)
+            total -= size
+        for key in removed:
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+        self.connection.executemany('DELETE FROM chunks WHERE key = ?', [(key,) for key in removed])
+        self.connection.commit()
+        self.total = total
+        logger.info(f"Evicted {len(removed)} chunks from {self.directory}")
+
+    def clear(self):
+        with self.lock:
+            for (key,) in self.connection.execute('SELECT key FROM chunks').fetchall():
+                try:
+                    os.remove(self.path_for(key))
+                except FileNotFoundError:
+                    pass
+            self.connection.execute('DELETE FROM chunks')
+            self.connection.commit()
+            self.accessed.clear()
+            self.total = 0
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self.lock:
+            self.flush_access()
+            entries, size = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chunks'
+            ).fetchone()
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'bytes_from_cache': self.bytes_hit,
+            'bytes_downloaded': self.bytes_missed,
+            'entries': entries,
+            'bytes_on_disk': size,
+            'max_bytes': self.max_bytes,
+        }
+
+    def mapper(self, url: str, storage_options: Optional[Dict] = None) -> fsspec.FSMap:
+        """A zarr store mapping for `url` whose chunk reads go through this cache."""
+        fs, path = fsspec.core.url_to_fs(url, **(storage_options or {}))
+        return fsspec.FSMap(path, ChunkCachingFileSystem(fs, self))
+
+
+class ChunkCachingFileSystem(AbstractFileSystem):
+    """
+    Read-only fsspec filesystem that serves whole-object reads from a ChunkCache and
+    passes everything else through to the wrapped filesystem.
+    """
+
+    cachable = False
+
+    def __init__(self, fs: AbstractFileSystem, cache: ChunkCache, **kwargs):
+        super().__init__(**kwargs)
+        self.fs = fs
+        self.cache = cache
+
+    def cacheable(self, path: str) -> bool:
+        return not path.rstrip('/').endswith(METADATA_KEYS)
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        if start is not None or end is not None or not self.cacheable(path):
+            return self.fs.cat_file(path, start=start, end=end, **kwargs)
+        key = self.fs.unstrip_protocol(path)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.fs.cat_file(path, **kwargs)
+            self.cache.put(key, data)
+        return data
+
+    def cat(self, path, recursive=False, on_error='raise', **kwargs):
+        if not isinstance(path, list):
+            return super().cat(path, recursive=recursive, on_error=on_error, **kwargs)
+        # serve what we can from the cache and fetch the rest in one batch, which
+        # async filesystems like gcsfs and s3fs download concurrently
+        results = {}
+        missing: List[str] = []
+        for p in path:
+            data = self.cache.get(self.fs.unstrip_protocol(p)) if self.cacheable(p) else None
+            if data is None:
+                missing.append(p)
+            else:
+                results[p] = data
+        if missing:
+            fetched = self.fs.cat(missing, on_error=on_error, **kwargs)
+            for p, data in fetched.items():
+                if isinstance(data, bytes) and self.cacheable(p):
+                    self.cache.put(self.fs.unstrip_protocol(p), data)
+                results[p] = data
+        return results
+
+    def info(self, path, **kwargs):
+        return self.fs.info(path, **kwargs)
+
+    def ls(self, path, detail=True, **kwargs):
+        return self.fs.ls(path, detail=detail, **kwargs)
+
+    def exists(self, path, **kwargs):
+        return self.fs.exists(path, **kwargs)
+
+    def _open(self, path, mode='rb', **kwargs):
+        if mode != 'rb':
+            raise PermissionError('The chunk cache is read-only')
+        return self.fs.open(path, mode=mode, **kwargs)
@@ -0,0 +1,192 @@
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple, Union
+
+import xarray as xr
+
+DEFAULT_TARGET_CHUNK_BYTES = 128 * 1024 ** 2
+
+
+@dataclass
+class ChunkPlan:
+    """Dask chunks chosen for a store, with what reading the whole store would cost."""
+    chunks: Dict[str, int]
+    storage_chunks: Dict[str, int]
+    sizes: Dict[str, int]
+    chunk_bytes: int
+    tasks: int
+    bytes_read: int
+    store_bytes: int
+    notes: list = field(default_factory=list)
+    offsets: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def read_amplification(self) -> float:
+        return self.bytes_read / self.store_bytes if self.store_bytes else 1.0
+
+    def report(self) -> str:
+        lines = [
+            f"dask chunks:     {self.chunks}",
+            f"storage chunks:  {self.storage_chunks}",
+            f"bytes per chunk: {self.chunk_bytes / 1024 ** 2:.1f} MiB",
+            f"graph size:      {self.tasks} chunks",
+            f"bytes read:      {self.bytes_read / 1024 ** 2:.1f} MiB "
+            f"({self.read_amplification:.2f}x the data)",
+        ]
+        return '\n'.join(lines + self.notes)
+
+    def dask_chunks(self) -> Dict[str, Union[int, Tuple[int, ...]]]:
+        """
+        Chunks to pass to `Dataset.chunk`. Dimensions of a subset that doesn't start on a
+        storage chunk boundary get a shorter first chunk, so the rest stay aligned.
+        """
+        return {
+            dim: aligned_chunks(self.sizes[dim], chunk, self.offsets[dim]) if self.offsets.get(dim) else chunk
+            for dim, chunk in self.chunks.items()
+        }
+
+
+def storage_layout(ds: xr.Dataset) -> Dict[str, int]:
+    """
+    Native chunk length of every dimension of a dataset's data variables, from the zarr
+    encoding. Unchunked dimensions count as a single chunk.
+    """
+    layout = {dim: size for var in ds.data_vars.values() for dim, size in var.sizes.items()}
+    found: Dict[str, int] = {}
+    for var in ds.data_vars.values():
+        preferred = var.encoding.get('preferred_chunks')
+        if preferred is None and var.encoding.get('chunks') is not None:
+            preferred = dict(zip(var.dims, var.encoding['chunks']))
+        for dim, size in (preferred or {}).items():
+            found[dim] = max(found.get(dim, 0), size)
+    layout.update(found)
+    return layout
+
+
+def aligned_chunks(size: int, chunk: int, offset: int = 0) -> Tuple[int, ...]:
+    """
+    Lengths of `chunk` sized pieces of a dimension selected from `offset` onwards, with
+    boundaries at multiples of `chunk` in the stored array.
+    """
+    if size == 0:
+        return (0,)
+    first = min(chunk - offset % chunk, size)
+    rest = size - first
+    return (first,) + (chunk,) * (rest // chunk) + ((rest % chunk,) if rest % chunk else ())
+
+
+def covered_length(size: int, storage: int, chunk: int, offset: int = 0) -> int:
+    """
+    Elements of storage chunks touched along one dimension when reading `size` elements
+    from `offset` onwards in `chunk` pieces. The store is assumed to end with the selection.
+    """
+    total, start, end = 0, offset, offset + size
+    for length in aligned_chunks(size, chunk, offset):
+        stop = start + length
+        first = (start // storage) * storage
+        last = min(math.ceil(stop / storage) * storage, end)
+        total += last - first
+        start = stop
+    return total
+
+
+def chunk_count(size: int, chunk: int, offset: int = 0) -> int:
+    return len(aligned_chunks(size, chunk, offset))
+
+
+def estimate(ds: xr.Dataset, chunks: Dict[str, int], storage: Dict[str, int],
+             offsets: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Graph size, bytes read and store size for reading every data variable with `chunks`.
+    `offsets` are the start positions in the store of a subset's dimensions.
+    """
+    offsets = offsets or {}
+    tasks = bytes_read = store_bytes = 0
+    for var in ds.data_vars.values():
+        itemsize = var.dtype.itemsize
+        count, covered = 1, itemsize
+        for dim, size in var.sizes.items():
+            chunk = chunks.get(dim, size)
+            chunk = size if chunk in (None, -1) else chunk
+            count *= chunk_count(size, chunk, offsets.get(dim, 0))
+            covered *= covered_length(size, storage.get(dim, size), chunk, offsets.get(dim, 0))
+        tasks += count
+        bytes_read += covered
+        store_bytes += var.size * itemsize
+    return {'tasks': tasks, 'bytes_read': bytes_read, 'store_bytes': store_bytes}
+
+
+def plan_chunks(ds: xr.Dataset,
+                target_chunk_bytes: int = DEFAULT_TARGET_CHUNK_BYTES,
+                workers: Optional[int] = None,
+                offsets: Optional[Dict[str, int]] = None) -> ChunkPlan:
+    """
+    Pick dask chunks that are whole multiples of a store's native chunks.
+
+    Starting from the storage chunks, the dimension split into the most chunks is doubled
+    until a chunk of the largest variable would exceed `target_chunk_bytes`, or there would
+    be fewer chunks than `workers` to keep busy.
+
+    Parameters:
+    -----------
+    ds : xr.Dataset
+        Dataset opened without dask chunks (`chunks=None`), so the zarr encoding is intact
+    target_chunk_bytes : int
+        Upper bound on the memory of one chunk
+    workers : int, optional
+        Number of dask workers to keep busy. Defaults to the number of CPUs
+    offsets : dict, optional
+        Start positions in the store of a subset's dimensions, see `subset.subset_dataset`
+
+    Returns:
+    --------
+    ChunkPlan
+        The chunks along with the graph size and bytes read they lead to
+    """
+    workers = workers or os.cpu_count() or 1
+    offsets = {dim: offset for dim, offset in (offsets or {}).items() if offset}
+    storage = storage_layout(ds)
+    if not ds.data_vars:
+        return ChunkPlan({}, storage, {}, 0, 0, 0, 0)
+    sizes = {dim: size for var in ds.data_vars.values() for dim, size in var.sizes.items()}
+    largest = max(ds.data_vars.values(), key=lambda var: var.size * var.dtype.itemsize)
+    itemsize = largest.dtype.itemsize
+    multiples = {dim: 1 for dim in storage}
+
+    def chunk_of(dim: str, multiple: int) -> int:
+        # chunks of an offset dimension stay whole multiples so they keep lining up
+        if dim in offsets:
+            return storage[dim] * multiple
+        return min(storage[dim] * multiple, sizes[dim])
+
+    def measure(candidate: Dict[str, int]):
+        chunk_bytes, count = itemsize, 1
+        for dim in largest.dims:
+            chunk = chunk_of(dim, candidate[dim])
+            chunk_bytes *= min(chunk, sizes[dim])
+            count *= chunk_count(sizes[dim], chunk, offsets.get(dim, 0))
+        return chunk_bytes, count
+
+    notes = []
+    chunk_bytes, count = measure(multiples)
+    if chunk_bytes > target_chunk_bytes:
+        notes.append(f"storage chunks alone are {chunk_bytes / 1024 ** 2:.1f} MiB, over the target; "
+                     "smaller dask chunks would read the same bytes repeatedly")
+    while True:
+        pieces = {dim: chunk_count(sizes[dim], chunk_of(dim, multiples[dim]), offsets.get(dim, 0))
+                  for dim in largest.dims}
+        growable = [dim for dim in largest.dims if pieces[dim] > 1]
+        if not growable:
+            break
+        dim = max(growable, key=pieces.get)
+        candidate = dict(multiples, **{dim: multiples[dim] * 2})
+        grown_bytes, grown_count = measure(candidate)
+        if grown_bytes > target_chunk_bytes or grown_count < workers:
+            break
+        multiples, chunk_bytes, count = candidate, grown_bytes, grown_count
+
+    chunks = {dim: chunk_of(dim, multiples[dim]) for dim in storage}
+    cost = estimate(ds, chunks, storage, offsets)
+    return ChunkPlan(chunks, storage, sizes, chunk_bytes, cost['tasks'], cost['bytes_read'],
+                     cost['store_bytes'], notes, offsets)
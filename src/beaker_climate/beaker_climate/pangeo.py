@@ -1,14 +1,29 @@
 import intake
 import xarray as xr
 import pandas as pd
-from typing import Dict, List, Union, Optional
+import numpy as np
+from typing import Dict, List, Tuple, Union, Optional
 import warnings
 import fsspec
 import pathlib
 import logging 
+from concurrent.futures import ThreadPoolExecutor
+
+from .catalog_index import FacetIndex, KeywordIndex, intersect
+from .chunk_cache import ChunkCache
+from .chunk_planner import DEFAULT_TARGET_CHUNK_BYTES, ChunkPlan, plan_chunks
+from .subset import BBox, TimeRange, subset_dataset
+from .catalog_snapshot import CatalogSnapshot, categorize, read_descriptor, remove_unused_categories
 
 logger = logging.getLogger(__name__)
 
+# facets every member of an ensemble must share, the others are stacked
+ENSEMBLE_SHARED_FACETS = ['experiment_id', 'table_id', 'variable_id', 'grid_label']
+
+# catalog columns with a value -> rows index for filtering and counting
+FACET_COLUMNS = ['activity_id', 'institution_id', 'source_id', 'experiment_id',
+                 'member_id', 'table_id', 'variable_id', 'grid_label']
+
 class CMIP6Catalog:
     """
     A class to handle CMIP6 data access through Pangeo's catalog.
@@ -38,7 +53,7 @@ class CMIP6Catalog:
     >>> ds = cat.get_dataset(results, model='IPSL-CM6A-LR')
     """
     
-    def __init__(self):
+    def __init__(self, catalog_url: Optional[str] = None, cache_dir: Optional[str] = None):
         """
         Initialize the CMIP6 catalog.
         
@@ -46,33 +61,88 @@ class CMIP6Catalog:
         -----------
         catalog_url : str, optional
             URL to the Pangeo CMIP6 catalog
+        cache_dir : str, optional
+            Directory for the local catalog snapshot. Defaults to $PANGEO_CACHE_DIR
+            or ~/.cache/beaker_climate/pangeo
         """
-        self.catalog_url = pathlib.Path(__file__).parent / '../catalogs/master.yaml'
+        self.catalog_url = catalog_url or pathlib.Path(__file__).parent / '../catalogs/master.yaml'
         logger.warning(self.catalog_url)
+        self._snapshot = CatalogSnapshot(self.catalog_url, cache_dir)
+        self._chunk_cache: Optional[ChunkCache] = None
         self._load_catalog()
         
-        # Configure default chunks for dask
-        self.chunks = {'time': 100, 'lat': 45, 'lon': 45}
+        # Configure default chunks for dask. None plans them per store from its native
+        # chunk layout, see plan_chunks
+        self.chunks: Optional[Dict] = None
+        self.target_chunk_bytes = DEFAULT_TARGET_CHUNK_BYTES
+        self.workers: Optional[int] = None
+        self.last_chunk_plan: Optional[ChunkPlan] = None
         
     def _load_catalog(self):
-        """Load the catalog and store basic information."""
+        """
+        Load the catalog and store basic information.
+        
+        A local Parquet snapshot with categorical columns is used while the remote catalog
+        is unchanged; otherwise the catalog is downloaded and a new snapshot written.
+        """
         try:
-            self.cat = intake.open_esm_datastore(self.catalog_url)
-            self._cache_unique_values()
+            snapshot = self._snapshot.load()
+            if snapshot is not None:
+                df, descriptor, self.unique_values = snapshot
+                self.cat = intake.open_esm_datastore({'esmcat': descriptor, 'df': df})
+            else:
+                descriptor = read_descriptor(self.catalog_url)
+                self.cat = intake.open_esm_datastore(self.catalog_url)
+                if descriptor is not None:
+                    # rebuild around a categorical copy of the dataframe to save memory
+                    df = categorize(self.cat.df)
+                    self.cat = intake.open_esm_datastore({'esmcat': descriptor, 'df': df})
+                self._cache_unique_values()
+                if descriptor is not None:
+                    self._snapshot.save(self.cat.df, descriptor, self.unique_values)
+            # built on first use, so loading stays cheap
+            self._keyword_index = None
+            self._facet_index = None
         except Exception as e:
             raise ConnectionError(f"Failed to load catalog: {str(e)}")
             
     def _cache_unique_values(self):
         """Cache unique values for quick access to available options."""
         self.unique_values = {
-            'activity_id': sorted(self.cat.df['activity_id'].unique()),
-            'experiment_id': sorted(self.cat.df['experiment_id'].unique()),
-            'variable_id': sorted(self.cat.df['variable_id'].unique()),
-            'source_id': sorted(self.cat.df['source_id'].unique()),
-            'table_id': sorted(self.cat.df['table_id'].unique()),
-            'grid_label': sorted(self.cat.df['grid_label'].unique())
+            column: sorted(self.cat.df[column].dropna().unique().tolist())
+            for column in ['activity_id', 'experiment_id', 'variable_id',
+                           'source_id', 'table_id', 'grid_label']
         }
         
+    def _get_keyword_index(self) -> KeywordIndex:
+        if self._keyword_index is None:
+            self._keyword_index = KeywordIndex(self.cat.df)
+        return self._keyword_index
+
+    def _get_facet_index(self) -> FacetIndex:
+        if self._facet_index is None:
+            self._facet_index = FacetIndex(self.cat.df, FACET_COLUMNS)
+        return self._facet_index
+
+    def _catalog_positions(self, search_results: pd.DataFrame,
+                           columns: List[str]) -> Optional[np.ndarray]:
+        """
+        Row positions of search results in the catalog, or None if they aren't catalog rows.
+        
+        Results are matched by index label, which only finds the right rows while the frame
+        keeps the catalog's index (not after reset_index or concat), so the facet values
+        at those rows are checked against the frame's own `columns`.
+        """
+        catalog_index = self.cat.df.index
+        if not catalog_index.is_unique:
+            return None
+        positions = catalog_index.get_indexer(search_results.index)
+        if (positions < 0).any():
+            return None
+        if not self._get_facet_index().matches(search_results, positions, columns):
+            return None
+        return positions
+
     def get_available_values(self, attribute: str) -> List[str]:
         """
         Get available values for a specific attribute.
@@ -98,7 +168,8 @@ class CMIP6Catalog:
         Parameters:
         -----------
         keywords : str, optional
-            Free-text search across all fields
+            Free-text search across all text fields. Every word must prefix-match
+            a word of some field, case-insensitively
         **kwargs : dict
             Specific search parameters (e.g., variable_id='tas', experiment_id='historical')
             Valid keys include: 'activity_id', 'experiment_id', 'variable_id', 
@@ -114,19 +185,23 @@ class CMIP6Catalog:
         >>> results = search(keywords='temperature', variable_id='tas')
         >>> results = search(experiment_id='historical', table_id='Amon')
         """
-        # Start with the full catalog
-        df = self.cat.df.copy()
-        
-        # Apply keyword search if provided
+        # Resolve keywords and facet filters to row positions through the indexes
+        facet_index = self._get_facet_index()
+        candidates = []
         if keywords:
-            mask = pd.Series(False, index=df.index)
-            for col in df.columns:
-                if df[col].dtype == object:  # Only search string columns
-                    mask |= df[col].astype(str).str.contains(keywords, case=False, na=False)
-            df = df[mask]
+            candidates.append(self._get_keyword_index().search(keywords))
+        facet_filters = {key: value for key, value in kwargs.items() if key in facet_index}
+        if facet_filters:
+            candidates.append(facet_index.select(facet_filters))
         
-        # Apply specific filters
+        df = self.cat.df
+        if candidates:
+            df = df.iloc[intersect(candidates)]
+        
+        # Apply the remaining filters on the reduced frame
         for key, value in kwargs.items():
+            if key in facet_filters:
+                continue
             if key not in df.columns:
                 warnings.warn(f"Invalid search key: {key}. Ignoring this parameter.")
                 continue
@@ -135,13 +210,43 @@ class CMIP6Catalog:
             else:
                 df = df[df[key] == value]
         
-        return df
+        if df is self.cat.df:
+            # never hand out the catalog's own frame
+            return df.copy(deep=False)
+        return remove_unused_categories(df)
+
+    def facet_counts(self, search_results: pd.DataFrame,
+                     columns: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Count the datasets per facet value among search results.
+        
+        Parameters:
+        -----------
+        search_results : pd.DataFrame
+            Results from the search method
+        columns : list, optional
+            Facet columns to count. Default is every indexed facet column
+        
+        Returns:
+        --------
+        Dict[str, Dict[str, int]]
+            Facet column -> value -> number of datasets
+        """
+        facet_index = self._get_facet_index()
+        columns = columns or facet_index.columns
+        positions = self._catalog_positions(search_results, columns)
+        if positions is None:
+            return {column: search_results[column].value_counts().to_dict() for column in columns}
+        return {column: facet_index.counts(column, positions) for column in columns}
 
     def get_dataset(self, search_results: pd.DataFrame, 
                     source_id: Optional[str] = None,
                     member_id: Optional[str] = None,
                     chunks: Optional[Dict] = None,
                     preprocess: Optional[callable] = None,
+                    bbox: Optional[BBox] = None,
+                    time_range: Optional[TimeRange] = None,
+                    variables: Optional[List[str]] = None,
                     **kwargs) -> xr.Dataset:
         """
         Get an xarray dataset from search results with improved cloud access.
@@ -155,9 +260,16 @@ class CMIP6Catalog:
         member_id : str, optional
             Specific ensemble member to load (e.g., 'r1i1p1f1')
         chunks : dict, optional
-            Chunk sizes for dask arrays. Default is {'time': 100, 'lat': 45, 'lon': 45}
+            Chunk sizes for dask arrays. By default they are planned from the store's
+            native chunks, see plan_chunks
         preprocess : callable, optional
             Function to apply to dataset before returning
+        bbox : tuple, optional
+            Only load (west, south, east, north), in degrees
+        time_range : tuple, optional
+            Only load times between (start, end), e.g. ('1990-01', '1999-12')
+        variables : list, optional
+            Only load these data variables
         **kwargs : dict
             Additional parameters passed to xarray.open_dataset()
         
@@ -175,20 +287,11 @@ class CMIP6Catalog:
         ...     ds['tas'] = ds['tas'] - 273.15  # Convert to Celsius
         ...     return ds
         >>> ds = get_dataset(results, source_id='IPSL-CM6A-LR', preprocess=preprocess)
+        >>> # Only the North Atlantic in the 1990s
+        >>> ds = get_dataset(results, source_id='IPSL-CM6A-LR', bbox=(-80, 0, 0, 70),
+        ...                  time_range=('1990', '1999'))
         """
-        # Make a copy to avoid modifying the original
-        filtered_results = search_results.copy()
-        
-        # Filter by source_id (model) if specified
-        if source_id:
-            filtered_results = filtered_results[filtered_results['source_id'] == source_id]
-        
-        # Filter by member_id if specified
-        if member_id:
-            filtered_results = filtered_results[filtered_results['member_id'] == member_id]
-        
-        if len(filtered_results) == 0:
-            raise ValueError("No datasets match the specified criteria")
+        filtered_results = self._filter_results(search_results, source_id, member_id)
         
         if len(filtered_results) > 1:
             available_models = filtered_results['source_id'].unique()
@@ -196,35 +299,217 @@ class CMIP6Catalog:
             warnings.warn(f"Multiple datasets found ({len(filtered_results)}).\n"
                         f"Available models: {available_models.tolist()}\n"
                         f"Available members: {available_members.tolist()}\n"
-                        "Loading the first one.")
+                        "Loading the first one. Use get_ensemble to load all of them.")
         
         # Get the first matching dataset
         row = filtered_results.iloc[0]
+        ds, self.last_chunk_plan = self._open_row(row, chunks, preprocess, bbox, time_range, variables, **kwargs)
+        return ds
+
+    def get_ensemble(self, search_results: pd.DataFrame,
+                     source_id: Optional[str] = None,
+                     member_id: Optional[str] = None,
+                     chunks: Optional[Dict] = None,
+                     preprocess: Optional[callable] = None,
+                     max_workers: int = 16,
+                     model_join: str = 'exact',
+                     bbox: Optional[BBox] = None,
+                     time_range: Optional[TimeRange] = None,
+                     variables: Optional[List[str]] = None,
+                     **kwargs) -> xr.Dataset:
+        """
+        Open every matching dataset concurrently and stack them into one lazy ensemble.
+        
+        Stores are opened from their consolidated metadata by up to `max_workers` threads,
+        so opening many members takes about as long as opening one. Members of a model are
+        stacked along `member_id`, and models along `source_id`. The results must share
+        experiment_id, table_id, variable_id and grid_label, and hold each member once.
+        
+        Parameters:
+        -----------
+        search_results : pd.DataFrame
+            Results from the search method
+        source_id : str, optional
+            Only load this model
+        member_id : str, optional
+            Only load this ensemble member
+        chunks : dict, optional
+            Chunk sizes for dask arrays. Default is the catalog's chunks, planned per store when unset
+        preprocess : callable, optional
+            Function applied to each dataset before stacking
+        max_workers : int
+            Maximum number of stores opened at the same time
+        model_join : str
+            How coordinates of different models are aligned when stacking along
+            `source_id` (see `xarray.concat`). 'exact' requires models to share a grid
+        bbox, time_range, variables : optional
+            Subset of every member to load, see get_dataset
+        **kwargs : dict
+            Additional parameters passed to xarray.open_dataset()
+        
+        Returns:
+        --------
+        xr.Dataset
+            Dataset with `source_id` and `member_id` dimensions
+        
+        Example:
+        --------
+        >>> results = search(variable_id='tas', experiment_id='historical', source_id='CESM2')
+        >>> ensemble = get_ensemble(results)
+        >>> ensemble['tas'].mean('member_id')
+        """
+        filtered_results = self._filter_results(search_results, source_id, member_id)
+        self._check_ensemble(filtered_results)
+        rows = [row for _, row in filtered_results.iterrows()]
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(rows)))) as executor:
+            opened = list(executor.map(
+                lambda row: self._open_row(row, chunks, preprocess, bbox, time_range, variables, **kwargs), rows
+            ))
+        datasets = [ds for ds, _ in opened]
+        # the plan of the first row in result order, not of whichever store opened last
+        self.last_chunk_plan = opened[0][1]
         
+        by_model: Dict[str, List] = {}
+        for row, ds in zip(rows, datasets):
+            ds = ds.expand_dims(member_id=[row['member_id']])
+            by_model.setdefault(row['source_id'], []).append(ds)
+        
+        # compat/coords settings keep xarray from loading data to compare variables
+        concat_options = {'coords': 'minimal', 'compat': 'override', 'combine_attrs': 'drop_conflicts'}
+        models = []
+        for model, members in by_model.items():
+            stacked = members[0] if len(members) == 1 else xr.concat(
+                members, dim='member_id', join='outer', **concat_options
+            )
+            models.append(stacked.expand_dims(source_id=[model]))
+        try:
+            ensemble = models[0] if len(models) == 1 else xr.concat(
+                models, dim='source_id', join=model_join, **concat_options
+            )
+        except ValueError as e:
+            raise ValueError(f"Models {list(by_model)} can't be stacked with model_join='{model_join}': {e}\n"
+                             "Load one source_id at a time, regrid them to a common grid, "
+                             "or pass model_join='outer'.")
+        return ensemble
+
+    def plan_chunks(self, search_results: pd.DataFrame,
+                    source_id: Optional[str] = None,
+                    member_id: Optional[str] = None,
+                    target_chunk_bytes: Optional[int] = None,
+                    workers: Optional[int] = None) -> ChunkPlan:
+        """
+        Plan dask chunks for a dataset from its native zarr chunk layout.
+        
+        Chunks are whole multiples of the storage chunks, so no stored chunk is read more
+        than once, grown until one chunk reaches the memory target while leaving at least
+        one chunk per worker.
+        
+        Parameters:
+        -----------
+        search_results : pd.DataFrame
+            Results from the search method, the first match is planned
+        source_id : str, optional
+            Specific model to plan for
+        member_id : str, optional
+            Specific ensemble member to plan for
+        target_chunk_bytes : int, optional
+            Memory per chunk. Default is the catalog's target_chunk_bytes (128 MiB)
+        workers : int, optional
+            Number of dask workers. Default is the number of CPUs
+        
+        Returns:
+        --------
+        ChunkPlan
+            Chunks plus the graph size and estimated bytes read; `report()` summarizes them
+        
+        Example:
+        --------
+        >>> plan = plan_chunks(results, source_id='CESM2', target_chunk_bytes=64 * 1024 ** 2)
+        >>> print(plan.report())
+        >>> ds = get_dataset(results, source_id='CESM2', chunks=plan.chunks)
+        """
+        row = self._filter_results(search_results, source_id, member_id).iloc[0]
+        url = row.get('zstore', row.get('path'))
+        ds = self._open_zarr(url, None)
+        return plan_chunks(ds, target_chunk_bytes or self.target_chunk_bytes, workers or self.workers)
+
+    def _filter_results(self, search_results: pd.DataFrame,
+                        source_id: Optional[str] = None,
+                        member_id: Optional[str] = None) -> pd.DataFrame:
+        """Narrow search results to a model and member, failing if nothing is left."""
+        filtered_results = search_results
+        
+        # Filter by source_id (model) if specified
+        if source_id:
+            filtered_results = filtered_results[filtered_results['source_id'] == source_id]
+        
+        # Filter by member_id if specified
+        if member_id:
+            filtered_results = filtered_results[filtered_results['member_id'] == member_id]
+        
+        if len(filtered_results) == 0:
+            raise ValueError("No datasets match the specified criteria")
+        return filtered_results
+
+    def _check_ensemble(self, rows: pd.DataFrame):
+        """
+        Fail unless the rows differ only by source_id and member_id, once each, so that
+        stacking them neither mixes experiments or tables nor repeats a member.
+        """
+        shared = [column for column in ENSEMBLE_SHARED_FACETS if column in rows.columns]
+        if shared:
+            combinations = rows[shared].drop_duplicates()
+            if len(combinations) > 1:
+                listed = '\n'.join(f"  {dict(zip(shared, values))}"
+                                    for values in combinations.astype(str).itertuples(index=False))
+                raise ValueError(f"Results span {len(combinations)} combinations of {shared}:\n{listed}\n"
+                                 "Narrow the search (or pass source_id/member_id) to one of them "
+                                 "before loading an ensemble.")
+        repeated = rows[rows.duplicated(['source_id', 'member_id'], keep=False)]
+        if len(repeated):
+            pairs = sorted(set(zip(repeated['source_id'].astype(str), repeated['member_id'].astype(str))))
+            raise ValueError(f"Results hold more than one dataset for (source_id, member_id) {pairs}. "
+                             "Narrow the search so every member appears once.")
+
+    def _open_row(self, row: pd.Series,
+                  chunks: Optional[Dict] = None,
+                  preprocess: Optional[callable] = None,
+                  bbox: Optional[BBox] = None,
+                  time_range: Optional[TimeRange] = None,
+                  variables: Optional[List[str]] = None,
+                  **kwargs) -> Tuple[xr.Dataset, Optional[ChunkPlan]]:
+        """
+        Open the zarr store of one catalog row, subset before any dask chunks are made.
+        Returns the dataset and the chunk plan it was chunked to, None for explicit chunks.
+        """
+        # Use the zstore URL if available, otherwise fall back to regular URL
+        url = row.get('zstore', row.get('path'))
         try:
-            # Set up cloud access options
-            storage_options = {
-                'token': 'anon',  # For anonymous access
-                'default_fill_cache': False,  # Avoid caching issues
-                'default_cache_type': 'none'
-            }
-            
-            # Use the zstore URL if available, otherwise fall back to regular URL
-            url = row.get('zstore', row.get('path'))
             if url is None:
                 raise ValueError("No valid URL found in catalog entry")
             
             # Set up chunking
             chunk_dict = chunks if chunks is not None else self.chunks
+            plan = None
             
             # Open the dataset with proper settings for cloud access
-            ds = xr.open_dataset(
-                url,
-                engine='zarr',
-                chunks=chunk_dict,
-                backend_kwargs={'storage_options': storage_options},
-                **kwargs
-            )
+            subsetting = bbox is not None or time_range is not None or bool(variables)
+            if chunk_dict is None or subsetting:
+                # open lazily without dask so the subset only references the chunks it
+                # intersects and the storage layout can be read, then chunk
+                ds = self._open_zarr(url, None, **kwargs)
+                offsets = {}
+                if subsetting:
+                    ds, offsets = subset_dataset(ds, bbox, time_range, variables)
+                if chunk_dict is None:
+                    plan = plan_chunks(ds, self.target_chunk_bytes, self.workers, offsets)
+                    logger.info(f"Chunk plan for {url}:\n{plan.report()}")
+                    ds = ds.chunk(plan.dask_chunks())
+                else:
+                    ds = ds.chunk(chunk_dict)
+            else:
+                ds = self._open_zarr(url, chunk_dict, **kwargs)
             
             # Apply preprocessing if provided
             if preprocess is not None:
@@ -239,12 +524,70 @@ class CMIP6Catalog:
                 'grid_label': row['grid_label']
             })
             
-            return ds
+            return ds, plan
             
         except Exception as e:
             raise RuntimeError(f"Failed to load dataset: {str(e)}\n"
                              f"URL attempted: {url}")
 
+    def enable_chunk_cache(self, max_bytes: Optional[int] = None,
+                           cache_dir: Optional[str] = None) -> ChunkCache:
+        """
+        Keep downloaded chunks on local disk, shared across sessions, so re-reading data
+        doesn't download it again. Applies to datasets opened after this call.
+        
+        Parameters:
+        -----------
+        max_bytes : int, optional
+            Disk budget, least recently used chunks are evicted beyond it.
+            Defaults to $PANGEO_CHUNK_CACHE_BYTES or 10 GiB
+        cache_dir : str, optional
+            Where chunks are stored. Defaults to the `chunks` folder of the catalog cache
+        
+        Returns:
+        --------
+        ChunkCache
+            The cache, whose `stats()` reports hits, misses and bytes saved
+        """
+        self._chunk_cache = ChunkCache(cache_dir, max_bytes)
+        return self._chunk_cache
+
+    def disable_chunk_cache(self):
+        """Read chunks directly from cloud storage again."""
+        self._chunk_cache = None
+
+    def chunk_cache_stats(self) -> Dict:
+        """Hit/miss statistics of the chunk cache, empty when it isn't enabled."""
+        return self._chunk_cache.stats() if self._chunk_cache is not None else {}
+
+    def _storage_options(self) -> Dict:
+        """fsspec options for reading catalog stores."""
+        return {
+            'token': 'anon',  # For anonymous access
+            'default_fill_cache': False,  # Avoid caching issues
+            'default_cache_type': 'none'
+        }
+
+    def _open_zarr(self, url: str, chunks: Optional[Dict], **kwargs) -> xr.Dataset:
+        """
+        Open a zarr store from its consolidated metadata, which takes one request instead
+        of one per array. Stores without it are opened the slow way.
+        """
+        if self._chunk_cache is not None:
+            store = self._chunk_cache.mapper(url, self._storage_options())
+            backend_kwargs = {'consolidated': True}
+        else:
+            store = url
+            backend_kwargs = {'storage_options': self._storage_options(), 'consolidated': True}
+        try:
+            return xr.open_dataset(store, engine='zarr', chunks=chunks,
+                                   backend_kwargs=backend_kwargs, **kwargs)
+        except (KeyError, FileNotFoundError, ValueError):
+            # zarr 2 raises KeyError or FileNotFoundError when .zmetadata is missing, zarr 3 ValueError
+            backend_kwargs['consolidated'] = False
+            return xr.open_dataset(store, engine='zarr', chunks=chunks,
+                                   backend_kwargs=backend_kwargs, **kwargs)
+
     def summarize_results(self, search_results: pd.DataFrame) -> Dict:
         """
         Summarize search results with counts of models, experiments, etc.
@@ -259,13 +602,14 @@ class CMIP6Catalog:
         Dict
             Summary statistics of the search results
         """
+        counts = self.facet_counts(search_results, ['source_id', 'experiment_id', 'variable_id'])
         summary = {
             'total_datasets': len(search_results),
-            'unique_models': search_results['source_id'].nunique(),
-            'unique_experiments': search_results['experiment_id'].nunique(),
-            'models': search_results['source_id'].unique().tolist(),
-            'experiments': search_results['experiment_id'].unique().tolist(),
-            'variables': search_results['variable_id'].unique().tolist()
+            'unique_models': len(counts['source_id']),
+            'unique_experiments': len(counts['experiment_id']),
+            'models': list(counts['source_id']),
+            'experiments': list(counts['experiment_id']),
+            'variables': list(counts['variable_id'])
         }
         return summary
 
@@ -283,16 +627,17 @@ class CMIP6Catalog:
         Dict
             Detailed information about the model
         """
-        model_data = self.cat.df[self.cat.df['source_id'] == model]
-        if len(model_data) == 0:
+        facet_index = self._get_facet_index()
+        positions = facet_index.positions('source_id', model)
+        if len(positions) == 0:
             raise ValueError(f"Model {model} not found in catalog")
         
         details = {
-            'institution': model_data['institution_id'].iloc[0],
-            'experiments': model_data['experiment_id'].unique().tolist(),
-            'variables': model_data['variable_id'].unique().tolist(),
-            'grid_labels': model_data['grid_label'].unique().tolist(),
-            'ensemble_members': model_data['member_id'].unique().tolist(),
-            'total_datasets': len(model_data)
+            'institution': facet_index.value_at('institution_id', positions[0]),
+            'experiments': list(facet_index.counts('experiment_id', positions)),
+            'variables': list(facet_index.counts('variable_id', positions)),
+            'grid_labels': list(facet_index.counts('grid_label', positions)),
+            'ensemble_members': list(facet_index.counts('member_id', positions)),
+            'total_datasets': len(positions)
         }
         return details
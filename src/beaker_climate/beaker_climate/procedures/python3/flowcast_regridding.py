@@ -1,6 +1,7 @@
 import numpy as np
 import xarray as xr
 from flowcast.regrid import regrid_1d, RegridType
+from beaker_climate.beaker_climate.regrid_weights import apply_weights, shared_cache
 import io
 
 
@@ -69,9 +70,16 @@ def regrid_dataset(dataset, target_resolution: tuple):
         return regridded
 
     method = RegridType.{{aggregation}}
-    regridded_dataset = xr.Dataset({
-        feature: regrid_2d_latlon(dataset, feature, method) for feature in data_nobounds
-    })
+
+    # Linear aggregations reuse sparse weights computed once per source grid, target grid
+    # and aggregation for all features; the others are regridded feature by feature
+    weights = shared_cache().get(dataset.lat.values, dataset.lon.values, lats, lons, method)
+    if weights is not None:
+        regridded_dataset = apply_weights(dataset[data_nobounds], weights, lats, lons)
+    else:
+        regridded_dataset = xr.Dataset({
+            feature: regrid_2d_latlon(dataset, feature, method) for feature in data_nobounds
+        })
 
     # Persist attributes after regridding.
     # Copy attributes from source variables
@@ -0,0 +1,6 @@
+try:
+    __pangeo_info
+except NameError:
+    from beaker_climate.beaker_climate.catalog_info import load_catalog_info
+    __pangeo_info = load_catalog_info(__pangeo_url)
+__pangeo_info
@@ -1,9 +1,16 @@
+from beaker_climate.beaker_climate.subset import open_intake_source
+
 try: 
-    {{variable_name}} = __last_results['{{name}}'].to_dask()
+    {{variable_name}} = open_intake_source(
+        __last_results['{{name}}'],
+        bbox={{bbox}},
+        time_range={{time_range}},
+        variables={{variables}},
+    )
 except Exception as e:
     try:
-        {{variable_name}} = """
-            Failed to load dataset {{name}}. 
+        {{variable_name}} = f"""
+            Failed to load dataset {{name}}: {e}
             Here were the last search results, consider loading one of these.
             
         """ + f"{__last_results}"
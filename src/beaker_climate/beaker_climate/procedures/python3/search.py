@@ -1,2 +1,5 @@
+from beaker_climate.beaker_climate.result_handle import ResultHandle
+
 __last_results = {{catalog}}.search(**{{ keywords }})
-__last_results.keys()
+__last_results_handle = ResultHandle(__last_results)
+__last_results_handle.summary(limit={{ limit }})
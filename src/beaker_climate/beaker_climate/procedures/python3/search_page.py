@@ -0,0 +1,5 @@
+try:
+    __page = __last_results_handle.page(offset={{ offset }}, limit={{ limit }}, columns={{ columns }})
+except NameError:
+    __page = "No search was performed before using this. Go and use the search tool."
+__page
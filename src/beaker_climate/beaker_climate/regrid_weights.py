@@ -0,0 +1,267 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+import xarray as xr
+from flowcast.regrid import (
+    BinOffset,
+    RegridType,
+    compute_overlap,
+    get_bins,
+    get_interp_or_mean_overlaps,
+    is_resolution_increase,
+)
+
+from .catalog_snapshot import DEFAULT_CACHE_DIR
+from .chunk_cache import ChunkCache
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_VERSION = 2
+DEFAULT_MAX_BYTES = int(os.environ.get('PANGEO_REGRID_CACHE_BYTES', str(2 * 1024 ** 3)))
+
+
+def axis_weights(old_coords: np.ndarray, new_coords: np.ndarray,
+                 aggregation: RegridType) -> Optional[Tuple[sp.csr_matrix, np.ndarray]]:
+    """
+    Sparse (new x old) weights of flowcast's `regrid_1d` along one axis, and the new cells
+    no old cell contributes to. None when the aggregation isn't linear along this axis, or
+    when the weights can't reproduce `regrid_1d` and it should be used instead.
+    """
+    old_bins, old_deltas = get_bins(old_coords, BinOffset.left)
+    new_bins, _ = get_bins(new_coords, BinOffset.left)
+    overlaps = compute_overlap(old_bins, new_bins)
+    overlaps /= np.abs(old_deltas[:, None])
+
+    if aggregation == RegridType.interp_or_mean:
+        overlaps = get_interp_or_mean_overlaps(overlaps, old_coords, new_coords)
+    elif aggregation == RegridType.nearest_or_mode:
+        # nearest neighbor selects one cell, the mode of a coarser cell isn't linear
+        if not is_resolution_increase(overlaps):
+            return None
+        distances = np.abs(old_coords[:, None] - new_coords[None, :])
+        # get_nearest_or_mode_overlaps drops an old cell whose coordinate coincides with the
+        # new one, since its distance is 0, which no selection of one cell reproduces
+        if (distances == 0).any():
+            return None
+        # select the closest old cell as get_nearest_or_mode_overlaps does (argsort breaks
+        # ties the same way)
+        nearest = np.argsort(distances, axis=0)[0]
+        overlaps = np.zeros_like(overlaps)
+        overlaps[nearest, np.arange(len(new_coords))] = 1
+    elif aggregation not in (RegridType.mean, RegridType.conserve):
+        return None
+
+    totals = overlaps.sum(axis=0)
+    empty = totals == 0
+    if aggregation != RegridType.conserve:
+        overlaps = overlaps / np.where(empty, 1, totals)
+    return sp.csr_matrix(overlaps.T), empty
+
+
+@dataclass
+class RegridWeights:
+    """
+    Flowcast lat/lon regridding from one grid to another as a single sparse matrix over
+    flattened (lat, lon) cells, equivalent to `regrid_1d` along lat and then lon.
+
+    `matrix` maps source cells to target cells, `support` marks which source cells feed
+    each target cell, and `empty` holds the target cells that are NaN regardless of data.
+    Weights are kept in float64 and data is regridded in its own float precision.
+    """
+    matrix: sp.csr_matrix
+    support: sp.csr_matrix
+    empty: np.ndarray
+    shape: Tuple[int, int]
+    # matrix and support cast to the float types data has been regridded in
+    cast: Dict[np.dtype, Tuple[sp.csr_matrix, sp.csr_matrix]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+    @classmethod
+    def build(cls, old_lat: np.ndarray, old_lon: np.ndarray,
+              new_lat: np.ndarray, new_lon: np.ndarray,
+              aggregation: RegridType) -> Optional['RegridWeights']:
+        lat = axis_weights(old_lat, new_lat, aggregation)
+        lon = axis_weights(old_lon, new_lon, aggregation)
+        if lat is None or lon is None:
+            return None
+        (lat_matrix, lat_empty), (lon_matrix, lon_empty) = lat, lon
+        matrix = sp.kron(lat_matrix, lon_matrix, format='csr')
+        support = sp.kron(lat_matrix != 0, lon_matrix != 0, format='csr').astype(np.float64)
+        if aggregation == RegridType.conserve:
+            # sums over no cells are 0 rather than NaN
+            empty = np.zeros(matrix.shape[0], dtype=bool)
+        else:
+            empty = (lat_empty[:, None] | lon_empty[None, :]).ravel()
+        return cls(matrix, support, empty, (len(new_lat), len(new_lon)))
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+            matrix_shape=np.array(self.matrix.shape), empty=self.empty, shape=np.array(self.shape),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'RegridWeights':
+        arrays = np.load(io.BytesIO(data))
+        matrix = sp.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['matrix_shape'])
+        )
+        support = (matrix != 0).astype(np.float64)
+        return cls(matrix, support, arrays['empty'], tuple(int(n) for n in arrays['shape']))
+
+    def weights_for(self, dtype: np.dtype) -> Tuple[sp.csr_matrix, sp.csr_matrix]:
+        """Matrix and support in the float type `dtype`, so products stay in that type."""
+        if dtype == self.matrix.dtype:
+            return self.matrix, self.support
+        if dtype not in self.cast:
+            self.cast[dtype] = (self.matrix.astype(dtype), self.support.astype(dtype))
+        return self.cast[dtype]
+
+    def apply(self, data: np.ndarray) -> np.ndarray:
+        """
+        Regrid an array whose last two dimensions are (lat, lon), all leading ones at once.
+        The result has the float type of the data, float64 for integer data.
+        """
+        dtype = result_dtype(data.dtype)
+        matrix, support = self.weights_for(dtype)
+        leading = data.shape[:-2]
+        flat = data.reshape(-1, data.shape[-2] * data.shape[-1])
+        valid = ~np.isnan(flat) if np.issubdtype(flat.dtype, np.floating) else np.ones(flat.shape, dtype=bool)
+        # cells along the rows, so the sparse product reads the values in memory order
+        values = np.ascontiguousarray(np.where(valid, flat, 0).astype(dtype, copy=False).T)
+        result = np.asarray(matrix @ values)
+        if not valid.all():
+            reached = np.asarray(support @ np.ascontiguousarray(valid.T, dtype=dtype))
+            result[reached == 0] = np.nan
+        result[self.empty] = np.nan
+        return np.ascontiguousarray(result.T).reshape(leading + self.shape)
+
+
+def result_dtype(dtype: np.dtype) -> np.dtype:
+    """float32 and float64 data is regridded as is, anything else as float64."""
+    dtype = np.dtype(dtype)
+    return dtype if dtype in (np.float32, np.float64) else np.dtype(np.float64)
+
+
+def grid_key(old_lat: np.ndarray, old_lon: np.ndarray,
+             new_lat: np.ndarray, new_lon: np.ndarray,
+             aggregation: RegridType) -> str:
+    digest = hashlib.sha256(f"v{WEIGHTS_VERSION}:{aggregation.name}".encode())
+    for coords in (old_lat, old_lon, new_lat, new_lon):
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        digest.update(str(coords.shape).encode())
+        digest.update(coords.tobytes())
+    return f"regrid-weights:{digest.hexdigest()}"
+
+
+class RegridWeightCache:
+    """
+    Regrid weights by (source grid, target grid, aggregation), kept in memory for the most
+    recently used grids and in an on-disk LRU cache shared across sessions.
+
+    Example Usage:
+    -------------
+    >>> cache = RegridWeightCache()
+    >>> weights = cache.get(ds.lat.values, ds.lon.values, lats, lons, RegridType.mean)
+    >>> regridded = apply_weights(ds, weights, lats, lons)
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None,
+                 max_in_memory: int = 8):
+        self.disk = ChunkCache(
+            cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'regrid'),
+            max_bytes if max_bytes is not None else DEFAULT_MAX_BYTES,
+        )
+        self.memory: 'OrderedDict[str, Optional[RegridWeights]]' = OrderedDict()
+        self.max_in_memory = max_in_memory
+        self.lock = threading.Lock()
+
+    def get(self, old_lat: np.ndarray, old_lon: np.ndarray,
+            new_lat: np.ndarray, new_lon: np.ndarray,
+            aggregation: RegridType) -> Optional[RegridWeights]:
+        """Weights for regridding between two grids, or None if the aggregation isn't linear."""
+        key = grid_key(old_lat, old_lon, new_lat, new_lon, aggregation)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+
+        weights = None
+        data = self.disk.get(key)
+        if data is not None:
+            try:
+                weights = RegridWeights.from_bytes(data)
+            except Exception as e:
+                logger.warning(f"Discarding unreadable regrid weights {key}: {e}")
+        if weights is None:
+            weights = RegridWeights.build(old_lat, old_lon, new_lat, new_lon, aggregation)
+            if weights is not None:
+                self.disk.put(key, weights.to_bytes())
+
+        with self.lock:
+            self.memory[key] = weights
+            while len(self.memory) > self.max_in_memory:
+                self.memory.popitem(last=False)
+        return weights
+
+
+_shared_cache: Optional[RegridWeightCache] = None
+
+
+def shared_cache() -> RegridWeightCache:
+    """The weight cache shared by every regrid of this process."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = RegridWeightCache()
+    return _shared_cache
+
+
+def apply_weights(ds: xr.Dataset, weights: RegridWeights,
+                  lats: np.ndarray, lons: np.ndarray) -> xr.Dataset:
+    """
+    Regrid every (lat, lon) variable of a dataset with precomputed weights.
+
+    Variables with the same dimensions and dtype are stacked and regridded by one sparse
+    matrix product; dask backed variables stay lazy and are regridded block by block.
+    """
+    # stacking promotes to a common dtype, so only variables of the same dtype are stacked
+    groups: Dict[Tuple[Tuple[str, ...], np.dtype], List[str]] = {}
+    for name, var in ds.data_vars.items():
+        if 'lat' not in var.dims or 'lon' not in var.dims:
+            raise ValueError(f"Variable {name} has no lat/lon dimensions to regrid")
+        groups.setdefault((var.dims, var.dtype), []).append(name)
+
+    # coordinates along lat/lon besides lat/lon themselves don't exist on the new grid
+    stale = [name for name, coord in ds.coords.items()
+             if name not in ('lat', 'lon') and {'lat', 'lon'} & set(coord.dims)]
+    ds = ds.drop_vars(stale)
+
+    regridded = []
+    for (dims, _), names in groups.items():
+        stacked = ds[names].to_array('variable').transpose(..., 'lat', 'lon')
+        if stacked.chunks is not None:
+            stacked = stacked.chunk({'lat': -1, 'lon': -1})
+        result = xr.apply_ufunc(
+            weights.apply, stacked,
+            input_core_dims=[['lat', 'lon']],
+            output_core_dims=[['lat', 'lon']],
+            exclude_dims={'lat', 'lon'},
+            dask='parallelized',
+            output_dtypes=[result_dtype(stacked.dtype)],
+            dask_gufunc_kwargs={'output_sizes': {'lat': len(lats), 'lon': len(lons)}},
+        )
+        result = result.assign_coords(lat=lats, lon=lons).to_dataset('variable')
+        regridded.append(result.transpose(*dims))
+    return xr.merge(regridded)
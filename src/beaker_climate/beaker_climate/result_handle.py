@@ -0,0 +1,117 @@
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+DEFAULT_PAGE_SIZE = 25
+DEFAULT_TOP_VALUES = 10
+
+
+class ResultHandle:
+    """
+    Keeps catalog search results in the kernel and hands them out a page at a time.
+
+    Works with intake-esm search results, where every key is a dataset made of the rows
+    sharing the collection's `groupby_attrs`, and with plain intake catalogs, whose keys
+    are their entries. Only the requested page, projected to the requested columns, and
+    a per-facet count of the top values ever leave the kernel.
+
+    Example Usage:
+    -------------
+    >>> results = catalog.search(variable_id='tas')
+    >>> handle = ResultHandle(results)
+    >>> handle.summary()                                  # total, first page and facet counts
+    >>> handle.page(offset=25, columns=['source_id', 'member_id'])
+    >>> results[handle.page()['keys'][0]].to_dask()
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.datasets = self.dataset_rows(results)
+        if self.datasets is None:
+            self.keys: List[str] = list(results)
+        else:
+            self.keys = self.datasets.index.tolist()
+
+    @staticmethod
+    def dataset_rows(results) -> Optional[pd.DataFrame]:
+        """First row of every dataset in intake-esm results, indexed by dataset key."""
+        df = getattr(results, 'df', None)
+        esmcat = getattr(results, 'esmcat', None)
+        aggregation_control = getattr(esmcat, 'aggregation_control', None)
+        groupby = list(getattr(aggregation_control, 'groupby_attrs', None) or [])
+        if df is None or not groupby:
+            return None
+        sep = getattr(results, 'sep', '.')
+        rows = df.drop_duplicates(subset=groupby)
+        keys = rows[groupby[0]].astype(str)
+        for column in groupby[1:]:
+            keys = keys + sep + rows[column].astype(str)
+        return rows.set_index(keys).sort_index()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def page(self, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE,
+             columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        One page of result keys, optionally with the values of some columns per key.
+
+        Parameters:
+        -----------
+        offset : int
+            Position of the first key to return
+        limit : int
+            Maximum number of keys to return
+        columns : list, optional
+            Catalog columns to return for each key (intake-esm results only)
+
+        Returns:
+        --------
+        Dict[str, Any]
+            'total', 'offset', 'keys', 'next_offset' (None on the last page) and, when
+            columns are given, 'rows' mapping each key to its column values
+        """
+        offset = max(int(offset), 0)
+        keys = self.keys[offset:offset + int(limit)]
+        end = offset + len(keys)
+        page: Dict[str, Any] = {
+            'total': len(self.keys),
+            'offset': offset,
+            'keys': keys,
+            'next_offset': end if end < len(self.keys) else None,
+        }
+        if columns:
+            if self.datasets is None:
+                page['rows'] = {key: {'description': self.results[key].description} for key in keys}
+            else:
+                present = [column for column in columns if column in self.datasets.columns]
+                rows = self.datasets.loc[keys, present].astype(str)
+                page['rows'] = rows.to_dict(orient='index')
+        return page
+
+    def facet_counts(self, columns: Optional[List[str]] = None,
+                     top: int = DEFAULT_TOP_VALUES) -> Dict[str, Dict[str, int]]:
+        """
+        Number of datasets per value of each facet, limited to the `top` most common values.
+        The remaining values of a facet are counted together under '...'.
+        """
+        if self.datasets is None:
+            return {}
+        if columns is None:
+            groupby = self.results.esmcat.aggregation_control.groupby_attrs
+            columns = [column for column in groupby if self.datasets[column].nunique() > 1]
+        counts = {}
+        for column in columns:
+            if column not in self.datasets.columns:
+                continue
+            values = self.datasets[column].astype(str).value_counts()
+            counts[column] = {value: int(count) for value, count in values.head(top).items()}
+            if len(values) > top:
+                counts[column]['...'] = int(values.iloc[top:].sum())
+        return counts
+
+    def summary(self, limit: int = DEFAULT_PAGE_SIZE, top: int = DEFAULT_TOP_VALUES) -> Dict[str, Any]:
+        """The first page of keys along with facet counts over all results."""
+        summary = self.page(0, limit)
+        summary['facets'] = self.facet_counts(top=top)
+        return summary
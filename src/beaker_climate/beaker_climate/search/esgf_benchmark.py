@@ -0,0 +1,370 @@
+"""
+reproducible benchmarks of the ESGF search provider, run against a local stand-in for the
+index nodes (see `esgf_standin`) so results don't depend on production mirror load.
+
+scenarios cover facet loading, keyword search, natural language search with a stubbed
+LLM, replica fan-out and mirror failover. every run starts from empty caches, and the
+numbers can be written to json and compared against an earlier run:
+
+    python -m beaker_climate.beaker_climate.search.esgf_benchmark --json after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from .esgf_search import ESGFProvider, MirrorHealthRegistry, default_settings
+from .esgf_standin import ESGFStandIn, MirrorBehavior, build_synthetic_index
+
+MIRRORS = ("primary", "secondary", "tertiary")
+
+KEYWORD_QUERIES = [
+    "tas CESM2",
+    "pr historical",
+    "ssp585 Amon ua",
+    "MIROC6 piControl",
+    "psl day",
+]
+
+# natural language queries and the search terms the stubbed LLM answers with. the first
+# translates to the same lucene query as a keyword search of the raw text.
+NL_QUERIES = [
+    ("tas CESM2", {"variable_id": "tas", "source_id": "CESM2"}),
+    (
+        "monthly precipitation from the historical runs of GFDL",
+        {"variable_id": ["pr"], "experiment_id": "historical", "source_id": "GFDL-ESM4", "frequency": "mon"},
+    ),
+    (
+        "sea surface temperature under the high emission scenario",
+        {"variable_id": ["tos"], "experiment_id": "ssp585"},
+    ),
+    (
+        "eastward and northward wind in IPSL pre-industrial control",
+        {"variable_id": ["ua", "va"], "source_id": "IPSL-CM6A-LR", "experiment_id": "piControl"},
+    ),
+]
+
+
+class StubAgent:
+    """
+    stands in for the LLM: waits `latency` seconds and answers with canned search terms.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def __call__(self, prompt: str, query: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        for text, search_terms in NL_QUERIES:
+            if query.endswith(text):
+                return json.dumps(search_terms)
+        return "{}"
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    # runs one iteration, given the provider and the iteration number
+    run: Callable[["BenchmarkContext", int], Awaitable[Any]]
+    settings: dict[str, Any] = field(default_factory=dict)
+    mirrors: dict[str, MirrorBehavior] = field(default_factory=dict)
+    prepare: Optional[Callable[["BenchmarkContext"], Awaitable[Any]]] = None
+    # start every iteration with a new provider, so nothing learned carries over
+    fresh_provider: bool = False
+
+
+@dataclass
+class BenchmarkContext:
+    provider: ESGFProvider
+    dataset_ids: list[str]
+
+
+async def fetch_facets(context: BenchmarkContext, i: int):
+    await context.provider.get_facet_possiblities()
+
+
+async def load_facets(context: BenchmarkContext, i: int):
+    context.provider.load_cached_facets(None)
+
+
+async def keyword_search(context: BenchmarkContext, i: int):
+    await context.provider.keyword_search(KEYWORD_QUERIES[i % len(KEYWORD_QUERIES)], 1)
+
+
+async def natural_language_search(context: BenchmarkContext, i: int):
+    response = await context.provider.natural_language_search(NL_QUERIES[i % len(NL_QUERIES)][0], 1)
+    if "error" in response:
+        raise Exception(response["error"])
+
+
+async def facet_value_search(context: BenchmarkContext, i: int):
+    # the one query made of facet values, so the only one speculation can answer
+    response = await context.provider.natural_language_search(NL_QUERIES[0][0], 1)
+    if "error" in response:
+        raise Exception(response["error"])
+
+
+async def fetch_dataset(context: BenchmarkContext, i: int):
+    await context.provider.tool_fetch(context.dataset_ids[i % len(context.dataset_ids)])
+
+
+async def fetch_many_datasets(context: BenchmarkContext, i: int):
+    start = (i * 10) % len(context.dataset_ids)
+    await context.provider.tool_fetch_many(context.dataset_ids[start : start + 10])
+
+
+async def warm_facets(context: BenchmarkContext):
+    await context.provider.ensure_facet_possibilities()
+
+
+def build_scenarios(latency: float) -> list[Scenario]:
+    dead = MirrorBehavior(dead=True)
+    slow = MirrorBehavior(latency=max(1.0, latency * 20))
+    return [
+        Scenario("facets.fetch", "facet table from the index node", fetch_facets),
+        Scenario("facets.load", "facet table from the on-disk cache", load_facets, prepare=warm_facets),
+        Scenario("keyword", "keyword search, no query cache", keyword_search),
+        Scenario(
+            "nl.sequential",
+            "natural language search, LLM then ESGF",
+            natural_language_search,
+            settings={"speculative_search": False},
+            prepare=warm_facets,
+        ),
+        Scenario(
+            "nl.facets.speculative",
+            "natural language search of facet values, keyword search alongside the LLM",
+            facet_value_search,
+            settings={"speculative_search": True},
+            prepare=warm_facets,
+            # the same query every run, so translations must not carry over
+            fresh_provider=True,
+        ),
+        Scenario(
+            "nl.facets.sequential",
+            "natural language search of facet values, LLM then ESGF",
+            facet_value_search,
+            settings={"speculative_search": False},
+            prepare=warm_facets,
+            # the same query every run, so translations must not carry over
+            fresh_provider=True,
+        ),
+        Scenario("fanout.fetch", "tool_fetch of one dataset and all its replicas", fetch_dataset),
+        Scenario("fanout.fetch_many", "tool_fetch_many of ten datasets", fetch_many_datasets),
+        Scenario(
+            "failover.dead.hedged",
+            "keyword search with the primary mirror dead, hedging on",
+            keyword_search,
+            mirrors={"primary": dead},
+            fresh_provider=True,
+        ),
+        Scenario(
+            "failover.dead.sequential",
+            "keyword search with the primary mirror dead, hedging off",
+            keyword_search,
+            settings={"hedge_delay": ""},
+            mirrors={"primary": dead},
+            fresh_provider=True,
+        ),
+        Scenario(
+            "failover.slow.hedged",
+            "keyword search with a slow primary mirror, hedging after 4x the normal latency",
+            keyword_search,
+            settings={"hedge_delay": str(max(0.05, latency * 4))},
+            mirrors={"primary": slow},
+            fresh_provider=True,
+        ),
+        Scenario(
+            "failover.slow.sequential",
+            "keyword search with a slow primary mirror, hedging off",
+            keyword_search,
+            settings={"hedge_delay": ""},
+            mirrors={"primary": slow},
+            fresh_provider=True,
+        ),
+    ]
+
+
+@contextlib.contextmanager
+def overridden_settings(**values):
+    previous = {name: getattr(default_settings, name) for name in values}
+    for name, value in values.items():
+        setattr(default_settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(default_settings, name, value)
+
+
+@contextlib.contextmanager
+def overridden_mirrors(standin: ESGFStandIn, mirrors: dict[str, MirrorBehavior]):
+    previous = dict(standin.mirrors)
+    standin.mirrors.update(mirrors)
+    try:
+        yield
+    finally:
+        standin.mirrors.clear()
+        standin.mirrors.update(previous)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Benchmark:
+    def __init__(self, standin: ESGFStandIn, llm_latency: float, repeat: int, warmup: int, verbose: bool):
+        self.standin = standin
+        self.llm_latency = llm_latency
+        self.repeat = repeat
+        self.warmup = warmup
+        self.verbose = verbose
+        self.dataset_ids = [
+            document["id"]
+            for document in standin.index.search("", limit=max(50, repeat * 10), count=False)[0]
+        ]
+
+    def new_provider(self) -> ESGFProvider:
+        return ESGFProvider(
+            StubAgent(self.llm_latency),
+            health=MirrorHealthRegistry(None),
+        )
+
+    async def run(self, scenario: Scenario) -> dict[str, Any]:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            settings = {
+                "esgf_url": self.standin.url_for(MIRRORS[0]),
+                "esgf_fallbacks": ",".join(self.standin.url_for(mirror) for mirror in MIRRORS[1:]),
+                "cache_dir": cache_dir,
+                "local_index_path": os.path.join(cache_dir, "no_local_index.sqlite"),
+                "query_cache_enabled": False,
+                "translation_cache_enabled": False,
+                "facet_auto_refresh": False,
+                "facet_seed_file": None,
+            } | scenario.settings
+            with overridden_settings(**settings), overridden_mirrors(self.standin, scenario.mirrors):
+                output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+                with output:
+                    return await self.measure(scenario)
+
+    async def measure(self, scenario: Scenario) -> dict[str, Any]:
+        context = None
+        timings, requests, failures = [], [], 0
+        try:
+            for i in range(self.warmup + self.repeat):
+                if context is None or scenario.fresh_provider:
+                    if context is not None:
+                        await context.provider.aclose()
+                    context = BenchmarkContext(self.new_provider(), self.dataset_ids)
+                    if scenario.prepare is not None:
+                        await scenario.prepare(context)
+                self.standin.reset_counters()
+                start = time.perf_counter()
+                try:
+                    await scenario.run(context, i)
+                except Exception:
+                    if i >= self.warmup:
+                        failures += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                if i >= self.warmup:
+                    timings.append(elapsed * 1000)
+                    requests.append(self.standin.total_requests())
+        finally:
+            if context is not None:
+                await context.provider.aclose()
+        result = {
+            "name": scenario.name,
+            "description": scenario.description,
+            "runs": len(timings),
+            "failures": failures,
+            # latencies are of successful runs only, a failed scenario has none
+            "failed": not timings,
+        }
+        if timings:
+            result |= {
+                "median_ms": round(statistics.median(timings), 2),
+                "p95_ms": round(percentile(timings, 0.95), 2),
+                "min_ms": round(min(timings), 2),
+                "max_ms": round(max(timings), 2),
+                "requests_per_run": round(statistics.mean(requests), 2),
+            }
+        return result
+
+
+def report(results: list[dict[str, Any]], baseline: Optional[dict[str, dict[str, Any]]] = None):
+    header = f"{'scenario':<28}{'median ms':>12}{'p95 ms':>12}{'requests':>10}{'failures':>10}"
+    if baseline:
+        header += f"{'vs baseline':>14}"
+    print(header)
+    for result in results:
+        if result["failed"]:
+            print(f"{result['name']:<28}{'failed':>12}{'':>12}{'':>10}{result['failures']:>10}")
+            continue
+        line = (
+            f"{result['name']:<28}{result['median_ms']:>12.2f}{result['p95_ms']:>12.2f}"
+            f"{result['requests_per_run']:>10.1f}{result['failures']:>10}"
+        )
+        previous = (baseline or {}).get(result["name"])
+        if previous and previous.get("median_ms"):
+            change = (result["median_ms"] - previous["median_ms"]) / previous["median_ms"]
+            line += f"{change:>+14.1%}"
+        print(line)
+
+
+async def run_benchmarks(args: argparse.Namespace) -> list[dict[str, Any]]:
+    index = build_synthetic_index(":memory:", datasets=args.datasets, replicas=args.replicas, seed=args.seed)
+    behavior = {mirror: MirrorBehavior(latency=args.latency, jitter=args.jitter) for mirror in MIRRORS}
+    with ESGFStandIn(behavior, index=index, seed=args.seed) as standin:
+        benchmark = Benchmark(standin, args.llm_latency, args.repeat, args.warmup, args.verbose)
+        results = []
+        for scenario in build_scenarios(args.latency):
+            if args.only and not any(scenario.name.startswith(prefix) for prefix in args.only.split(",")):
+                continue
+            results.append(await benchmark.run(scenario))
+            print(f"finished {scenario.name}", flush=True)
+    index.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark ESGF search against a local stand-in")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds each stand-in mirror takes to answer")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the stubbed LLM takes to answer")
+    parser.add_argument("--datasets", type=int, default=2000)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma separated scenario name prefixes to run")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the provider's own logging")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result["name"]: result for result in json.load(f)["results"]}
+    report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
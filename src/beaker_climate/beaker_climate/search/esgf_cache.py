@@ -0,0 +1,462 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+
+def read_compact_json(path: str) -> Any:
+    """
+    reads a json document, transparently handling gzip compression.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    return json.loads(raw)
+
+
+def write_compact_json(path: str, document: Any):
+    """
+    atomically writes a json document as gzip with no whitespace.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(document, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+class FacetCache:
+    """
+    on-disk copy of the CMIP6 facet table used to build natural language prompts.
+
+    stored as gzipped json alongside the time it was fetched. entries older than `ttl`
+    seconds are still served but reported as stale so the caller can refresh them.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.fetched_at: Optional[float] = None
+
+    @staticmethod
+    def parse(document: dict[str, Any]) -> tuple[dict[str, list[str]], Optional[float]]:
+        """
+        accepts either a cache file or a raw ESGF solr facet response and returns the facet table.
+        """
+        if "facets" in document:
+            return document["facets"], document.get("fetched_at")
+        facet_fields = document["facet_counts"]["facet_fields"]
+        return {facet: terms[0::2] for facet, terms in facet_fields.items()}, None
+
+    def load(self) -> Optional[dict[str, list[str]]]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            facets, self.fetched_at = self.parse(read_compact_json(self.path))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"ignoring unreadable facet cache {self.path}: {e}", flush=True)
+            return None
+        return facets
+
+    def seed(self, seed_path: str) -> dict[str, list[str]]:
+        """
+        loads a facet table exported from another deployment (or a saved solr facet response)
+        and stores it as the cache, so no network call is needed to search.
+        """
+        facets, fetched_at = self.parse(read_compact_json(seed_path))
+        if fetched_at is None:
+            fetched_at = os.path.getmtime(seed_path)
+        self.save(facets, fetched_at)
+        return facets
+
+    def save(self, facets: dict[str, list[str]], fetched_at: Optional[float] = None):
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        try:
+            write_compact_json(self.path, {"fetched_at": self.fetched_at, "facets": facets})
+        except OSError as e:
+            print(f"failed to persist facet cache to {self.path}: {e}", flush=True)
+
+    def is_stale(self) -> bool:
+        return self.fetched_at is None or time.time() - self.fetched_at > self.ttl
+
+
+def split_top_level(query: str, operator: str) -> list[str]:
+    """
+    splits a lucene query on an operator, ignoring occurrences inside parentheses or quotes.
+    """
+    parts, depth, in_quotes, start, i = [], 0, False, 0, 0
+    separator = f" {operator} "
+    while i < len(query):
+        char = query[i]
+        if char == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes and char == "(":
+            depth += 1
+        elif not in_quotes and char == ")":
+            depth -= 1
+        elif not in_quotes and depth == 0 and query.startswith(separator, i):
+            parts.append(query[start:i])
+            i += len(separator)
+            start = i
+            continue
+        i += 1
+    parts.append(query[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def is_single_group(query: str) -> bool:
+    """
+    true if the whole query is wrapped in one pair of matching parentheses.
+    """
+    if not (query.startswith("(") and query.endswith(")")):
+        return False
+    depth = 0
+    for i, char in enumerate(query):
+        depth += char == "("
+        depth -= char == ")"
+        if depth == 0 and i < len(query) - 1:
+            return False
+    return True
+
+
+def canonicalize_lucene_query(query: str) -> str:
+    """
+    normalizes whitespace and the order of terms in conjunctions and disjunctions so that
+    equivalent queries such as `tas AND (a OR b)` and `(b OR a)  AND tas` share a cache key.
+    """
+    query = re.sub(r"\s+", " ", query).strip()
+    or_parts = split_top_level(query, "OR")
+    and_parts = split_top_level(query, "AND")
+    if len(or_parts) > 1 and len(and_parts) > 1:
+        # mixed operators at the same level depend on precedence, leave the order alone
+        return query
+    operator, parts = ("OR", or_parts) if len(or_parts) > 1 else ("AND", and_parts)
+    if len(parts) > 1:
+        return f" {operator} ".join(sorted(set(canonicalize_lucene_query(part) for part in parts)))
+    if is_single_group(query):
+        inner = canonicalize_lucene_query(query[1:-1])
+        if len(split_top_level(inner, "OR")) == 1 and len(split_top_level(inner, "AND")) == 1:
+            # a group around a single term is the term itself
+            return inner
+        return f"({inner})"
+    return query
+
+
+class QueryCache:
+    """
+    two tier cache for ESGF responses: an in-memory LRU in front of a directory of gzipped
+    json entries that is trimmed to `max_disk_bytes`, oldest access first.
+
+    every entry carries its own expiry so that searches over `latest=true` data can expire
+    sooner than listings of a fixed dataset version.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str],
+        max_memory_entries: int = 256,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.directory = directory
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        self.disk_usage: Optional[int] = None
+
+    @staticmethod
+    def key_for(kind: str, **parts: Any) -> str:
+        return json.dumps({"kind": kind, **parts}, sort_keys=True, separators=(",", ":"))
+
+    def _entry_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json.gz")
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        cached = self.memory.get(key)
+        if cached is not None:
+            expires_at, value = cached
+            if expires_at > now:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return value
+            del self.memory[key]
+            self.counters["expired"] += 1
+        if self.directory is not None:
+            path = self._entry_path(key)
+            try:
+                entry = read_compact_json(path)
+            except FileNotFoundError:
+                entry = None
+            except (OSError, ValueError) as e:
+                print(f"dropping unreadable cache entry {path}: {e}", flush=True)
+                self._remove(path)
+                entry = None
+            if entry is not None and entry.get("key") == key:
+                if entry["expires_at"] > now:
+                    try:
+                        # refreshes the entry's position in the eviction order
+                        os.utime(path)
+                    except OSError:
+                        pass
+                    self._remember(key, entry["expires_at"], entry["value"])
+                    self.counters["disk_hits"] += 1
+                    return entry["value"]
+                self._remove(path)
+                self.counters["expired"] += 1
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, value: Any, ttl: float):
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, value)
+        if self.directory is None:
+            return
+        path = self._entry_path(key)
+        try:
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            write_compact_json(path, {"key": key, "expires_at": expires_at, "value": value})
+            self._account(os.path.getsize(path) - previous_size)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"failed to write cache entry {path}: {e}", flush=True)
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        self._account(-size)
+
+    def _scan(self) -> list[os.DirEntry]:
+        try:
+            return [e for e in os.scandir(self.directory) if e.name.endswith(".json.gz")]
+        except FileNotFoundError:
+            return []
+
+    def _account(self, delta: int):
+        if self.disk_usage is None:
+            self.disk_usage = sum(entry.stat().st_size for entry in self._scan())
+        else:
+            self.disk_usage += delta
+        if self.disk_usage > self.max_disk_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        removes least recently used entries from disk until usage is under 90% of the budget.
+        """
+        entries = sorted(self._scan(), key=lambda entry: entry.stat().st_mtime)
+        usage = sum(entry.stat().st_size for entry in entries)
+        target = self.max_disk_bytes * 0.9
+        for entry in entries:
+            if usage <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            usage -= size
+            self.counters["evictions"] += 1
+        self.disk_usage = usage
+
+    def clear(self):
+        self.memory.clear()
+        for entry in self._scan() if self.directory is not None else []:
+            self._remove(entry.path)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        return {
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_bytes": self.disk_usage,
+        }
+
+
+class SingleFlight:
+    """
+    coalesces concurrent calls that share a key: the first caller (the leader) starts the work
+    and every caller that arrives while it is in flight awaits the same result. the shared call
+    is only cancelled once all of its callers have gone away, and a call that ends cancelled
+    raises CancelledError in its leader only, the others start over.
+    """
+
+    def __init__(self):
+        self.calls: dict[str, asyncio.Future] = {}
+        self.waiters: dict[asyncio.Future, int] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        call = self.calls.get(key)
+        leader = call is None or call.cancelled()
+        if leader:
+            call = asyncio.ensure_future(func())
+            self.calls[key] = call
+            call.add_done_callback(lambda done: self.finished(key, done))
+        else:
+            self.coalesced += 1
+        self.waiters[call] = self.waiters.get(call, 0) + 1
+        try:
+            return await asyncio.shield(call)
+        except asyncio.CancelledError:
+            # a follower whose shared call was cancelled under it wasn't cancelled itself
+            if leader or not call.cancelled():
+                raise
+        finally:
+            self.waiters[call] -= 1
+            if self.waiters[call] == 0:
+                del self.waiters[call]
+                if not call.done():
+                    call.cancel()
+            if leader or call.done() or call not in self.waiters:
+                # nobody may join a call that is over or being cancelled
+                self.forget(key, call)
+        return await self.do(key, func)
+
+    def forget(self, key: str, call: asyncio.Future):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def finished(self, key: str, call: asyncio.Future):
+        self.forget(key, call)
+        if not call.cancelled():
+            # retrieve the outcome so a call abandoned by its waiters isn't reported as unhandled
+            call.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": len(self.calls), "coalesced": self.coalesced}
+
+
+def vocabulary_fingerprint(facets: dict[str, list[str]]) -> str:
+    """
+    short stable hash of a facet table, used to invalidate anything derived from it.
+    """
+    encoded = json.dumps(facets, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+# filler words of a request. prepositions and conjunctions are kept, they carry meaning in
+# queries like "ocean to atmosphere flux"
+STOPWORDS = frozenset(
+    "a an the please find search show me get give i want need looking dataset datasets data".split()
+)
+
+
+def normalize_natural_language_query(query: str) -> str:
+    """
+    reduces a natural language query to its meaningful lowercase tokens, in order, so that
+    rewordings like "find CESM2 historical tas" and "cesm2, historical, tas" share a key.
+    """
+    tokens = re.findall(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*", query.lower())
+    return " ".join(token for token in tokens if token not in STOPWORDS)
+
+
+class TranslationCache:
+    """
+    persisted map of normalized natural language queries to the search terms the LLM produced
+    for them. entries are tagged with the fingerprint of the facet vocabulary that was in the
+    prompt and are ignored once the vocabulary changes.
+
+    new entries are appended to a journal next to the cache file, which is folded into the
+    cache file every `compact_every` entries and when the cache is loaded.
+    """
+
+    def __init__(self, path: Optional[str], max_entries: int = 5000, compact_every: int = 100):
+        self.path = path
+        self.journal_path = f"{path}.journal" if path is not None else None
+        self.max_entries = max_entries
+        self.compact_every = compact_every
+        self.journaled = 0
+        self.entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0}
+        self.load()
+
+    def load(self):
+        if self.path is None:
+            return
+        if os.path.exists(self.path):
+            try:
+                self.entries.update(read_compact_json(self.path))
+            except (OSError, ValueError) as e:
+                print(f"ignoring unreadable translation cache {self.path}: {e}", flush=True)
+        if os.path.exists(self.journal_path):
+            try:
+                with open(self.journal_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # a write cut short by a crash
+                            continue
+                        self.insert(record["key"], record["vocabulary"], record["search_terms"])
+            except (OSError, KeyError) as e:
+                print(f"ignoring unreadable translation journal {self.journal_path}: {e}", flush=True)
+            self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            write_compact_json(self.path, self.entries)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self.journaled = 0
+        except OSError as e:
+            print(f"failed to persist translation cache to {self.path}: {e}", flush=True)
+
+    def contains(self, query: str, vocabulary: str) -> bool:
+        entry = self.entries.get(normalize_natural_language_query(query))
+        return entry is not None and entry["vocabulary"] == vocabulary
+
+    def get(self, query: str, vocabulary: str) -> Optional[dict[str, Any]]:
+        entry = self.entries.get(normalize_natural_language_query(query))
+        if entry is None or entry["vocabulary"] != vocabulary:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        return entry["search_terms"]
+
+    def insert(self, key: str, vocabulary: str, search_terms: dict[str, Any]):
+        self.entries[key] = {"vocabulary": vocabulary, "search_terms": search_terms}
+        self.entries.move_to_end(key)
+        # drop entries made under an older vocabulary first, then the oldest ones
+        stale = [k for k, entry in self.entries.items() if entry["vocabulary"] != vocabulary]
+        for k in stale:
+            del self.entries[k]
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def put(self, query: str, vocabulary: str, search_terms: dict[str, Any]):
+        key = normalize_natural_language_query(query)
+        self.insert(key, vocabulary, search_terms)
+        if self.path is None:
+            return
+        record = {"key": key, "vocabulary": vocabulary, "search_terms": search_terms}
+        try:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.journaled += 1
+        except (OSError, TypeError, ValueError) as e:
+            print(f"failed to journal translation to {self.journal_path}: {e}", flush=True)
+        if self.journaled >= self.compact_every:
+            self.save()
+
+    def stats(self) -> dict[str, Any]:
+        return {**self.counters, "entries": len(self.entries)}
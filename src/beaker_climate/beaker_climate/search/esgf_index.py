@@ -0,0 +1,459 @@
+"""
+local mirror of CMIP6 dataset-level metadata from ESGF, kept in sqlite.
+
+facet values live in a (facet, value, dataset) table so that conjunctions of facet filters
+and facet counts are answered from an index, and free text terms go through an FTS5 table
+when sqlite was built with it. the subset of lucene that the search provider generates
+(terms, field:value, wildcards, AND / OR / NOT and parentheses) is translated to sql.
+
+harvest the index with:
+
+    python -m beaker_climate.beaker_climate.search.esgf_index [--full]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Any, Optional
+
+from .esgf_records import DATASET_FIELDS, single_value
+
+FACET_FIELDS = (
+    "mip_era",
+    "activity_id",
+    "institution_id",
+    "source_id",
+    "experiment_id",
+    "member_id",
+    "variant_label",
+    "table_id",
+    "variable_id",
+    "grid_label",
+    "frequency",
+    "nominal_resolution",
+    "realm",
+    "variable_long_name",
+    "data_node",
+)
+ID_FIELDS = {"id": "id", "instance_id": "instance_id", "master_id": "master_id", "dataset_id": "id"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    instance_id TEXT,
+    master_id TEXT,
+    version TEXT,
+    timestamp TEXT,
+    latest INTEGER NOT NULL DEFAULT 1,
+    text TEXT NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS datasets_master ON datasets(master_id, version);
+CREATE TABLE IF NOT EXISTS facet_values (
+    dataset INTEGER NOT NULL,
+    facet TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS facet_lookup ON facet_values(facet, value, dataset);
+CREATE INDEX IF NOT EXISTS facet_dataset ON facet_values(dataset);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class UnsupportedQuery(ValueError):
+    """
+    the query uses lucene features the local index can't answer, so it has to go to ESGF.
+    """
+
+
+def tokenize_query(query: str) -> list[str]:
+    return re.findall(r'\(|\)|"[^"]*"|[^\s()]+', query)
+
+
+def glob_pattern(value: str) -> str:
+    """
+    sqlite GLOB pattern for a lucene wildcard term. GLOB is case sensitive like solr's string
+    fields, `*` is the only wildcard kept and `?` and `[` match themselves.
+    """
+    return re.sub(r"[?\[]", lambda match: f"[{match.group()}]", value)
+
+
+def like_pattern(value: str) -> str:
+    """
+    sqlite LIKE pattern, for use with ESCAPE '\\', where `*` is the only wildcard.
+    """
+    return re.sub(r"[\\%_]", lambda match: f"\\{match.group()}", value).replace("*", "%")
+
+
+class QueryCompiler:
+    """
+    recursive descent translation of a lucene subset into a sql boolean expression over `d`,
+    the datasets table.
+    """
+
+    def __init__(self, query: str, full_text: bool):
+        self.tokens = tokenize_query(query)
+        self.position = 0
+        self.full_text = full_text
+        self.params: list[Any] = []
+        # set inside `field:(...)` groups, which apply the field to every bare term
+        self.default_field: Optional[str] = None
+
+    def compile(self) -> tuple[str, list[Any]]:
+        if not self.tokens:
+            return "1", []
+        sql = self.parse_or()
+        if self.position != len(self.tokens):
+            raise UnsupportedQuery(f"unexpected token {self.tokens[self.position]!r}")
+        return sql, self.params
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise UnsupportedQuery("query ended unexpectedly")
+        self.position += 1
+        return token
+
+    def parse_or(self) -> str:
+        clauses = [self.parse_and()]
+        while self.peek() == "OR":
+            self.take()
+            clauses.append(self.parse_and())
+        return clauses[0] if len(clauses) == 1 else "(" + " OR ".join(clauses) + ")"
+
+    def parse_and(self) -> str:
+        clauses = [self.parse_unary()]
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            clauses.append(self.parse_unary())
+        return clauses[0] if len(clauses) == 1 else "(" + " AND ".join(clauses) + ")"
+
+    def parse_unary(self) -> str:
+        token = self.take()
+        if token == "NOT":
+            return f"NOT {self.parse_unary()}"
+        if token == "(":
+            clause = self.parse_or()
+            if self.take() != ")":
+                raise UnsupportedQuery("unbalanced parentheses")
+            return clause
+        if token in ("AND", "OR", ")"):
+            raise UnsupportedQuery(f"unexpected operator {token!r}")
+        if token.endswith(":") and not token.startswith('"') and self.peek() == "(":
+            self.take()
+            outer, self.default_field = self.default_field, token[:-1]
+            clause = self.parse_or()
+            if self.take() != ")":
+                raise UnsupportedQuery("unbalanced parentheses")
+            self.default_field = outer
+            return clause
+        return self.term(token)
+
+    def term(self, token: str) -> str:
+        field, value = self.default_field, token
+        if ":" in token and not token.startswith('"'):
+            field, value = token.split(":", 1)
+        value = value.strip('"')
+        if field is None:
+            return self.text_term(value)
+        if field in ID_FIELDS:
+            column = ID_FIELDS[field]
+            if "*" in value:
+                self.params.append(glob_pattern(value))
+                return f"d.{column} GLOB ?"
+            self.params.append(value)
+            return f"d.{column} = ?"
+        if field in FACET_FIELDS:
+            if value == "*":
+                self.params.append(field)
+                return "d.rowid IN (SELECT dataset FROM facet_values WHERE facet = ?)"
+            operator = "GLOB" if "*" in value else "="
+            self.params.extend([field, glob_pattern(value) if "*" in value else value])
+            return f"d.rowid IN (SELECT dataset FROM facet_values WHERE facet = ? AND value {operator} ?)"
+        raise UnsupportedQuery(f"field {field!r} is not indexed locally")
+
+    def text_term(self, value: str) -> str:
+        if value in ("*", ""):
+            return "1"
+        if not self.full_text:
+            # free text stays case insensitive, as it is in solr
+            self.params.append(f"%{like_pattern(value)}%")
+            return "d.text LIKE ? ESCAPE '\\'"
+        prefix = value.endswith("*")
+        phrase = '"{}"'.format(value.rstrip("*").replace('"', '""'))
+        self.params.append(f"{phrase} *" if prefix else phrase)
+        return "d.rowid IN (SELECT rowid FROM datasets_text WHERE datasets_text MATCH ?)"
+
+
+class LocalDatasetIndex:
+    """
+    sqlite store of harvested CMIP6 dataset documents with faceted and free text search.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS datasets_text USING fts5(text, tokenize='unicode61')"
+            )
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False
+        self.connection.commit()
+
+    @classmethod
+    def open_existing(cls, path: str) -> Optional["LocalDatasetIndex"]:
+        return cls(path) if os.path.exists(path) else None
+
+    def close(self):
+        self.connection.close()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    @property
+    def watermark(self) -> Optional[str]:
+        """
+        largest ESGF `_timestamp` seen, incremental harvests ask for changes after it.
+        """
+        return self.get_meta("watermark")
+
+    @property
+    def harvested_at(self) -> Optional[float]:
+        value = self.get_meta("harvested_at")
+        return float(value) if value else None
+
+    def is_stale(self, max_age: float) -> bool:
+        harvested_at = self.harvested_at
+        return harvested_at is None or time.time() - harvested_at > max_age
+
+    def count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM datasets").fetchone()[0]
+
+    def upsert(self, documents: list[dict[str, Any]]) -> str:
+        """
+        inserts or replaces harvested documents, and marks older versions of the same
+        dataset as superseded. returns the largest `_timestamp` among the documents, the
+        watermark is only moved by a complete harvest.
+        """
+        cursor = self.connection.cursor()
+        newest = ""
+        for document in documents:
+            text = " ".join(
+                str(value)
+                for key in ("id", "title", *FACET_FIELDS)
+                for value in self.values_of(document.get(key))
+            )
+            row = (
+                single_value(document.get("instance_id")),
+                single_value(document.get("master_id")),
+                str(single_value(document.get("version")) or ""),
+                single_value(document.get("_timestamp")),
+                0 if str(single_value(document.get("latest"))).lower() == "false" else 1,
+                text,
+                json.dumps(document, separators=(",", ":")),
+            )
+            existing = cursor.execute(
+                "SELECT rowid FROM datasets WHERE id = ?", (document["id"],)
+            ).fetchone()
+            if existing is None:
+                cursor.execute(
+                    "INSERT INTO datasets (instance_id, master_id, version, timestamp, latest, text, document, id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*row, document["id"]),
+                )
+                rowid = cursor.lastrowid
+            else:
+                rowid = existing[0]
+                cursor.execute(
+                    "UPDATE datasets SET instance_id = ?, master_id = ?, version = ?, timestamp = ?, "
+                    "latest = ?, text = ?, document = ? WHERE rowid = ?",
+                    (*row, rowid),
+                )
+                cursor.execute("DELETE FROM facet_values WHERE dataset = ?", (rowid,))
+                if self.full_text:
+                    cursor.execute("DELETE FROM datasets_text WHERE rowid = ?", (rowid,))
+            cursor.executemany(
+                "INSERT INTO facet_values (dataset, facet, value) VALUES (?, ?, ?)",
+                [
+                    (rowid, facet, str(value))
+                    for facet in FACET_FIELDS
+                    for value in self.values_of(document.get(facet))
+                ],
+            )
+            if self.full_text:
+                cursor.execute("INSERT INTO datasets_text (rowid, text) VALUES (?, ?)", (rowid, text))
+            if row[4] and row[1]:
+                cursor.execute(
+                    "UPDATE datasets SET latest = 0 WHERE master_id = ? AND version < ? AND rowid != ?",
+                    (row[1], row[2], rowid),
+                )
+            newest = max(newest, row[3] or "")
+        self.connection.commit()
+        return newest
+
+    @staticmethod
+    def values_of(value: Any) -> list[Any]:
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def where(self, query: str, latest_only: bool) -> tuple[str, list[Any]]:
+        clause, params = QueryCompiler(query, self.full_text).compile()
+        if latest_only:
+            clause = f"d.latest = 1 AND {clause}"
+        return clause, params
+
+    def search(
+        self,
+        query: str,
+        offset: int = 0,
+        limit: int = 20,
+        latest_only: bool = True,
+        count: bool = True,
+    ) -> tuple[list[dict[str, Any]], Optional[int]]:
+        """
+        returns one page of matching documents and the total number of matches, or None for
+        the total when `count` is off. pages follow insertion order, which lets sqlite stop at
+        the first `limit` matches instead of sorting all of them.
+        raises UnsupportedQuery when the query can't be answered locally.
+        """
+        clause, params = self.where(query, latest_only)
+        total = None
+        if count:
+            total = self.connection.execute(
+                f"SELECT COUNT(*) FROM datasets d WHERE {clause}", params
+            ).fetchone()[0]
+        rows = self.connection.execute(
+            f"SELECT d.document FROM datasets d WHERE {clause} ORDER BY d.rowid LIMIT ? OFFSET ?",
+            [*params, limit, offset],
+        ).fetchall()
+        return [json.loads(document) for (document,) in rows], total
+
+    def facet_counts(
+        self, query: str, facets: Optional[list[str]] = None, latest_only: bool = True
+    ) -> dict[str, dict[str, int]]:
+        """
+        per facet value counts over the datasets matching a query, most common first.
+        """
+        clause, params = self.where(query, latest_only)
+        counts = {}
+        for facet in facets or FACET_FIELDS:
+            rows = self.connection.execute(
+                "SELECT f.value, COUNT(*) FROM facet_values f JOIN datasets d ON d.rowid = f.dataset "
+                f"WHERE f.facet = ? AND {clause} GROUP BY f.value ORDER BY COUNT(*) DESC",
+                [facet, *params],
+            ).fetchall()
+            counts[facet] = dict(rows)
+        return counts
+
+    def facet_values(self, facets: list[str]) -> dict[str, list[str]]:
+        """
+        the facet table in the shape ESGFProvider keeps it: values per facet by popularity.
+        """
+        return {
+            facet: list(counts)
+            for facet, counts in self.facet_counts("", [f for f in facets if f in FACET_FIELDS]).items()
+        }
+
+
+async def harvest(provider, index: LocalDatasetIndex, full: bool = False, page_size: int = 1000) -> int:
+    """
+    pulls CMIP6 dataset documents from ESGF into the index, partitioned by activity so that
+    offsets stay small. unless `full` is set, only datasets changed since the index's
+    watermark are requested. returns the number of documents stored.
+    """
+    since = None if full else index.watermark
+    base = {
+        "type": "Dataset",
+        "project": "CMIP6",
+        "latest": "true",
+        "distrib": "true",
+        "format": "application/solr+json",
+    }
+    if since:
+        base["from"] = since
+
+    async def fetch(params: dict[str, Any], mirror: Optional[str] = None) -> dict[str, Any]:
+        response = await provider.request(mirror or provider.get_current_mirror(), params)
+        if response.status_code != 200:
+            raise ConnectionError(
+                f"harvest request failed: {response.url}: {response.status_code} {response.content}"
+            )
+        return response.json()
+
+    facets = await provider.with_all_available_mirrors(
+        fetch, base | {"limit": "0", "facets": "activity_id"}
+    )
+    activities = facets["facet_counts"]["facet_fields"]["activity_id"][0::2]
+    stored = 0
+    # pages aren't in timestamp order, so the watermark only moves once every activity is in
+    watermark = index.watermark or ""
+    for activity in activities:
+        offset = 0
+        while True:
+            page = await provider.with_all_available_mirrors(
+                fetch,
+                base
+                | {
+                    "activity_id": activity,
+                    "fields": ",".join(DATASET_FIELDS + ("title",)),
+                    "limit": str(page_size),
+                    "offset": str(offset),
+                },
+            )
+            documents = page["response"]["docs"]
+            watermark = max(watermark, index.upsert(documents))
+            stored += len(documents)
+            offset += len(documents)
+            print(f"harvested {offset}/{page['response']['numFound']} datasets for {activity}", flush=True)
+            if not documents or offset >= page["response"]["numFound"]:
+                break
+    if watermark:
+        index.set_meta("watermark", watermark)
+    index.set_meta("harvested_at", str(time.time()))
+    index.connection.commit()
+    return stored
+
+
+def main():
+    from .esgf_search import ESGFProvider, default_settings
+
+    parser = argparse.ArgumentParser(description="harvest CMIP6 dataset metadata from ESGF")
+    parser.add_argument("--path", default=default_settings.local_index_path)
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and re-harvest everything")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    async def run():
+        provider = ESGFProvider(agent_fn=None)
+        index = LocalDatasetIndex(args.path)
+        try:
+            stored = await harvest(provider, index, full=args.full, page_size=args.page_size)
+            print(f"stored {stored} datasets, index now holds {index.count()}", flush=True)
+        finally:
+            index.close()
+            await provider.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from typing import Any, Iterable, Optional
+
+# dataset level fields the agent works with: identity, the CMIP6 DRS facets, size and
+# replica information, plus the coverage details it summarizes for users.
+DATASET_FIELDS = (
+    "id",
+    "instance_id",
+    "master_id",
+    "data_node",
+    "replica",
+    "latest",
+    "version",
+    "_timestamp",
+    "size",
+    "number_of_files",
+    "mip_era",
+    "activity_id",
+    "institution_id",
+    "source_id",
+    "experiment_id",
+    "member_id",
+    "variant_label",
+    "table_id",
+    "variable_id",
+    "grid_label",
+    "frequency",
+    "nominal_resolution",
+    "realm",
+    "variable_long_name",
+    "datetime_start",
+    "datetime_stop",
+    "north_degrees",
+    "south_degrees",
+    "east_degrees",
+    "west_degrees",
+)
+DATASET_FIELD_SET = frozenset(DATASET_FIELDS)
+
+
+def single_value(value: Any) -> Any:
+    """
+    the value of a field that should hold one, taking the first if solr returned a list.
+    """
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+class DatasetRecord:
+    """
+    compact view of one ESGF dataset search result. known fields live in slots, anything
+    else the node returned (e.g. with `fields=*`) is kept in `extra`. values keep the shape
+    solr returned them in, so multi-valued facets are always lists.
+
+    supports read-only mapping access (`record["id"]`, `record.get(...)`) so it can stand in
+    for the raw solr document.
+    """
+
+    __slots__ = DATASET_FIELDS + ("extra",)
+
+    def __init__(self, document: dict[str, Any]):
+        get = document.get
+        for field in DATASET_FIELDS:
+            setattr(self, field, get(field))
+        extra = {
+            key: value
+            for key, value in document.items()
+            if key not in DATASET_FIELD_SET
+        }
+        self.extra = extra or None
+
+    def to_json(self) -> dict[str, Any]:
+        document = {}
+        for field in DATASET_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                document[field] = value
+        if self.extra:
+            document.update(self.extra)
+        return document
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in DATASET_FIELD_SET:
+            value = getattr(self, key)
+        else:
+            value = self.extra.get(key) if self.extra else None
+        return default if value is None else value
+
+    def __repr__(self) -> str:
+        return f"DatasetRecord({self.id!r})"
+
+
+def decode_datasets(documents: Iterable[dict[str, Any]]) -> list[DatasetRecord]:
+    return [DatasetRecord(document) for document in documents]
+
+
+def datasets_to_json(records: Iterable[DatasetRecord]) -> list[dict[str, Any]]:
+    return [record.to_json() for record in records]
+
+
+def projection(fields: Optional[Iterable[str]]) -> str:
+    """
+    the solr `fields` parameter for a projection, `*` when no projection is wanted.
+    """
+    if fields is None:
+        return "*"
+    fields = list(fields)
+    return "*" if not fields or "*" in fields else ",".join(fields)
@@ -1,15 +1,38 @@
+import asyncio
+import inspect
 import itertools
 import json
 import os
 import re
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Any
-from urllib.parse import urlencode
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Union
+from urllib.parse import quote
 
-import dask
-import requests
+import httpx
 
-DatasetSearchResults = list[dict[str, Any]]
+from .esgf_cache import (
+    FacetCache,
+    QueryCache,
+    SingleFlight,
+    TranslationCache,
+    canonicalize_lucene_query,
+    vocabulary_fingerprint,
+)
+from .esgf_index import LocalDatasetIndex, UnsupportedQuery, harvest
+from .esgf_records import DATASET_FIELDS, DatasetRecord, datasets_to_json, decode_datasets, projection
+from .facet_retrieval import FacetRetriever
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DatasetSearchResults = list[DatasetRecord]
+EarlyResultsCallback = Callable[[dict[str, Any]], Union[None, Awaitable[None]]]
 AccessURLs = list[dict[str, list[str]]]  # mirrors : [ method -> urls ]
 
 
@@ -33,9 +56,265 @@ class Settings:
     esgf_fallbacks = os.environ.get("ESGF_FALLBACKS", ",".join(DEFAULT_ESGF_FALLBACKS))
     default_facets = "project,experiment_family"
     entries_per_page = 20
+    # solr fields requested for dataset searches, `*` returns every stored field
+    dataset_fields = os.environ.get("ESGF_DATASET_FIELDS", ",".join(DATASET_FIELDS))
+    file_page_size = int(os.environ.get("ESGF_FILE_PAGE_SIZE", "200"))
+    request_timeout = float(os.environ.get("ESGF_REQUEST_TIMEOUT", "30"))
+    max_connections_per_mirror = int(os.environ.get("ESGF_MAX_CONNECTIONS_PER_MIRROR", "10"))
+    # seconds to wait on a mirror before firing a backup request at the next one. empty disables hedging
+    hedge_delay = os.environ.get("ESGF_HEDGE_DELAY", "2.0")
+    max_hedged_requests = int(os.environ.get("ESGF_MAX_HEDGED_REQUESTS", "3"))
+    # characters of OR-combined ids per batched query, keeps urls under common server limits
+    batch_query_max_chars = int(os.environ.get("ESGF_BATCH_QUERY_MAX_CHARS", "6000"))
+    # replicas of a dataset whose file listings are fetched at the same time
+    replica_concurrency = int(os.environ.get("ESGF_REPLICA_CONCURRENCY", "4"))
+    cache_dir = os.environ.get(
+        "ESGF_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "beaker_climate", "esgf")
+    )
+    mirror_health_window = int(os.environ.get("ESGF_MIRROR_HEALTH_WINDOW", "50"))
+    # consecutive failures before a mirror's circuit breaker opens
+    mirror_failure_threshold = int(os.environ.get("ESGF_MIRROR_FAILURE_THRESHOLD", "3"))
+    # seconds an open circuit waits before it is probed again
+    mirror_probe_interval = float(os.environ.get("ESGF_MIRROR_PROBE_INTERVAL", "60"))
+    # seconds before the on-disk facet table is refreshed in the background
+    facet_cache_ttl = float(os.environ.get("ESGF_FACET_CACHE_TTL", str(7 * 24 * 60 * 60)))
+    # facet table to seed the cache with, e.g. for air-gapped deployments
+    facet_seed_file = os.environ.get("ESGF_FACET_SEED_FILE", "")
+    facet_auto_refresh = os.environ.get("ESGF_FACET_AUTO_REFRESH", "true").lower() != "false"
+    # values per facet offered to the LLM, picked by local retrieval. 0 sends every value
+    facet_candidates_per_facet = int(os.environ.get("ESGF_FACET_CANDIDATES", "25"))
+    # run a keyword search on the raw query while the LLM translates it, when every keyword of the
+    # query is a facet value and the translation may therefore come out the same
+    speculative_search = os.environ.get("ESGF_SPECULATIVE_SEARCH", "false").lower() == "true"
+    translation_cache_enabled = os.environ.get("ESGF_TRANSLATION_CACHE", "true").lower() != "false"
+    query_cache_enabled = os.environ.get("ESGF_QUERY_CACHE", "true").lower() != "false"
+    query_cache_memory_entries = int(os.environ.get("ESGF_QUERY_CACHE_MEMORY_ENTRIES", "256"))
+    query_cache_max_bytes = int(os.environ.get("ESGF_QUERY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    # latest=true searches change when new versions are published, so they expire quickly
+    query_cache_ttl = float(os.environ.get("ESGF_QUERY_CACHE_TTL", str(6 * 60 * 60)))
+    # file listings of a pinned dataset version never change
+    versioned_listing_cache_ttl = float(
+        os.environ.get("ESGF_VERSIONED_LISTING_CACHE_TTL", str(30 * 24 * 60 * 60))
+    )
+
+    # sqlite mirror of CMIP6 dataset metadata, built with `python -m ...search.esgf_index`
+    local_index_path = os.environ.get("ESGF_LOCAL_INDEX", os.path.join(cache_dir, "cmip6_index.sqlite"))
+    # seconds after the last harvest that searches are still answered from the local index
+    local_index_max_age = float(os.environ.get("ESGF_LOCAL_INDEX_MAX_AGE", str(7 * 24 * 60 * 60)))
 
 default_settings = Settings()
 
+VERSIONED_DATASET_ID = re.compile(r"\.v\d{8}(\|.*)?$")
+
+
+class MirrorHealthRegistry:
+    """
+    rolling latency and error statistics per ESGF mirror, with a circuit breaker that takes
+    mirrors which keep failing out of rotation until a probe succeeds against them again.
+
+    statistics are persisted as json in the cache directory so that a new kernel starts
+    with the mirror ordering the previous one learned.
+    """
+
+    persist_interval = 30.0
+
+    def __init__(self, path: Optional[str] = None, settings: Settings = default_settings):
+        self.path = path
+        self.settings = settings
+        self.latencies: dict[str, deque] = {}
+        self.outcomes: dict[str, deque] = {}
+        self.consecutive_failures: dict[str, int] = {}
+        # mirror -> wall clock time the circuit opened, or was last probed unsuccessfully
+        self.open_circuits: dict[str, float] = {}
+        self.last_saved = 0.0
+        self.load()
+
+    def _window(self, store: dict[str, deque], mirror: str) -> deque:
+        if mirror not in store:
+            store[mirror] = deque(maxlen=self.settings.mirror_health_window)
+        return store[mirror]
+
+    def record_success(self, mirror: str, latency: float):
+        self._window(self.latencies, mirror).append(latency)
+        self._window(self.outcomes, mirror).append(True)
+        self.consecutive_failures[mirror] = 0
+        if self.open_circuits.pop(mirror, None) is not None:
+            print(f"mirror {mirror} recovered, closing circuit", flush=True)
+        self.save()
+
+    def record_failure(self, mirror: str, latency: float):
+        self._window(self.latencies, mirror).append(latency)
+        self._window(self.outcomes, mirror).append(False)
+        failures = self.consecutive_failures.get(mirror, 0) + 1
+        self.consecutive_failures[mirror] = failures
+        if failures >= self.settings.mirror_failure_threshold:
+            if mirror not in self.open_circuits:
+                print(f"mirror {mirror} failed {failures} times in a row, opening circuit", flush=True)
+            self.open_circuits[mirror] = time.time()
+        self.save()
+
+    def record_abandoned(self, mirror: str, elapsed: float):
+        """
+        a request that was cancelled because another mirror answered first. the elapsed time is a
+        lower bound on this mirror's latency, which keeps hung mirrors from looking unmeasured.
+        """
+        self._window(self.latencies, mirror).append(elapsed)
+
+    def latency_percentile(self, mirror: str, percentile: float) -> Optional[float]:
+        latencies = sorted(self.latencies.get(mirror, ()))
+        if not latencies:
+            return None
+        rank = min(len(latencies) - 1, max(0, round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[rank]
+
+    def error_rate(self, mirror: str) -> float:
+        outcomes = self.outcomes.get(mirror, ())
+        if not outcomes:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+    def is_open(self, mirror: str) -> bool:
+        return mirror in self.open_circuits
+
+    def probe_due(self, mirror: str) -> bool:
+        opened_at = self.open_circuits.get(mirror)
+        return opened_at is not None and time.time() - opened_at >= self.settings.mirror_probe_interval
+
+    def expected_latency(self, mirror: str) -> Optional[float]:
+        """
+        median latency weighted by the chance of paying a full timeout on failure.
+        """
+        median = self.latency_percentile(mirror, 50)
+        if median is None:
+            return None
+        error_rate = self.error_rate(mirror)
+        return (1 - error_rate) * median + error_rate * self.settings.request_timeout
+
+    def ordered(self, mirrors: list[str]) -> list[str]:
+        """
+        mirrors sorted by expected latency with open circuits removed. mirrors with no history
+        are ranked at the median of the known ones, and ties keep the configured order.
+        if every circuit is open, all mirrors are returned as a last resort.
+        """
+        available = [mirror for mirror in mirrors if not self.is_open(mirror)]
+        if not available:
+            return list(mirrors)
+        expected = {mirror: self.expected_latency(mirror) for mirror in available}
+        known = sorted(latency for latency in expected.values() if latency is not None)
+        default = known[len(known) // 2] if known else 0.0
+        return sorted(
+            available,
+            key=lambda mirror: expected[mirror] if expected[mirror] is not None else default,
+        )
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        return {
+            mirror: {
+                "p50": self.latency_percentile(mirror, 50),
+                "p90": self.latency_percentile(mirror, 90),
+                "error_rate": self.error_rate(mirror),
+                "circuit_open": self.is_open(mirror),
+            }
+            for mirror in self.latencies
+        }
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ignoring unreadable mirror health file {self.path}: {e}", flush=True)
+            return
+        for mirror, latencies in state.get("latencies", {}).items():
+            self._window(self.latencies, mirror).extend(latencies)
+        for mirror, outcomes in state.get("outcomes", {}).items():
+            self._window(self.outcomes, mirror).extend(outcomes)
+        self.consecutive_failures.update(state.get("consecutive_failures", {}))
+        self.open_circuits.update(state.get("open_circuits", {}))
+
+    def save(self, force: bool = False):
+        if self.path is None:
+            return
+        now = time.time()
+        if not force and now - self.last_saved < self.persist_interval:
+            return
+        self.last_saved = now
+        state = {
+            "latencies": {mirror: list(values) for mirror, values in self.latencies.items()},
+            "outcomes": {mirror: list(values) for mirror, values in self.outcomes.items()},
+            "consecutive_failures": self.consecutive_failures,
+            "open_circuits": self.open_circuits,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"failed to persist mirror health to {self.path}: {e}", flush=True)
+
+
+class ESGFConnectionPool:
+    """
+    holds one pooled async http client per mirror so that repeated queries against
+    a node reuse keep-alive (and HTTP/2 where the server and `h2` allow it) connections
+    instead of paying a fresh TCP/TLS handshake per request.
+    """
+
+    def __init__(self, settings: Settings = default_settings):
+        self.settings = settings
+        self.clients: dict[str, httpx.AsyncClient] = {}
+
+    def client_for(self, mirror: str) -> httpx.AsyncClient:
+        client = self.clients.get(mirror)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=mirror,
+                http2=HTTP2_AVAILABLE,
+                timeout=self.settings.request_timeout,
+                limits=httpx.Limits(
+                    max_connections=self.settings.max_connections_per_mirror,
+                    max_keepalive_connections=self.settings.max_connections_per_mirror,
+                ),
+                follow_redirects=True,
+            )
+            self.clients[mirror] = client
+        return client
+
+    async def get(self, mirror: str, params: dict[str, Any]) -> httpx.Response:
+        return await self.client_for(mirror).get("/search", params=params)
+
+    async def aclose(self):
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+def prefix_term(value: str) -> str:
+    return f"{value}*"
+
+
+def quoted_term(value: str) -> str:
+    return '"{}"'.format(value.replace('"', '\\"'))
+
+
+def keyword_of(value: str) -> str:
+    """
+    a facet value or query word as `keyword_query` sends it, lowercased for comparison.
+    """
+    return re.sub(r"[^A-Za-z0-9]+", "", value).lower()
+
+
+def or_clause(field: str, terms: list[str]) -> str:
+    """
+    `field:(a OR b ...)` over already rendered terms.
+    """
+    return f"{field}:({' OR '.join(terms)})"
+
 
 def generate_natural_language_system_prompt(facets: dict[str, list[str]]) -> str:
     return f"""\
@@ -110,132 +389,647 @@ SEARCH_FACETS = [
 
 
 class ESGFProvider():
-    def __init__(self, agent_fn):
+    def __init__(
+        self,
+        agent_fn,
+        pool: Optional[ESGFConnectionPool] = None,
+        health: Optional[MirrorHealthRegistry] = None,
+        facet_seed_file: Optional[str] = None,
+        local_index: Optional[LocalDatasetIndex] = None,
+    ):
         print("initializing esgf search provider")
         self.agent_fn = agent_fn
+        self.pool = pool or ESGFConnectionPool()
+        self.health = health or MirrorHealthRegistry(
+            os.path.join(default_settings.cache_dir, "mirror_health.json")
+        )
+        self.probe_task: Optional[asyncio.Task] = None
         self.search_mirrors = [
             default_settings.esgf_url,
             *default_settings.esgf_fallbacks.split(","),
         ]
-        self.current_mirror_index = 0
-        self.retries = 0
         self.max_retries = len(self.search_mirrors)
-        self.with_all_available_mirrors(self.get_facet_possiblities)
+        self.hedge_delay = float(default_settings.hedge_delay) if default_settings.hedge_delay else None
+        self.max_hedged_requests = max(1, default_settings.max_hedged_requests)
+        # identical dataset queries and file listings in flight share one request
+        self.in_flight = SingleFlight()
+        self.local_index = local_index or LocalDatasetIndex.open_existing(
+            default_settings.local_index_path
+        )
+        self.facet_cache = FacetCache(
+            os.path.join(default_settings.cache_dir, "facets.json.gz"),
+            ttl=default_settings.facet_cache_ttl,
+        )
+        self.facet_refresh_task: Optional[asyncio.Task] = None
+        # derived from facet_possibilities, rebuilt whenever it is replaced
+        self.facet_derivatives_source: Optional[dict[str, list[str]]] = None
+        self.facet_vocabulary = ""
+        self.facet_retriever: Optional[FacetRetriever] = None
+        self.facet_keywords: set[str] = set()
+        self.translation_cache = TranslationCache(
+            os.path.join(default_settings.cache_dir, "translations-v2.json.gz")
+            if default_settings.translation_cache_enabled
+            else None
+        )
+        if default_settings.query_cache_enabled:
+            self.query_cache = QueryCache(
+                os.path.join(default_settings.cache_dir, "queries"),
+                max_memory_entries=default_settings.query_cache_memory_entries,
+                max_disk_bytes=default_settings.query_cache_max_bytes,
+            )
+        else:
+            self.query_cache = QueryCache(None, max_memory_entries=0)
+        self.facet_possibilities = self.load_cached_facets(
+            facet_seed_file or default_settings.facet_seed_file
+        )
+        if self.facet_cache.is_stale() and default_settings.facet_auto_refresh:
+            self.schedule_facet_refresh()
 
     async def tool_search(self, query: str):
         return await self.search(query, 1, False)
-    
-    def tool_fetch(self, dataset_id: str):
-        urls = self.get_all_access_paths_by_id(dataset_id)
-        metadata = self.get_metadata_for_dataset(dataset_id)
+
+    async def tool_fetch(self, dataset_id: str):
+        # the replica listings double as the metadata lookup, so each id is only queried once
+        listings = await self.get_replica_file_listings(dataset_id)
+        urls = [self.access_paths_from_files(files) for files in listings.values()]
+        files = listings.get(dataset_id)
+        if files is None:
+            metadata = await self.get_metadata_for_dataset(dataset_id)
+        else:
+            metadata = files[0]
         return {"dataset": dataset_id, "urls": urls, "metadata": metadata}
 
-    def increment_mirror(self):
-        self.current_mirror_index += 1
-        self.current_mirror_index = self.current_mirror_index % len(self.search_mirrors)
+    async def tool_fetch_many(self, dataset_ids: list[str]) -> list[dict[str, Any]]:
+        """
+        batch version of `tool_fetch`. replicas of all ids are resolved with OR-combined
+        `id:(a* OR b* ...)` searches and their files listed with `dataset_id:(...)` searches,
+        chunked to stay under url length limits, then split back up per dataset.
+        """
+        replicas = await self.get_replicas_for_datasets(dataset_ids)
+        replica_ids = list(dict.fromkeys(itertools.chain.from_iterable(replicas.values())))
+        listings = await self.get_file_listings_for_replicas(replica_ids)
+
+        fetched = []
+        for dataset_id in dataset_ids:
+            dataset_listings = {
+                replica_id: listings[replica_id]
+                for replica_id in replicas.get(dataset_id, [])
+                if listings.get(replica_id)
+            }
+            if not dataset_listings:
+                fetched.append({"dataset": dataset_id, "error": "no files found for dataset"})
+                continue
+            files = dataset_listings.get(dataset_id) or next(iter(dataset_listings.values()))
+            fetched.append(
+                {
+                    "dataset": dataset_id,
+                    "urls": [self.access_paths_from_files(f) for f in dataset_listings.values()],
+                    "metadata": files[0],
+                }
+            )
+        return fetched
+
+    def chunk_query_terms(
+        self, terms: list[str], field: str, render: Callable[[str], str]
+    ) -> list[list[str]]:
+        """
+        groups query terms so that the url encoded `or_clause(field, ...)` of each group,
+        with terms rendered by `render`, stays under `batch_query_max_chars`.
+        """
+        overhead = len(quote(or_clause(field, [])))
+        separator = len(quote(" OR "))
+        chunks, chunk, size = [], [], overhead
+        for term in terms:
+            term_size = len(quote(render(term)))
+            if chunk and size + separator + term_size > default_settings.batch_query_max_chars:
+                chunks.append(chunk)
+                chunk, size = [], overhead
+            size += term_size + (separator if chunk else 0)
+            chunk.append(term)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def gather_bounded(self, coroutines) -> list[Any]:
+        """
+        runs coroutines concurrently, at most `replica_concurrency` at a time. the first
+        failure cancels the others and is raised.
+        """
+        semaphore = asyncio.Semaphore(max(1, default_settings.replica_concurrency))
+
+        async def run(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        tasks = [asyncio.ensure_future(run(coroutine)) for coroutine in coroutines]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def get_replicas_for_datasets(self, dataset_ids: list[str]) -> dict[str, list[str]]:
+        """
+        maps each dataset id to the full ids of all its replicas.
+        """
+        base_ids = {dataset_id: dataset_id.split("|")[0] for dataset_id in dataset_ids}
+        chunks = self.chunk_query_terms(sorted(set(base_ids.values())), "id", prefix_term)
+        results = await self.gather_bounded(
+            self.with_all_available_mirrors(
+                self.search_all_pages, or_clause("id", [prefix_term(i) for i in chunk])
+            )
+            for chunk in chunks
+        )
+        found = [record["id"] for record in itertools.chain.from_iterable(results)]
+        return {
+            dataset_id: [replica_id for replica_id in found if replica_id.startswith(base_id)]
+            for dataset_id, base_id in base_ids.items()
+        }
+
+    async def search_all_pages(
+        self, query_string: str, mirror: Optional[str] = None, page_size: int = 500
+    ) -> DatasetSearchResults:
+        datasets = []
+        while True:
+            page = await self.run_esgf_dataset_query(
+                query_string,
+                1,
+                {"limit": str(page_size), "offset": str(len(datasets))},
+                mirror=mirror,
+            )
+            datasets.extend(page)
+            if len(page) < page_size:
+                return datasets
+
+    async def get_file_listings_for_replicas(self, replica_ids: list[str]) -> dict[str, list[dict[str, Any]]]:
+        """
+        file listings for many replicas, taken from the query cache where possible and
+        otherwise fetched with OR-combined `dataset_id` searches.
+        """
+        listings = {}
+        missing = []
+        for replica_id in replica_ids:
+            cached = self.query_cache.get(self.file_listing_cache_key(replica_id))
+            if cached is not None:
+                listings[replica_id] = cached
+            else:
+                missing.append(replica_id)
+        results = await self.gather_bounded(
+            self.with_all_available_mirrors(self.get_files_for_replicas, chunk)
+            for chunk in self.chunk_query_terms(missing, "dataset_id", quoted_term)
+        )
+        for result in results:
+            for replica_id, files in result.items():
+                listings[replica_id] = files
+                self.cache_file_listing(replica_id, files)
+        return listings
+
+    async def get_files_for_replicas(
+        self, replica_ids: list[str], mirror: Optional[str] = None
+    ) -> dict[str, list[dict[str, Any]]]:
+        """
+        pages through one OR-combined file search and splits the files by dataset.
+        """
+        params = {
+            "type": "File",
+            "format": "application/solr+json",
+            "query": or_clause("dataset_id", [quoted_term(replica_id) for replica_id in replica_ids]),
+            "limit": default_settings.file_page_size,
+        }
+        files_by_replica: dict[str, list[dict[str, Any]]] = {}
+        offset = 0
+        while True:
+            r = await self.request(mirror or self.get_current_mirror(), params | {"offset": offset})
+            if r.status_code != 200:
+                raise ConnectionError(
+                    f"Failed to extract files from datasets via file search: {r.url} {r.status_code} {r.content}"
+                )
+            response = r.json()["response"]
+            for file in response["docs"]:
+                replica_id = file.get("dataset_id")
+                if isinstance(replica_id, list):
+                    replica_id = replica_id[0]
+                files_by_replica.setdefault(replica_id, []).append(file)
+            offset += len(response["docs"])
+            if not response["docs"] or offset >= response.get("numFound", offset):
+                return files_by_replica
 
-    def with_all_available_mirrors(self, func, *args, **kwargs) -> Any:
-        self.retries = 0
-        return_value = None
-        while self.retries < self.max_retries:
+    async def aclose(self):
+        for task in (self.probe_task, self.facet_refresh_task):
+            if task is not None:
+                task.cancel()
+        self.health.save(force=True)
+        await self.pool.aclose()
+
+    def local_index_ready(self) -> bool:
+        """
+        true when a local metadata index exists and was harvested recently enough to search.
+        """
+        return self.local_index is not None and not self.local_index.is_stale(
+            default_settings.local_index_max_age
+        )
+
+    async def refresh_local_index(self, full: bool = False) -> int:
+        """
+        harvests changes since the last run (or everything, with `full`) into the local index.
+        """
+        if self.local_index is None:
+            self.local_index = LocalDatasetIndex(default_settings.local_index_path)
+        return await harvest(self, self.local_index, full=full)
+
+    def local_facet_counts(self, query: str, facets: Optional[list[str]] = None) -> dict[str, dict[str, int]]:
+        """
+        counts of each facet value among the datasets matching a lucene query, from the local index.
+        """
+        if not self.local_index_ready():
+            raise ValueError("the local ESGF index is missing or stale, refresh it first")
+        return self.local_index.facet_counts(query, facets)
+
+    def ordered_mirrors(self) -> list[str]:
+        """
+        mirrors in the order they should be tried: fastest expected latency first, open circuits skipped.
+        """
+        return self.health.ordered(self.search_mirrors)
+
+    async def request(self, mirror: str, params: dict[str, Any]) -> httpx.Response:
+        """
+        sends a search request to a mirror through the connection pool and records how it went.
+        """
+        start = time.monotonic()
+        try:
+            response = await self.pool.get(mirror, params)
+        except asyncio.CancelledError:
+            self.health.record_abandoned(mirror, time.monotonic() - start)
+            raise
+        except Exception:
+            self.health.record_failure(mirror, time.monotonic() - start)
+            self.ensure_probing()
+            raise
+        if response.status_code >= 500 or response.status_code == 429:
+            self.health.record_failure(mirror, time.monotonic() - start)
+            self.ensure_probing()
+        else:
+            self.health.record_success(mirror, time.monotonic() - start)
+        return response
+
+    def ensure_probing(self):
+        """
+        starts the background task that probes mirrors with open circuits, if it isn't running.
+        """
+        if not self.health.open_circuits:
+            return
+        if self.probe_task is not None and not self.probe_task.done():
+            return
+        try:
+            self.probe_task = asyncio.get_running_loop().create_task(self.probe_open_circuits())
+        except RuntimeError:
+            # no running loop, probing will start with the next request
+            self.probe_task = None
+
+    async def probe_open_circuits(self):
+        probe = {"project": "CMIP6", "limit": "0", "format": "application/solr+json"}
+        while self.health.open_circuits:
+            for mirror in [m for m in self.search_mirrors if self.health.probe_due(m)]:
+                try:
+                    await self.request(mirror, probe)
+                except Exception:
+                    pass
+                if self.health.is_open(mirror):
+                    # restart the cooldown so the mirror isn't hammered
+                    self.health.open_circuits[mirror] = time.time()
+            await asyncio.sleep(min(5.0, default_settings.mirror_probe_interval))
+
+    async def with_all_available_mirrors(self, func, *args, **kwargs) -> Any:
+        """
+        runs `func(*args, mirror=..., **kwargs)` against the available mirrors until one succeeds.
+
+        with hedging enabled the best mirror is queried first, a backup request is sent to the
+        next mirror every `hedge_delay` seconds (up to `max_hedged_requests` in flight), a failed
+        request immediately hands off to the next mirror, and the first valid response wins
+        while the outstanding requests are cancelled.
+        """
+        self.ensure_probing()
+        if self.hedge_delay is None:
+            return await self.with_mirrors_sequentially(func, *args, **kwargs)
+        return await self.with_hedged_mirrors(func, *args, **kwargs)
+
+    async def with_mirrors_sequentially(self, func, *args, **kwargs) -> Any:
+        retries = 0
+        last_error = None
+        for mirror in self.ordered_mirrors()[: self.max_retries]:
             try:
-                return_value = func(*args, **kwargs)
-                break
+                return_value = await func(*args, mirror=mirror, **kwargs)
             except Exception as e:
                 print(
-                    f"failed to run: retry {self.retries}, mirror: {self.search_mirrors[self.current_mirror_index]} with error '{str(e)}'",
+                    f"failed to run: retry {retries}, mirror: {mirror} with error '{str(e)}'",
                     flush=True,
                 )
-                self.increment_mirror()
-                self.retries += 1
-                if self.retries >= self.max_retries:
-                    raise Exception(f"failed after {self.retries} retries: {e}")
-        return return_value
+                retries += 1
+                last_error = e
+                continue
+            return return_value
+        raise Exception(f"failed after {retries} retries: {last_error}")
+
+    async def with_hedged_mirrors(self, func, *args, **kwargs) -> Any:
+        retries = 0
+        remaining_mirrors = iter(self.ordered_mirrors()[: self.max_retries])
+        in_flight: dict[asyncio.Task, str] = {}
+        last_error = None
+
+        def launch_next() -> bool:
+            mirror = next(remaining_mirrors, None)
+            if mirror is None:
+                return False
+            task = asyncio.ensure_future(func(*args, mirror=mirror, **kwargs))
+            in_flight[task] = mirror
+            return True
+
+        launch_next()
+        try:
+            while in_flight:
+                can_hedge = len(in_flight) < self.max_hedged_requests
+                done, _ = await asyncio.wait(
+                    in_flight.keys(),
+                    timeout=self.hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # the hedge timer fired with every request still outstanding
+                    launch_next()
+                    continue
+                for task in done:
+                    mirror = in_flight.pop(task)
+                    try:
+                        return_value = task.result()
+                    except Exception as e:
+                        print(
+                            f"failed to run: retry {retries}, mirror: {mirror} with error '{str(e)}'",
+                            flush=True,
+                        )
+                        retries += 1
+                        last_error = e
+                        launch_next()
+                        continue
+                    return return_value
+        finally:
+            for task in in_flight:
+                task.cancel()
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+        raise Exception(f"failed after {retries} retries: {last_error}")
+
+    def get_current_mirror(self) -> str:
+        """
+        the mirror a request without an explicit mirror goes to: the healthiest one right now.
+        """
+        return self.ordered_mirrors()[0]
 
     def get_esgf_url_with_current_mirror(self) -> str:
-        mirror = self.search_mirrors[self.current_mirror_index]
+        mirror = self.get_current_mirror()
         return f"{mirror}/search"
 
-    def get_facet_possiblities(self):
+    def load_cached_facets(self, seed_file: Optional[str]) -> Optional[dict[str, list[str]]]:
+        """
+        reads the facet table from disk, seeding the cache first when a seed file is given
+        that is newer than what is cached.
+        """
+        facets = self.facet_cache.load()
+        if facets is None and not seed_file and self.local_index_ready():
+            print("building esgf facet table from the local index", flush=True)
+            facets = self.local_index.facet_values(SEARCH_FACETS)
+            self.facet_cache.save(facets, self.local_index.harvested_at)
+        if seed_file:
+            try:
+                seed_is_newer = (
+                    self.facet_cache.fetched_at is None
+                    or os.path.getmtime(seed_file) > self.facet_cache.fetched_at
+                )
+                if facets is None or seed_is_newer:
+                    print(f"seeding esgf facet cache from {seed_file}", flush=True)
+                    facets = self.facet_cache.seed(seed_file)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"failed to read esgf facet seed file {seed_file}, ignoring it: {e}", flush=True)
+        return facets
+
+    def schedule_facet_refresh(self):
+        """
+        refreshes the facet table in the background if an event loop is running. otherwise the
+        refresh happens on the first search that needs facets.
+        """
+        if self.facet_refresh_task is not None and not self.facet_refresh_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.facet_refresh_task = loop.create_task(self.refresh_facets())
+
+    async def refresh_facets(self):
+        try:
+            await self.with_all_available_mirrors(self.get_facet_possiblities)
+        except Exception as e:
+            print(f"failed to refresh esgf facets, keeping cached copy: {e}", flush=True)
+
+    async def ensure_facet_possibilities(self) -> dict[str, list[str]]:
+        if self.facet_possibilities is None:
+            if self.facet_refresh_task is None or self.facet_refresh_task.done():
+                await self.with_all_available_mirrors(self.get_facet_possiblities)
+            else:
+                await self.facet_refresh_task
+            if self.facet_possibilities is None:
+                raise Exception("esgf facets are unavailable: no cached copy and every mirror failed")
+        elif self.facet_cache.is_stale() and default_settings.facet_auto_refresh:
+            self.schedule_facet_refresh()
+        return self.facet_possibilities
+
+    async def get_facet_possiblities(self, mirror: Optional[str] = None):
         query = {
             "project": "CMIP6",
             "facets": ",".join(SEARCH_FACETS),
             "limit": "0",
             "format": "application/solr+json",
         }
-        base_url = self.get_esgf_url_with_current_mirror()
-        response = requests.get(base_url, params=query)
+        response = await self.request(mirror or self.get_current_mirror(), query)
         if response.status_code >= 300:
             msg = f"failed to fetch available facets: {response.status_code}, {response.content}"
             raise Exception(msg)
         facets = response.json()
-        self.facet_possibilities = facets["facet_counts"]["facet_fields"]
-        for facet, terms in self.facet_possibilities.items():
-            self.facet_possibilities[facet] = terms[0::2]
+        facet_possibilities = facets["facet_counts"]["facet_fields"]
+        for facet, terms in facet_possibilities.items():
+            facet_possibilities[facet] = terms[0::2]
+        self.facet_possibilities = facet_possibilities
+        self.facet_cache.save(facet_possibilities)
 
-    async def search(self, query: str, page: int, keywords: bool) -> dict[str, Any]:
+    async def search(
+        self,
+        query: str,
+        page: int,
+        keywords: bool,
+        early_results: Optional[EarlyResultsCallback] = None,
+    ) -> dict[str, Any]:
         """
         converts a natural language query to a list of ESGF dataset
         metadata dictionaries by running a lucene query against the given
-        ESGF node in settings.
+        ESGF node in settings. results are plain json documents, as solr returns them.
 
         keywords: pass keywords directly to ESGF with no LLM in the middle
+        early_results: called with the speculative keyword search results if they arrive before the LLM
         """
         if keywords:
             print(f"keyword searching for {query}", flush=True)
-            return self.keyword_search(query, page)
-        return await self.natural_language_search(query, page)
-
-    def get_all_access_paths_by_id(self, dataset_id: str) -> AccessURLs:
-        return [
-            self.with_all_available_mirrors(self.get_access_paths_by_id, id)
-            for id in self.with_all_available_mirrors(
-                self.get_mirrors_for_dataset, dataset_id
-            )
-        ]
+            return await self.keyword_search(query, page)
+        return await self.natural_language_search(query, page, early_results=early_results)
+
+    async def get_all_access_paths_by_id(self, dataset_id: str) -> AccessURLs:
+        listings = await self.get_replica_file_listings(dataset_id)
+        return [self.access_paths_from_files(files) for files in listings.values()]
+
+    async def get_replica_file_listings(self, dataset_id: str) -> dict[str, list[dict[str, Any]]]:
+        """
+        returns the file listing of every replica of a dataset, keyed by full replica id.
+        listings are fetched concurrently, at most `replica_concurrency` at a time.
+        """
+        replica_ids = await self.with_all_available_mirrors(
+            self.get_mirrors_for_dataset, dataset_id
+        )
+        listings = await self.gather_bounded(
+            self.with_all_available_mirrors(self.get_datasets_from_id, replica_id)
+            for replica_id in replica_ids
+        )
+        return dict(zip(replica_ids, listings))
 
-    def get_mirrors_for_dataset(self, dataset_id: str) -> list[str]:
+    async def get_mirrors_for_dataset(self, dataset_id: str, mirror: Optional[str] = None) -> list[str]:
         # strip vert bar if provided with example mirror attached
         dataset_id = dataset_id.split("|")[0]
-        response = self.run_esgf_dataset_query(f"id:{dataset_id}*", 1, {})
+        response = await self.run_esgf_dataset_query(f"id:{dataset_id}*", 1, {}, mirror=mirror)
         full_ids = [d["id"] for d in response]
         return full_ids
 
-    def get_datasets_from_id(self, dataset_id: str) -> list[dict[str, Any]]:
+    async def get_datasets_from_id(
+        self, dataset_id: str, mirror: Optional[str] = None
+    ) -> list[dict[str, Any]]:
         """
         returns a list of datasets for a given ID. includes mirrors.
+
+        walks every page of the file search, so large datasets are not truncated.
         """
         if dataset_id == "":
             return []
-        params = urlencode(
-            {
-                "type": "File",
-                "format": "application/solr+json",
-                "dataset_id": dataset_id,
-                "limit": 200,
-            }
-        )
-        base_url = self.get_esgf_url_with_current_mirror()
-        full_url = f"{base_url}?{params}"
-        r = requests.get(full_url)
+        cached = self.query_cache.get(self.file_listing_cache_key(dataset_id))
+        if cached is not None:
+            return cached
+        mirror = mirror or self.get_current_mirror()
+
+        async def fetch() -> list[dict[str, Any]]:
+            datasets = []
+            offset = 0
+            while True:
+                page, total = await self.get_file_page(dataset_id, offset, mirror=mirror)
+                datasets.extend(page)
+                offset += len(page)
+                if not page or offset >= total:
+                    break
+            self.cache_file_listing(dataset_id, datasets)
+            return datasets
+
+        return await self.in_flight.do(f"{self.file_listing_cache_key(dataset_id)}@{mirror}", fetch)
+
+    async def iter_dataset_files(self, dataset_id: str) -> AsyncIterator[dict[str, Any]]:
+        """
+        yields every file record of a dataset as its page arrives. the next page is requested
+        while the current one is being consumed, and each page fails over between mirrors on
+        its own.
+        """
+        if dataset_id == "":
+            return
+        cached = self.query_cache.get(self.file_listing_cache_key(dataset_id))
+        if cached is not None:
+            for file in cached:
+                yield file
+            return
+
+        def fetch(offset: int) -> asyncio.Task:
+            return asyncio.ensure_future(
+                self.with_all_available_mirrors(self.get_file_page, dataset_id, offset)
+            )
+
+        datasets = []
+        next_page = fetch(0)
+        try:
+            while next_page is not None:
+                page, total = await next_page
+                offset = len(datasets) + len(page)
+                next_page = fetch(offset) if page and offset < total else None
+                datasets.extend(page)
+                for file in page:
+                    yield file
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+        self.cache_file_listing(dataset_id, datasets)
+
+    async def get_file_page(
+        self, dataset_id: str, offset: int, mirror: Optional[str] = None
+    ) -> tuple[list[dict[str, Any]], int]:
+        """
+        returns one page of a dataset's file search along with the total number of files.
+        """
+        params = {
+            "type": "File",
+            "format": "application/solr+json",
+            "dataset_id": dataset_id,
+            "limit": default_settings.file_page_size,
+            "offset": offset,
+        }
+        r = await self.request(mirror or self.get_current_mirror(), params)
+        full_url = str(r.url)
         response = r.json()
         if r.status_code != 200:
             raise ConnectionError(
                 f"Failed to extract files from dataset via file search: {full_url} {response}"
             )
         datasets = response["response"]["docs"]
-        if len(datasets) == 0:
+        if offset == 0 and len(datasets) == 0:
             raise ConnectionError(
                 f"Failed to extract files from dataset: empty list {full_url}"
             )
-        return datasets
+        return datasets, response["response"].get("numFound", offset + len(datasets))
+
+    def file_listing_cache_key(self, dataset_id: str) -> str:
+        return QueryCache.key_for("files", dataset_id=dataset_id)
+
+    def cache_file_listing(self, dataset_id: str, datasets: list[dict[str, Any]]):
+        ttl = (
+            default_settings.versioned_listing_cache_ttl
+            if VERSIONED_DATASET_ID.search(dataset_id)
+            else default_settings.query_cache_ttl
+        )
+        self.query_cache.put(self.file_listing_cache_key(dataset_id), datasets, ttl)
 
-    def get_access_paths_by_id(self, dataset_id: str) -> dict[str, list[str]]:
+    async def get_access_paths_by_id(
+        self, dataset_id: str, mirror: Optional[str] = None
+    ) -> dict[str, list[str]]:
         """
         returns a list of OPENDAP URLs for use in processing given a dataset.
         """
-        files = self.get_datasets_from_id(dataset_id)
+        files = await self.get_datasets_from_id(dataset_id, mirror=mirror)
+        return self.access_paths_from_files(files)
 
+    async def iter_access_paths_by_id(self, dataset_id: str) -> AsyncIterator[dict[str, list[str]]]:
+        """
+        streams the OPENDAP and HTTP urls of each file in a dataset as the listing is paged in,
+        so a downloader can start before the full listing is known.
+        """
+        async for file in self.iter_dataset_files(dataset_id):
+            yield self.access_paths_from_files([file])
+
+    @staticmethod
+    def access_paths_from_files(files: list[dict[str, Any]]) -> dict[str, list[str]]:
+        """
+        splits the urls of a file listing into OPENDAP and HTTP access paths.
+        """
         # file url responses are lists of strings with their protocols separated by |
         # e.x. https://esgf-node.example|mimetype|OPENDAP
         def select(files, selector):
@@ -252,60 +1046,156 @@ class ESGFProvider():
 
         return {"opendap": opendap_urls, "http": http_urls}
 
-    def get_metadata_for_dataset(self, dataset_id: str) -> dict[str, Any]:
+    async def get_metadata_for_dataset(self, dataset_id: str) -> dict[str, Any]:
         """
         returns a list of OPENDAP URLs for use in processing given a dataset.
         """
-        datasets = self.get_datasets_from_id(dataset_id)
+        datasets = await self.with_all_available_mirrors(self.get_datasets_from_id, dataset_id)
         if len(datasets) == 0:
             msg = "no datasets found for given ID"
             raise ValueError(msg)
         return datasets[0]
 
-    def get_access_paths(self, dataset) -> AccessURLs:
-        return self.get_all_access_paths_by_id(dataset["id"])
+    async def get_access_paths(self, dataset) -> AccessURLs:
+        return await self.get_all_access_paths_by_id(dataset["id"])
 
-    def keyword_search(self, query: str, page: int) -> dict[str, Any]:
+    async def keyword_search(self, query: str, page: int) -> dict[str, Any]:
         """
         converts a list of keywords to an ESGF query and runs it against the node.
         """
+        lucene_query = self.keyword_query(query)
+        datasets = datasets_to_json(await self.search_datasets(lucene_query, page))
+        if lucene_query == query:
+            return {"query": {"raw": query}, "results": datasets}
+        return {
+            "query": {
+                "original": query,
+                "raw": lucene_query,
+            },
+            "results": datasets,
+        }
+
+    def keyword_query(self, query: str) -> str:
+        """
+        the lucene query a keyword search sends: raw lucene is passed through, plain keywords are ANDed.
+        """
         lucene_query_statements = ["AND", "OR", "(", ")"]
         if any([query.find(substring) != -1 for substring in lucene_query_statements]):
-            datasets = self.run_esgf_dataset_query(query, page, options={})
-            return {"query": {"raw": query}, "results": datasets}
-        else:
-            stripped_query = re.sub(r"[^A-Za-z0-9 ]+", "", query)
-            lucene_query = " AND ".join(stripped_query.split(" "))
-            datasets = self.run_esgf_dataset_query(lucene_query, page, options={})
-            return {
-                "query": {
-                    "original": query,
-                    "raw": lucene_query,
-                },
-                "results": datasets,
-            }
+            return query
+        stripped_query = re.sub(r"[^A-Za-z0-9 ]+", "", query)
+        return " AND ".join(stripped_query.split(" "))
+
+    def worth_speculating(self, search_query: str) -> bool:
+        """
+        whether a keyword search could stand in for the translated query: only when the
+        translation isn't cached and every keyword is some facet value.
+        """
+        if self.facet_possibilities is None or self.translation_is_cached(search_query):
+            return False
+        self.get_facet_derivatives(self.facet_possibilities)
+        keywords = search_query.split()
+        return bool(keywords) and all(keyword_of(keyword) in self.facet_keywords for keyword in keywords)
 
     async def natural_language_search(
-        self, search_query: str, page: int, retries=0
+        self,
+        search_query: str,
+        page: int,
+        retries=0,
+        early_results: Optional[EarlyResultsCallback] = None,
     ) -> dict[str, Any]:
         """
         converts to natural language and runs the result against the ESGF node, returning a list of datasets.
+
+        with `speculative_search` on, a keyword search on the raw query is started alongside the
+        LLM when the query is made of facet values. if the translated query turns out to be
+        equivalent, its results are returned without a second ESGF round trip.
         """
-        search_terms_json = await self.process_natural_language(search_query)
-        search_terms_json = re.sub(r'`', '', search_terms_json)
+        speculative = None
+        if default_settings.speculative_search and self.worth_speculating(search_query):
+            speculative = asyncio.ensure_future(
+                self.speculative_keyword_search(search_query, page, early_results)
+            )
         try:
-            search_terms = json.loads(search_terms_json)
+            search_terms = await self.translate_natural_language(search_query, retries)
         except ValueError as e:
-            print(
-                f"openAI returned more than just json, retrying query... \n {e} {search_terms_json}"
-            )
-            if retries >= 3:
-                print("openAI returned non-json in multiple retries, exiting")
-                return {
-                    "error": f"openAI returned non-json in multiple retries. raw text: {search_terms_json}"
-                }
-            return await self.natural_language_search(search_query, page, retries + 1)
-        query = " AND ".join(
+            self.discard_speculation(speculative)
+            return {"error": str(e)}
+        query = self.build_query_from_search_terms(search_terms)
+
+        if speculative is not None:
+            speculative_query = self.keyword_query(search_query)
+            if canonicalize_lucene_query(speculative_query) == canonicalize_lucene_query(query):
+                try:
+                    speculative_response = await speculative
+                    return {
+                        "query": {"raw": query, "search_terms": search_terms},
+                        "results": speculative_response["results"],
+                    }
+                except Exception as e:
+                    print(f"speculative search failed, searching again: {e}", flush=True)
+            else:
+                self.discard_speculation(speculative)
+
+        datasets = datasets_to_json(await self.search_datasets(query, page))
+        return {
+            "query": {"raw": query, "search_terms": search_terms},
+            "results": datasets,
+        }
+
+    async def speculative_keyword_search(
+        self, search_query: str, page: int, early_results: Optional[EarlyResultsCallback]
+    ) -> dict[str, Any]:
+        response = await self.keyword_search(search_query, page)
+        if early_results is not None:
+            reported = early_results(response | {"speculative": True})
+            if inspect.isawaitable(reported):
+                await reported
+        return response
+
+    def discard_speculation(self, speculative: Optional[asyncio.Future]):
+        if speculative is None:
+            return
+        speculative.cancel()
+        # retrieve the outcome so a failed speculation isn't reported as unhandled
+        speculative.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    def translation_is_cached(self, search_query: str) -> bool:
+        if self.facet_possibilities is None:
+            return False
+        vocabulary, _ = self.get_facet_derivatives(self.facet_possibilities)
+        return self.translation_cache.contains(search_query, vocabulary)
+
+    async def translate_natural_language(self, search_query: str, retries=0) -> dict[str, Any]:
+        """
+        returns the LLM's search terms for a query, reusing a previous translation of the same
+        (normalized) query made against the current facet vocabulary when there is one.
+        """
+        vocabulary = self.get_facet_derivatives(await self.ensure_facet_possibilities())[0]
+        search_terms = self.translation_cache.get(search_query, vocabulary)
+        if search_terms is not None:
+            print(f"reusing cached translation for '{search_query}'", flush=True)
+            return search_terms
+        while True:
+            search_terms_json = await self.process_natural_language(search_query)
+            search_terms_json = re.sub(r'`', '', search_terms_json)
+            try:
+                search_terms = json.loads(search_terms_json)
+                break
+            except ValueError as e:
+                print(
+                    f"openAI returned more than just json, retrying query... \n {e} {search_terms_json}"
+                )
+                if retries >= 3:
+                    print("openAI returned non-json in multiple retries, exiting")
+                    raise ValueError(
+                        f"openAI returned non-json in multiple retries. raw text: {search_terms_json}"
+                    )
+                retries += 1
+        self.translation_cache.put(search_query, vocabulary, search_terms)
+        return search_terms
+
+    def build_query_from_search_terms(self, search_terms: dict[str, Any]) -> str:
+        return " AND ".join(
             [
                 (
                     search_term.strip()
@@ -321,13 +1211,6 @@ class ESGFProvider():
                 )
             ]
         )
-        datasets = self.with_all_available_mirrors(
-            self.run_esgf_dataset_query, query, page, options={}
-        )
-        return {
-            "query": {"raw": query, "search_terms": search_terms},
-            "results": datasets,
-        }
 
     def build_natural_language_prompt(self, search_query: str) -> str:
         """
@@ -340,23 +1223,102 @@ class ESGFProvider():
         runs query against LLM and returns the result string.
         """
         prompt = generate_natural_language_system_prompt(
-            self.facet_possibilities
+            self.get_prompt_facets(await self.ensure_facet_possibilities(), search_query)
         )
         query = self.build_natural_language_prompt(search_query)
         return await self.agent_fn(prompt, query)
-        
 
-    def run_esgf_dataset_query(
-        self, query_string: str, page: int, options: dict[str, str]
+    def get_facet_derivatives(self, facets: dict[str, list[str]]) -> tuple[str, FacetRetriever]:
+        """
+        returns the vocabulary fingerprint and retrieval index for a facet table, building
+        them only when the table has changed since the last call.
+        """
+        if self.facet_derivatives_source is not facets:
+            self.facet_vocabulary = vocabulary_fingerprint(facets)
+            self.facet_retriever = FacetRetriever(facets)
+            self.facet_keywords = {
+                keyword_of(value) for values in facets.values() for value in values
+            }
+            self.facet_derivatives_source = facets
+        return self.facet_vocabulary, self.facet_retriever
+
+    def get_prompt_facets(self, facets: dict[str, list[str]], search_query: str) -> dict[str, list[str]]:
+        """
+        narrows each facet in the prompt to the values most plausibly referenced by the query.
+        """
+        k = default_settings.facet_candidates_per_facet
+        if k <= 0:
+            return facets
+        _, retriever = self.get_facet_derivatives(facets)
+        return retriever.candidates(search_query, k)
+
+
+    def search_local_index(self, query_string: str, page: int) -> Optional[DatasetSearchResults]:
+        """
+        one page of a dataset search from the local index, or None when the index isn't ready
+        or can't run the query.
+        """
+        if not self.local_index_ready():
+            return None
+        try:
+            documents, _ = self.local_index.search(
+                query_string,
+                offset=default_settings.entries_per_page * (page - 1),
+                limit=default_settings.entries_per_page,
+                count=False,
+            )
+        except UnsupportedQuery as e:
+            print(f"answering from ESGF, local index can't run '{query_string}': {e}", flush=True)
+            return None
+        return decode_datasets(documents)
+
+    async def search_datasets(self, query_string: str, page: int) -> DatasetSearchResults:
+        """
+        a plain dataset search, answered from the local index when it can be and otherwise
+        from the mirrors. replica and file lookups always go to the mirrors.
+        """
+        page = max(1, int(page))
+        datasets = self.search_local_index(query_string, page)
+        if datasets is not None:
+            return datasets
+        return await self.with_all_available_mirrors(
+            self.run_esgf_dataset_query, query_string, page, options={}
+        )
+
+    async def run_esgf_dataset_query(
+        self,
+        query_string: str,
+        page: int,
+        options: dict[str, str],
+        mirror: Optional[str] = None,
+        fields: Optional[list[str]] = None,
     ) -> DatasetSearchResults:
         """
         runs the formatted apache lucene query against the ESGF node and returns the metadata in datasets.
+
+        fields: solr fields to request, defaults to `dataset_fields` in settings. `["*"]` requests everything.
         """
-        encoded_string = urlencode(
+        page = max(1, int(page))
+        requested_fields = projection(
+            fields if fields is not None else default_settings.dataset_fields.split(",")
+        )
+        cache_key = QueryCache.key_for(
+            "datasets",
+            query=canonicalize_lucene_query(query_string),
+            page=page,
+            page_size=default_settings.entries_per_page,
+            options=options,
+            fields=requested_fields,
+        )
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return decode_datasets(cached)
+        mirror = mirror or self.get_current_mirror()
+        params = (
             {
                 "query": query_string,
                 "project": "CMIP6",
-                "fields": "*",
+                "fields": requested_fields,
                 "latest": "true",
                 "sort": "true",
                 "limit": f"{default_settings.entries_per_page}",
@@ -367,22 +1329,17 @@ class ESGFProvider():
             | options
         )
 
-        base_url = self.get_esgf_url_with_current_mirror()
-        full_url = f"{base_url}?{encoded_string}"
-        r = requests.get(full_url)
-        if r.status_code != 200:
-            error = str(r.content)
-            raise ConnectionError(
-                f"Failed to search against ESGF node: {full_url}: error from node upstream is: {r.status_code} {error}"
-            )
-        response = r.json()
-
-        # parallel over datasets, but delay fetching url until needed
-        return dask.compute(
-            [
-                dask.delayed(lambda id: id)(
-                    metadata,
+        async def fetch() -> DatasetSearchResults:
+            r = await self.request(mirror, params)
+            full_url = str(r.url)
+            if r.status_code != 200:
+                error = str(r.content)
+                raise ConnectionError(
+                    f"Failed to search against ESGF node: {full_url}: error from node upstream is: {r.status_code} {error}"
                 )
-                for metadata in response["response"]["docs"]
-            ]
-        )[0]
+            datasets = decode_datasets(r.json()["response"]["docs"])
+            self.query_cache.put(cache_key, datasets_to_json(datasets), default_settings.query_cache_ttl)
+            return datasets
+
+        # callers share the records but each gets its own list
+        return list(await self.in_flight.do(f"{cache_key}@{mirror}", fetch))
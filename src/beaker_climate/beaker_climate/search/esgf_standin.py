@@ -0,0 +1,437 @@
+"""
+local stand-in for ESGF index nodes, for measuring search performance without touching
+production mirrors.
+
+every mirror is served from one local http server under its own path prefix
+(`http://127.0.0.1:<port>/<mirror>/esg-search/search`), and each mirror can be given its
+own latency, jitter, error rate or be dead altogether (connections are dropped without a
+response). requests are answered from recorded `application/solr+json` responses when one
+matches, and otherwise from a local dataset index, either harvested from ESGF with
+`esgf_index` or generated synthetically. file listings are synthesized from the datasets'
+`number_of_files`.
+
+run a stand-in with:
+
+    python -m beaker_climate.beaker_climate.search.esgf_standin --mirrors a,b,c --latency 0.2 --dead b
+
+and point the provider at the urls it prints through ESGF_URL and ESGF_FALLBACKS. with
+`--upstream` requests that have no recording are forwarded to a real node and recorded.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+
+from .esgf_cache import read_compact_json, write_compact_json
+from .esgf_index import FACET_FIELDS, LocalDatasetIndex, UnsupportedQuery
+
+# parameters that don't change what a search returns, left out when matching recordings
+IGNORED_PARAMS = {"format", "distrib", "shards"}
+
+
+@dataclass
+class MirrorBehavior:
+    latency: float = 0.0
+    jitter: float = 0.0
+    # share of requests answered with a 503
+    error_rate: float = 0.0
+    # dead mirrors drop every connection without answering
+    dead: bool = False
+
+
+class ESGFStandIn:
+    """
+    threaded http server that impersonates a set of ESGF index nodes.
+    """
+
+    def __init__(
+        self,
+        mirrors: dict[str, MirrorBehavior],
+        index: Optional[LocalDatasetIndex] = None,
+        recordings: Optional[str] = None,
+        upstream: Optional[str] = None,
+        port: int = 0,
+        seed: int = 0,
+    ):
+        self.mirrors = mirrors
+        self.index = index
+        self.recordings_path = recordings
+        self.upstream = upstream
+        self.recordings: dict[str, Any] = {}
+        if recordings and os.path.exists(recordings):
+            self.recordings = read_compact_json(recordings)["responses"]
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # the sqlite connection is shared by the handler threads
+        self.index_lock = threading.Lock()
+        self.requests: dict[str, int] = {mirror: 0 for mirror in mirrors}
+        self.errors: dict[str, int] = {mirror: 0 for mirror in mirrors}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def url_for(self, mirror: str) -> str:
+        return f"http://127.0.0.1:{self.port}/{mirror}/esg-search"
+
+    def urls(self) -> list[str]:
+        return [self.url_for(mirror) for mirror in self.mirrors]
+
+    def start(self) -> "ESGFStandIn":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+        self.save_recordings()
+
+    def __enter__(self) -> "ESGFStandIn":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_counters(self):
+        with self.lock:
+            for mirror in self.mirrors:
+                self.requests[mirror] = 0
+                self.errors[mirror] = 0
+
+    def total_requests(self) -> int:
+        with self.lock:
+            return sum(self.requests.values())
+
+    def save_recordings(self):
+        if self.recordings_path and self.upstream:
+            write_compact_json(self.recordings_path, {"responses": self.recordings})
+
+    @staticmethod
+    def recording_key(params: dict[str, str]) -> str:
+        return json.dumps(
+            sorted((key, value) for key, value in params.items() if key not in IGNORED_PARAMS),
+            separators=(",", ":"),
+        )
+
+    def handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes, don't let nagle delay the body
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                parts = url.path.strip("/").split("/")
+                mirror = parts[0] if parts else ""
+                behavior = standin.mirrors.get(mirror)
+                if behavior is None or parts[1:] != ["esg-search", "search"]:
+                    return self.reply(404, {"error": f"unknown endpoint {url.path}"})
+                with standin.lock:
+                    standin.requests[mirror] += 1
+                    delay = behavior.latency + standin.random.uniform(0, behavior.jitter)
+                    fail = standin.random.random() < behavior.error_rate
+                if behavior.dead:
+                    self.close_connection = True
+                    return
+                time.sleep(delay)
+                if fail:
+                    with standin.lock:
+                        standin.errors[mirror] += 1
+                    return self.reply(503, {"error": "injected failure"})
+                try:
+                    status, document = standin.respond(dict(parse_qsl(url.query)))
+                except Exception as e:
+                    status, document = 500, {"error": str(e)}
+                self.reply(status, document)
+
+            def reply(self, status: int, document: dict[str, Any]):
+                body = json.dumps(document).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/solr+json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up on the request, e.g. a cancelled hedge
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def respond(self, params: dict[str, str]) -> tuple[int, dict[str, Any]]:
+        key = self.recording_key(params)
+        recorded = self.recordings.get(key)
+        if recorded is not None:
+            return 200, recorded
+        if self.upstream:
+            r = httpx.get(f"{self.upstream}/search", params=params, timeout=60)
+            if r.status_code == 200:
+                with self.lock:
+                    self.recordings[key] = r.json()
+            return r.status_code, r.json()
+        if self.index is None:
+            return 404, {"error": "no recording matches the request and no index to answer from"}
+        try:
+            with self.index_lock:
+                if params.get("type") == "File":
+                    return 200, self.search_files(params)
+                return 200, self.search_datasets(params)
+        except UnsupportedQuery as e:
+            return 400, {"error": str(e)}
+
+    def dataset_query(self, params: dict[str, str]) -> str:
+        """
+        the lucene query plus any plain facet constraints passed as parameters.
+        """
+        query = params.get("query", "")
+        clauses = [] if query in ("", "*", "*:*") else [f"({query})"]
+        for facet in FACET_FIELDS:
+            if facet in params and " " not in params[facet]:
+                clauses.append(f"{facet}:{params[facet]}")
+        return " AND ".join(clauses)
+
+    def search_datasets(self, params: dict[str, str]) -> dict[str, Any]:
+        query = self.dataset_query(params)
+        latest_only = params.get("latest", "true").lower() != "false"
+        limit = int(params.get("limit", "10"))
+        offset = int(params.get("offset", "0"))
+        documents, total = self.index.search(query, offset=offset, limit=limit, latest_only=latest_only)
+        fields = params.get("fields", "*")
+        if fields != "*":
+            wanted = fields.split(",")
+            documents = [{key: d[key] for key in wanted if key in d} for d in documents]
+        response: dict[str, Any] = {
+            "responseHeader": {"status": 0, "params": params},
+            "response": {"numFound": total, "start": offset, "docs": documents},
+        }
+        if params.get("facets"):
+            counts = self.index.facet_counts(query, params["facets"].split(","), latest_only)
+            response["facet_counts"] = {
+                "facet_fields": {
+                    facet: [item for pair in values.items() for item in pair]
+                    for facet, values in counts.items()
+                }
+            }
+        return response
+
+    def search_files(self, params: dict[str, str]) -> dict[str, Any]:
+        if "dataset_id" in params:
+            dataset_ids = [params["dataset_id"]]
+        else:
+            dataset_ids = re.findall(r'"((?:[^"\\]|\\.)*)"', params.get("query", ""))
+        files = []
+        for dataset_id in dataset_ids:
+            row = self.index.connection.execute(
+                "SELECT document FROM datasets WHERE id = ?", (dataset_id,)
+            ).fetchone()
+            if row is not None:
+                files.extend(synthetic_files(json.loads(row[0])))
+        limit = int(params.get("limit", "10"))
+        offset = int(params.get("offset", "0"))
+        return {
+            "responseHeader": {"status": 0, "params": params},
+            "response": {"numFound": len(files), "start": offset, "docs": files[offset : offset + limit]},
+        }
+
+
+def synthetic_files(dataset: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    the file records of a dataset, with the HTTPServer and OPENDAP urls ESGF returns.
+    """
+    instance_id = dataset.get("instance_id") or dataset["id"].split("|")[0]
+    data_node = dataset.get("data_node", "localhost")
+    path = instance_id.replace(".", "/")
+    stem = "_".join(
+        str(dataset.get(facet, "unknown"))
+        for facet in ("variable_id", "table_id", "source_id", "experiment_id", "member_id", "grid_label")
+    )
+    count = int(dataset.get("number_of_files") or 1)
+    size = int(dataset.get("size") or 0) // count
+    files = []
+    for i in range(count):
+        start, stop = 1850 + 50 * i, 1850 + 50 * i + 49
+        name = f"{stem}_{start}01-{stop}12.nc"
+        files.append(
+            {
+                "id": f"{instance_id}.{name}|{data_node}",
+                "dataset_id": dataset["id"],
+                "instance_id": f"{instance_id}.{name}",
+                "master_id": f"{dataset.get('master_id', instance_id)}.{name}",
+                "title": name,
+                "data_node": data_node,
+                "size": size,
+                "url": [
+                    f"http://{data_node}/thredds/fileServer/{path}/{name}|application/netcdf|HTTPServer",
+                    f"http://{data_node}/thredds/dodsC/{path}/{name}.html|application/opendap-html|OPENDAP",
+                ],
+                **{facet: dataset[facet] for facet in FACET_FIELDS if facet in dataset},
+            }
+        )
+    return files
+
+
+SYNTHETIC_FACETS = {
+    "activity_id": ["CMIP", "ScenarioMIP", "HighResMIP", "DAMIP", "PMIP"],
+    "institution_id": ["NCAR", "NOAA-GFDL", "MOHC", "IPSL", "MPI-M", "CNRM-CERFACS", "MIROC"],
+    "source_id": ["CESM2", "GFDL-ESM4", "UKESM1-0-LL", "IPSL-CM6A-LR", "MPI-ESM1-2-HR", "CNRM-CM6-1", "MIROC6"],
+    "experiment_id": ["historical", "ssp126", "ssp245", "ssp585", "piControl", "abrupt-4xCO2", "amip"],
+    "member_id": ["r1i1p1f1", "r2i1p1f1", "r3i1p1f1", "r1i1p1f2"],
+    "table_id": ["Amon", "day", "Omon", "Lmon", "SImon"],
+    "grid_label": ["gn", "gr", "gr1"],
+    "nominal_resolution": ["100 km", "250 km", "50 km"],
+    "frequency": ["mon", "day"],
+}
+SYNTHETIC_VARIABLES = {
+    "tas": "Near-Surface Air Temperature",
+    "pr": "Precipitation",
+    "psl": "Sea Level Pressure",
+    "ua": "Eastward Wind",
+    "va": "Northward Wind",
+    "huss": "Near-Surface Specific Humidity",
+    "tos": "Sea Surface Temperature",
+    "siconc": "Sea-Ice Area Percentage",
+}
+SYNTHETIC_DATA_NODES = [
+    "esgf-data1.llnl.gov",
+    "esgf.ceda.ac.uk",
+    "esgf-data.dkrz.de",
+    "esgf.nci.org.au",
+    "vesg.ipsl.upmc.fr",
+]
+
+
+def build_synthetic_index(
+    path: str, datasets: int = 2000, replicas: int = 3, seed: int = 0
+) -> LocalDatasetIndex:
+    """
+    a reproducible index of made up CMIP6 datasets, each held by `replicas` data nodes.
+    """
+    rng = random.Random(seed)
+    index = LocalDatasetIndex(path)
+    documents = []
+    seen = set()
+    while len(seen) < datasets:
+        facets = {facet: rng.choice(values) for facet, values in SYNTHETIC_FACETS.items()}
+        variable_id = rng.choice(list(SYNTHETIC_VARIABLES))
+        master_id = ".".join(
+            [
+                "CMIP6",
+                facets["activity_id"],
+                facets["institution_id"],
+                facets["source_id"],
+                facets["experiment_id"],
+                facets["member_id"],
+                facets["table_id"],
+                variable_id,
+                facets["grid_label"],
+            ]
+        )
+        if master_id in seen:
+            continue
+        seen.add(master_id)
+        version = f"2019{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+        number_of_files = rng.randint(1, 12)
+        nodes = rng.sample(SYNTHETIC_DATA_NODES, min(replicas, len(SYNTHETIC_DATA_NODES)))
+        for replica, data_node in enumerate(nodes):
+            instance_id = f"{master_id}.v{version}"
+            documents.append(
+                facets
+                | {
+                    "id": f"{instance_id}|{data_node}",
+                    "instance_id": instance_id,
+                    "master_id": master_id,
+                    "title": instance_id,
+                    "data_node": data_node,
+                    "replica": replica > 0,
+                    "latest": True,
+                    "version": version,
+                    "_timestamp": f"{version[:4]}-{version[4:6]}-{version[6:]}T00:00:00Z",
+                    "size": number_of_files * rng.randint(10, 500) * 1024 * 1024,
+                    "number_of_files": number_of_files,
+                    "mip_era": "CMIP6",
+                    "variable_id": variable_id,
+                    "variant_label": facets["member_id"],
+                    "variable_long_name": SYNTHETIC_VARIABLES[variable_id],
+                    "realm": "ocean" if facets["table_id"] == "Omon" else "atmos",
+                    "datetime_start": "1850-01-16T12:00:00Z",
+                    "datetime_stop": "2014-12-16T12:00:00Z",
+                }
+            )
+    index.upsert(documents)
+    index.set_meta("harvested_at", str(time.time()))
+    index.connection.commit()
+    return index
+
+
+def parse_mirrors(args: argparse.Namespace) -> dict[str, MirrorBehavior]:
+    names = [name for name in args.mirrors.split(",") if name]
+    slow = set(filter(None, args.slow.split(",")))
+    return {
+        name: MirrorBehavior(
+            latency=args.latency * (args.slow_factor if name in slow else 1),
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            dead=name in set(args.dead.split(",")),
+        )
+        for name in names
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve a local stand-in for ESGF index nodes")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--mirrors", default="primary,secondary,tertiary")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--dead", default="", help="comma separated mirrors that drop every connection")
+    parser.add_argument("--slow", default="", help="comma separated mirrors whose latency is multiplied")
+    parser.add_argument("--slow-factor", type=float, default=10.0)
+    parser.add_argument("--index", help="dataset index to answer from, e.g. one harvested with esgf_index")
+    parser.add_argument("--synthetic", type=int, default=2000, help="datasets to generate when no index is given")
+    parser.add_argument("--recordings", help="gzipped json of recorded responses")
+    parser.add_argument("--upstream", help="real index node to forward to and record from")
+    args = parser.parse_args()
+
+    index = LocalDatasetIndex(args.index) if args.index else build_synthetic_index(":memory:", args.synthetic)
+    standin = ESGFStandIn(
+        parse_mirrors(args),
+        index=index,
+        recordings=args.recordings,
+        upstream=args.upstream,
+        port=args.port,
+    )
+    urls = standin.urls()
+    print(f"ESGF_URL={urls[0]}", flush=True)
+    print(f"ESGF_FALLBACKS={','.join(urls[1:])}", flush=True)
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+        standin.save_recordings()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import math
+import re
+from collections import defaultdict
+from typing import Optional
+
+# facets that are listed in the natural language system prompt
+PROMPT_FACETS = [
+    "variable_long_name",
+    "variable_id",
+    "source_id",
+    "experiment_id",
+    "nominal_resolution",
+    "institution_id",
+    "variant_label",
+    "frequency",
+]
+
+
+def tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    character trigrams of each token, padded so that short tokens and word boundaries count.
+    """
+    grams = set()
+    for token in tokenize(text):
+        padded = f"#{token}#"
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FacetIndex:
+    """
+    trigram index over the values of a single facet. values are scored by how much of their
+    (idf weighted) trigram mass appears in the query, with a bonus when the value's tokens
+    occur verbatim in the query. ties fall back to the facet's own order, which for ESGF is
+    by dataset count, so popular values win.
+    """
+
+    def __init__(self, values: list[str]):
+        self.values = values
+        self.postings: dict[str, list[int]] = defaultdict(list)
+        self.value_tokens: list[tuple[str, ...]] = []
+        grams_per_value = []
+        for i, value in enumerate(values):
+            grams = trigrams(value)
+            grams_per_value.append(grams)
+            self.value_tokens.append(tuple(tokenize(value)))
+            for gram in grams:
+                self.postings[gram].append(i)
+        self.idf = {
+            gram: math.log(1 + len(values) / len(postings))
+            for gram, postings in self.postings.items()
+        }
+        self.value_mass = [sum(self.idf[gram] for gram in grams) for grams in grams_per_value]
+
+    def score(self, query: str) -> dict[int, float]:
+        query_tokens = tokenize(query)
+        query_text = f" {' '.join(query_tokens)} "
+        overlap: dict[int, float] = defaultdict(float)
+        for gram in trigrams(query):
+            weight = self.idf.get(gram)
+            if weight is None:
+                continue
+            for i in self.postings[gram]:
+                overlap[i] += weight
+        scores = {}
+        for i, mass in overlap.items():
+            if self.value_mass[i] == 0:
+                continue
+            score = overlap[i] / self.value_mass[i]
+            tokens = self.value_tokens[i]
+            if tokens and f" {' '.join(tokens)} " in query_text:
+                score += 1.0
+            scores[i] = score
+        return scores
+
+    def top_k(self, query: str, k: int, min_score: float = 0.5) -> list[str]:
+        """
+        the k best matching values. if fewer than k values match well, the remainder is
+        filled with the most common values so the LLM still sees sensible defaults.
+        """
+        if len(self.values) <= k:
+            return list(self.values)
+        scores = self.score(query)
+        ranked = sorted(
+            (i for i, score in scores.items() if score >= min_score),
+            key=lambda i: (-scores[i], i),
+        )[:k]
+        chosen = set(ranked)
+        for i in range(len(self.values)):
+            if len(ranked) >= k:
+                break
+            if i not in chosen:
+                ranked.append(i)
+        return [self.values[i] for i in ranked]
+
+
+class FacetRetriever:
+    """
+    picks the most plausible values of each prompt facet for a user query, so the natural
+    language prompt only carries a few candidates instead of the entire CMIP6 vocabulary.
+    """
+
+    def __init__(self, facets: dict[str, list[str]], facet_names: Optional[list[str]] = None):
+        self.indexes = {
+            facet: FacetIndex(facets.get(facet, []))
+            for facet in (facet_names or PROMPT_FACETS)
+        }
+
+    def candidates(self, query: str, k: int) -> dict[str, list[str]]:
+        return {facet: index.top_k(query, k) for facet, index in self.indexes.items()}
@@ -0,0 +1,211 @@
+import logging
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import xarray as xr
+
+from .chunk_planner import DEFAULT_TARGET_CHUNK_BYTES, plan_chunks
+
+logger = logging.getLogger(__name__)
+
+# (west, south, east, north) in degrees
+BBox = Tuple[float, float, float, float]
+TimeRange = Tuple[Optional[str], Optional[str]]
+
+COORDINATE_NAMES = {
+    'latitude': ('lat', 'latitude', 'nav_lat', 'yc'),
+    'longitude': ('lon', 'longitude', 'nav_lon', 'xc'),
+    'time': ('time', 't'),
+}
+# also projected coordinates (e.g. metres) on many grids, so only taken when in degrees
+AMBIGUOUS_NAMES = {'latitude': ('y',), 'longitude': ('x',)}
+COORDINATE_UNITS = {
+    'latitude': ('degrees_north', 'degree_north', 'degrees_n'),
+    'longitude': ('degrees_east', 'degree_east', 'degrees_e'),
+}
+
+
+def in_degrees(coord: xr.DataArray) -> bool:
+    """Whether a coordinate's units or standard_name say it holds latitudes or longitudes."""
+    attrs = coord.attrs
+    return (str(attrs.get('units', '')).lower().startswith('degree')
+            or attrs.get('standard_name') in ('latitude', 'longitude', 'grid_latitude', 'grid_longitude'))
+
+
+def find_coordinate(ds: xr.Dataset, kind: str) -> Optional[str]:
+    """
+    Name of the latitude, longitude or time coordinate of a dataset, recognized by its
+    standard_name, units or axis attributes before falling back to common names.
+    Latitude and longitude found by axis or as 'y'/'x' must be in degrees.
+    """
+    axis = {'latitude': 'Y', 'longitude': 'X', 'time': 'T'}[kind]
+    for name, coord in ds.coords.items():
+        attrs = coord.attrs
+        if attrs.get('standard_name') == kind or str(attrs.get('units', '')).lower() in COORDINATE_UNITS.get(kind, ()):
+            return name
+    for name, coord in ds.coords.items():
+        if coord.attrs.get('axis') == axis and (kind == 'time' or in_degrees(coord)):
+            return name
+    for name, coord in ds.coords.items():
+        if str(name).lower() in COORDINATE_NAMES[kind]:
+            return name
+        if str(name).lower() in AMBIGUOUS_NAMES.get(kind, ()) and in_degrees(coord):
+            return name
+    return None
+
+
+def bbox_mask(lat: xr.DataArray, lon: xr.DataArray, bbox: BBox) -> xr.DataArray:
+    """Where a grid falls inside a bounding box, crossing the antimeridian if west > east."""
+    west, south, east, north = bbox
+    if lat.ndim > 1:
+        # curvilinear grids can have large coordinates, reduce them chunk by chunk
+        lat, lon = lat.chunk(), lon.chunk()
+    mask = (lat >= south) & (lat <= north)
+    if east - west < 360:
+        width = (east - west) % 360
+        mask = mask & (((lon - west) % 360) <= width)
+    return mask
+
+
+def selection(keep: np.ndarray) -> Union[slice, np.ndarray]:
+    """Slice over a contiguous run of kept positions, or the positions themselves."""
+    positions = np.flatnonzero(keep)
+    if positions[-1] - positions[0] + 1 == len(positions):
+        return slice(int(positions[0]), int(positions[-1]) + 1)
+    return positions
+
+
+def subset_dataset(ds: xr.Dataset,
+                   bbox: Optional[BBox] = None,
+                   time_range: Optional[TimeRange] = None,
+                   variables: Optional[Sequence[str]] = None) -> Tuple[xr.Dataset, Dict[str, int]]:
+    """
+    Select variables, a period and a region of a dataset by position.
+
+    Meant for datasets opened without dask chunks (`chunks=None`): the selection is then
+    applied to the lazily indexed store before any dask graph exists, so chunking the result
+    only creates tasks for the chunks that intersect it. Regular and curvilinear grids are
+    supported; on curvilinear grids the index ranges bounding the region are kept.
+
+    Parameters:
+    -----------
+    ds : xr.Dataset
+        Dataset to subset
+    bbox : tuple, optional
+        (west, south, east, north) in degrees. West greater than east crosses the antimeridian
+    time_range : tuple, optional
+        (start, end), inclusive, as anything the time index accepts (e.g. '1990-01'). Either may be None
+    variables : list, optional
+        Data variables to keep; coordinates are kept with them
+
+    Returns:
+    --------
+    Tuple[xr.Dataset, Dict[str, int]]
+        The subset, and the position in the store where each sliced dimension now starts
+    """
+    offsets: Dict[str, int] = {}
+
+    if variables:
+        variables = [variables] if isinstance(variables, str) else list(variables)
+        missing = [v for v in variables if v not in ds.data_vars]
+        if missing:
+            raise KeyError(f"Variables {missing} not in dataset. Available: {list(ds.data_vars)}")
+        ds = ds[variables]
+
+    def take(indexers: Dict[str, Union[slice, np.ndarray]]):
+        nonlocal ds
+        for dim, indexer in indexers.items():
+            if isinstance(indexer, slice):
+                offsets[dim] = offsets.get(dim, 0) + indexer.start
+            else:
+                # a scattered selection no longer lines up with storage chunks
+                offsets.pop(dim, None)
+        ds = ds.isel(indexers)
+
+    if time_range is not None:
+        name = find_coordinate(ds, 'time')
+        if name is None or name not in ds.indexes:
+            raise ValueError(f"No time dimension to select {time_range} on. Coordinates: {list(ds.coords)}")
+        start, end = time_range
+        indexer = ds.indexes[name].slice_indexer(start, end)
+        start, stop, _ = indexer.indices(ds.sizes[name])
+        if stop <= start:
+            raise ValueError(f"Time range {time_range} is outside the dataset's {name} coordinate")
+        take({name: slice(start, stop)})
+
+    if bbox is not None:
+        lat_name, lon_name = find_coordinate(ds, 'latitude'), find_coordinate(ds, 'longitude')
+        if lat_name is None or lon_name is None:
+            raise ValueError("No latitude/longitude coordinates to select a bounding box on. "
+                             f"Coordinates: {list(ds.coords)}")
+        mask = bbox_mask(ds[lat_name], ds[lon_name], bbox)
+        indexers = {}
+        for dim in mask.dims:
+            keep = np.asarray(mask.any([d for d in mask.dims if d != dim]).values)
+            if not keep.any():
+                raise ValueError(f"Bounding box {bbox} doesn't intersect the dataset's grid")
+            indexers[dim] = selection(keep)
+        take(indexers)
+
+    return ds, offsets
+
+
+def open_intake_source(source,
+                       bbox: Optional[BBox] = None,
+                       time_range: Optional[TimeRange] = None,
+                       variables: Optional[Sequence[str]] = None,
+                       target_chunk_bytes: int = DEFAULT_TARGET_CHUNK_BYTES) -> xr.Dataset:
+    """
+    Open an intake catalog entry as a dask backed dataset, subsetting it before chunking.
+
+    Single zarr stores (intake-xarray zarr sources, and intake-esm entries made of one zarr
+    store) are opened lazily and subset before dask chunks are planned. Other sources, and
+    any source when nothing is selected, are opened with `to_dask()` and subset afterwards.
+
+    Parameters:
+    -----------
+    source : intake source
+        Entry of an intake or intake-esm catalog, e.g. `results['name']`
+    bbox, time_range, variables :
+        See `subset_dataset`
+    target_chunk_bytes : int
+        Memory per dask chunk
+
+    Returns:
+    --------
+    xr.Dataset
+        The subset dataset
+    """
+    if bbox is None and time_range is None and not variables:
+        # nothing to push down, the source's own chunks are kept
+        return source.to_dask()
+    store = zarr_store(source)
+    if store is None:
+        ds = source.to_dask()
+        logger.info(f"{type(source).__name__} isn't a single zarr store, subsetting after opening it")
+        return subset_dataset(ds, bbox, time_range, variables)[0]
+
+    url, storage_options, open_kwargs = store
+    open_kwargs = {k: v for k, v in open_kwargs.items() if k != 'chunks'}
+    ds = xr.open_dataset(url, engine='zarr', chunks=None, storage_options=storage_options or None, **open_kwargs)
+    ds, offsets = subset_dataset(ds, bbox, time_range, variables)
+    plan = plan_chunks(ds, target_chunk_bytes, offsets=offsets)
+    logger.info(f"Chunk plan for {url}:\n{plan.report()}")
+    return ds.chunk(plan.dask_chunks())
+
+
+def zarr_store(source) -> Optional[Tuple[str, Dict, Dict]]:
+    """URL, storage options and xarray open arguments of a source backed by one zarr store."""
+    # intake-xarray zarr driver
+    if type(source).__name__ == 'ZarrSource' and isinstance(getattr(source, 'urlpath', None), str):
+        kwargs = dict(getattr(source, 'kwargs', None) or {})
+        return source.urlpath, getattr(source, 'storage_options', None) or {}, kwargs
+    # intake-esm entry
+    df = getattr(source, 'df', None)
+    path_column = getattr(source, 'path_column_name', None)
+    if df is not None and path_column is not None and len(df) == 1 and getattr(source, 'data_format', None) == 'zarr':
+        open_kwargs = dict(getattr(source, 'xarray_open_kwargs', None) or {})
+        open_kwargs.pop('engine', None)
+        storage_options = getattr(source, 'storage_options', None) or {}
+        return df[path_column].iloc[0], storage_options, open_kwargs
+    return None
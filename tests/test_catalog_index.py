@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from beaker_climate.beaker_climate.catalog_index import FacetIndex
+
+COLUMNS = ['source_id', 'experiment_id']
+
+
+@pytest.fixture
+def catalog():
+    return pd.DataFrame({
+        'source_id': ['CESM2', 'CESM2', 'MIROC6', 'MIROC6', None],
+        'experiment_id': ['historical', 'ssp585', 'historical', 'ssp585', 'historical'],
+    })
+
+
+def test_matches_rows_at_positions(catalog):
+    index = FacetIndex(catalog, COLUMNS)
+    subset = catalog.iloc[[1, 2, 4]]
+    assert index.matches(subset, np.array([1, 2, 4]))
+    assert not index.matches(subset, np.array([0, 1, 2]))
+
+
+def test_reindexed_frame_does_not_match_by_label(catalog):
+    index = FacetIndex(catalog, COLUMNS)
+    subset = catalog.iloc[[2, 3]].reset_index(drop=True)
+    positions = catalog.index.get_indexer(subset.index)
+    assert not index.matches(subset, positions)
+
+
+def test_facet_counts_of_reindexed_results(catalog):
+    pytest.importorskip('intake')
+    from beaker_climate.beaker_climate.pangeo import CMIP6Catalog
+
+    cat = CMIP6Catalog.__new__(CMIP6Catalog)
+    cat.cat = SimpleNamespace(df=catalog)
+    cat._facet_index = None
+    results = pd.concat([catalog.iloc[[2]], catalog.iloc[[3]]], ignore_index=True)
+    assert cat.facet_counts(results, ['source_id']) == {'source_id': {'MIROC6': 2}}
+    assert cat.facet_counts(catalog.iloc[[0, 2]], ['source_id']) == {'source_id': {'CESM2': 1, 'MIROC6': 1}}
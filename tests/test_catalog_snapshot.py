@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from beaker_climate.beaker_climate.catalog_snapshot import CatalogSnapshot, categorize, remove_unused_categories
+
+GROUPBY = ['source_id', 'experiment_id', 'table_id']
+
+
+@pytest.fixture
+def catalog():
+    rows = [
+        ('CESM2', 'historical', 'Amon', 'tas'),
+        ('CESM2', 'ssp585', 'Amon', 'tas'),
+        ('MIROC6', 'historical', 'Omon', 'tos'),
+        ('MIROC6', 'ssp585', 'Omon', 'tos'),
+        ('IPSL-CM6A-LR', 'historical', 'Amon', 'pr'),
+    ]
+    df = pd.DataFrame(rows, columns=GROUPBY + ['variable_id'])
+    df['zstore'] = [f"gs://cmip6/{i}" for i in range(len(df))]
+    return categorize(df, max_ratio=1)
+
+
+def test_subset_drops_unused_categories(catalog):
+    subset = remove_unused_categories(catalog[catalog['table_id'] == 'Amon'])
+    assert list(subset['source_id'].cat.categories) == ['CESM2', 'IPSL-CM6A-LR']
+    assert subset['source_id'].value_counts().to_dict() == {'CESM2': 2, 'IPSL-CM6A-LR': 1}
+    assert subset['zstore'].tolist() == ['gs://cmip6/0', 'gs://cmip6/1', 'gs://cmip6/4']
+
+
+def test_groupby_keys_of_subset_only_have_rows(catalog):
+    subset = remove_unused_categories(catalog[catalog['variable_id'] == 'tos'])
+    # observed=False is the pandas < 3 default intake-esm relies on
+    assert set(subset.groupby('source_id', observed=False).groups) == {'MIROC6'}
+    groups = subset.groupby(GROUPBY, observed=False).groups
+    assert {key: len(rows) for key, rows in groups.items() if len(rows)} == {
+        ('MIROC6', 'historical', 'Omon'): 1, ('MIROC6', 'ssp585', 'Omon'): 1,
+    }
+
+
+def test_esm_datastore_keys_of_categorized_subset(catalog):
+    intake_esm = pytest.importorskip('intake_esm')
+    descriptor = {
+        'esmcat_version': '0.1.0',
+        'id': 'test',
+        'description': '',
+        'attributes': [{'column_name': column} for column in GROUPBY + ['variable_id']],
+        'assets': {'column_name': 'zstore', 'format': 'zarr'},
+        'aggregation_control': {'variable_column_name': 'variable_id', 'groupby_attrs': GROUPBY,
+                                'aggregations': []},
+    }
+    subset = remove_unused_categories(catalog[catalog['variable_id'] == 'tas'])
+    datastore = intake_esm.esm_datastore({'esmcat': descriptor, 'df': subset})
+    assert sorted(datastore.keys()) == ['CESM2.historical.Amon', 'CESM2.ssp585.Amon']
+
+
+@pytest.fixture
+def descriptor_url(tmp_path):
+    path = tmp_path / 'catalog.json'
+    path.write_text('{"esmcat_version": "0.1.0"}')
+    return str(path)
+
+
+def test_save_to_unwritable_cache_dir_is_skipped(catalog, descriptor_url, tmp_path):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+    snapshot = CatalogSnapshot(descriptor_url, str(blocker / 'cache'))
+    snapshot.save(catalog, {'esmcat_version': '0.1.0'}, {})
+    assert snapshot.load() is None
+
+
+def test_save_of_unwritable_frame_leaves_no_temp_files(catalog, descriptor_url, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    snapshot = CatalogSnapshot(descriptor_url, str(cache_dir))
+    mixed = catalog.assign(version=[1, 'v2', 3.5, None, b'x'])
+    snapshot.save(mixed, {'esmcat_version': '0.1.0'}, {})
+    assert snapshot.load() is None
+    assert list(cache_dir.iterdir()) == []
+
+    snapshot.save(catalog, {'esmcat_version': '0.1.0'}, {'source_id': ['CESM2']})
+    df, _, unique_values = snapshot.load()
+    assert df['zstore'].tolist() == catalog['zstore'].tolist()
+    assert unique_values == {'source_id': ['CESM2']}
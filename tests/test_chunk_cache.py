@@ -0,0 +1,40 @@
+import sqlite3
+
+from beaker_climate.beaker_climate import chunk_cache
+from beaker_climate.beaker_climate.chunk_cache import ChunkCache
+
+
+def stored_access_times(cache):
+    with sqlite3.connect(f"{cache.directory}/index.sqlite") as connection:
+        return dict(connection.execute('SELECT key, accessed FROM chunks'))
+
+
+def test_hits_are_written_to_the_index_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunk_cache, 'ACCESS_FLUSH_EVERY', 2)
+    cache = ChunkCache(str(tmp_path), max_bytes=1000)
+    for key in 'abc':
+        cache.put(key, b'x')
+    written = stored_access_times(cache)
+
+    assert cache.get('a') == b'x'
+    assert stored_access_times(cache) == written
+    assert cache.get('b') == b'x'
+    updated = stored_access_times(cache)
+    assert updated['a'] > written['a'] and updated['b'] > written['b']
+    assert updated['c'] == written['c']
+
+
+def test_running_total_follows_replace_and_eviction(tmp_path):
+    cache = ChunkCache(str(tmp_path), max_bytes=100)
+    cache.put('a', b'x' * 40)
+    cache.put('a', b'x' * 30)
+    cache.put('b', b'x' * 30)
+    assert cache.total == cache.total_bytes() == 60
+
+    # a buffered hit keeps 'a' from being the least recently used chunk
+    assert cache.get('a') is not None
+    cache.put('c', b'x' * 50)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.total == cache.total_bytes() == 80
+    assert ChunkCache(str(tmp_path), max_bytes=100).total == 80
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from beaker_climate.beaker_climate.search import esgf_search
+from beaker_climate.beaker_climate.search.esgf_benchmark import Benchmark, Scenario, report
+
+
+@pytest.fixture(autouse=True)
+def settings(tmp_path, monkeypatch):
+    settings = esgf_search.default_settings
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "local_index_path", str(tmp_path / "missing.sqlite"))
+    monkeypatch.setattr(settings, "facet_auto_refresh", False)
+    return settings
+
+
+class FakeIndex:
+    def search(self, query, limit, count):
+        return [{"id": "CMIP6.CMIP.NCAR.CESM2.historical.r1i1p1f1.Amon.tas.gn.v20190308|node"}], None
+
+
+class FakeStandIn:
+    index = FakeIndex()
+
+    def reset_counters(self):
+        pass
+
+    def total_requests(self):
+        return 1
+
+
+def measure(run):
+    benchmark = Benchmark(FakeStandIn(), llm_latency=0, repeat=4, warmup=1, verbose=False)
+    return asyncio.run(benchmark.measure(Scenario("fake", "fake scenario", run)))
+
+
+def test_failed_runs_are_not_timed():
+    async def run(context, i):
+        if i % 2:
+            raise ConnectionError("mirror down")
+        await asyncio.sleep(0.05)
+
+    result = measure(run)
+    assert result["runs"] == 2 and result["failures"] == 2
+    assert not result["failed"]
+    assert result["min_ms"] >= 50
+
+
+def test_scenario_fails_when_every_run_fails(capsys):
+    async def run(context, i):
+        raise ConnectionError("mirror down")
+
+    result = measure(run)
+    assert result["failed"] and result["failures"] == 4
+    assert "median_ms" not in result
+    report([result])
+    assert "failed" in capsys.readouterr().out
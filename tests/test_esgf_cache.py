@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+import pytest
+
+from beaker_climate.beaker_climate.search import esgf_cache
+from beaker_climate.beaker_climate.search.esgf_cache import QueryCache, SingleFlight
+
+
+def test_disk_hit_survives_failed_access_time_update(tmp_path, monkeypatch):
+    cache = QueryCache(str(tmp_path))
+    cache.put("key", {"value": 1}, ttl=60)
+    cache.memory.clear()
+
+    def fail(*args, **kwargs):
+        raise PermissionError("read-only cache directory")
+
+    monkeypatch.setattr(os, "utime", fail)
+    assert cache.get("key") == {"value": 1}
+    assert cache.counters["disk_hits"] == 1
+
+
+def test_normalization_keeps_word_order_and_prepositions():
+    normalize = esgf_cache.normalize_natural_language_query
+    assert normalize("ocean to atmosphere flux") != normalize("atmosphere to ocean flux")
+    assert normalize("tas from 1990 to 2000") != normalize("tas 1990 2000")
+    assert normalize("Please find CESM2 historical tas") == normalize("cesm2, historical, tas")
+
+
+def test_translation_cache_journals_puts_and_compacts(tmp_path):
+    path = str(tmp_path / "translations.json.gz")
+    cache = esgf_cache.TranslationCache(path, compact_every=3)
+    cache.put("cesm2 tas", "v1", {"source_id": "CESM2"})
+    cache.put("cesm2 pr", "v1", {"source_id": "CESM2", "variable_id": "pr"})
+    assert not os.path.exists(path)
+    assert os.path.exists(cache.journal_path)
+
+    reloaded = esgf_cache.TranslationCache(path, compact_every=3)
+    assert reloaded.get("cesm2 pr", "v1") == {"source_id": "CESM2", "variable_id": "pr"}
+    assert os.path.exists(path) and not os.path.exists(cache.journal_path)
+
+    for i in range(3):
+        reloaded.put(f"query {i}", "v1", {"i": i})
+    assert not os.path.exists(reloaded.journal_path)
+    assert esgf_cache.TranslationCache(path).get("query 2", "v1") == {"i": 2}
+
+
+def test_follower_outlives_a_call_cancelled_under_it():
+    flight = SingleFlight()
+    starts = []
+
+    async def fetch():
+        starts.append(len(starts))
+        await asyncio.sleep(0.05)
+        if len(starts) == 1:
+            # e.g. a hedged request cancelled from inside the call
+            raise asyncio.CancelledError()
+        return "listing"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", fetch))
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == "listing"
+        assert flight.calls == {}
+
+    asyncio.run(main())
+    assert starts == [0, 1]
+
+
+def test_cancelled_call_is_not_joined():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "listing"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # the cancelled call is still finishing, a new caller must not join it
+        assert "key" not in flight.calls
+        assert await flight.do("key", fetch) == "listing"
+
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from beaker_climate.beaker_climate.search.esgf_index import (
+    LocalDatasetIndex,
+    QueryCompiler,
+    UnsupportedQuery,
+    harvest,
+)
+
+
+def document(source_id, variable_id, suffix="gn.v20190308"):
+    dataset_id = f"CMIP6.CMIP.NCAR.{source_id}.historical.r1i1p1f1.Amon.{variable_id}.{suffix}|esgf-node"
+    return {
+        "id": dataset_id,
+        "instance_id": dataset_id.split("|")[0],
+        "master_id": dataset_id.split("|")[0].rsplit(".", 1)[0],
+        "version": "20190308",
+        "source_id": [source_id],
+        "variable_id": [variable_id],
+        "experiment_id": ["historical"],
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalDatasetIndex(str(tmp_path / "index.sqlite"))
+    index.upsert([
+        document("CESM2", "tas"),
+        document("CESM2-WACCM", "tas"),
+        document("cesm2", "pr"),
+        document("CESMX2", "pr"),
+    ])
+    yield index
+    index.close()
+
+
+def source_ids(index, query):
+    documents, _ = index.search(query, limit=100)
+    return sorted(d["instance_id"].split(".")[3] for d in documents)
+
+
+def test_compiles_fields_groups_and_operators():
+    sql, params = QueryCompiler("source_id:(CESM2 OR MIROC6) AND NOT variable_id:pr", False).compile()
+    assert sql == (
+        "((d.rowid IN (SELECT dataset FROM facet_values WHERE facet = ? AND value = ?) OR "
+        "d.rowid IN (SELECT dataset FROM facet_values WHERE facet = ? AND value = ?)) AND "
+        "NOT d.rowid IN (SELECT dataset FROM facet_values WHERE facet = ? AND value = ?))"
+    )
+    assert params == ["source_id", "CESM2", "source_id", "MIROC6", "variable_id", "pr"]
+
+
+def test_wildcards_compile_to_escaped_glob():
+    sql, params = QueryCompiler("id:CMIP6.[x]?_*", False).compile()
+    assert sql == "d.id GLOB ?"
+    assert params == ["CMIP6.[[]x][?]_*"]
+
+
+def test_free_text_without_fts_escapes_like_wildcards():
+    sql, params = QueryCompiler("100%_*", False).compile()
+    assert sql == "d.text LIKE ? ESCAPE '\\'"
+    assert params == ["%100\\%\\_%%"]
+
+
+def test_unsupported_queries_are_rejected():
+    for query in ("title:foo", "(source_id:CESM2", "source_id:CESM2 OR"):
+        with pytest.raises(UnsupportedQuery):
+            QueryCompiler(query, False).compile()
+
+
+def test_facet_wildcards_are_case_sensitive(index):
+    assert source_ids(index, "source_id:CESM2*") == ["CESM2", "CESM2-WACCM"]
+    assert source_ids(index, "source_id:cesm*") == ["cesm2"]
+
+
+def test_underscore_is_not_a_wildcard(index):
+    assert source_ids(index, "source_id:CESM_2*") == []
+    assert source_ids(index, "id:*.CESM2.*") == ["CESM2"]
+
+
+def test_boolean_query_against_index(index):
+    assert source_ids(index, "variable_id:tas AND NOT source_id:CESM2") == ["CESM2-WACCM"]
+    assert source_ids(index, "variable_id:(pr OR tas) AND source_id:CESM*") == ["CESM2", "CESM2-WACCM", "CESMX2"]
+
+
+class FlakyESGF:
+    """Serves one page per activity, newest documents first, and fails on `fail_on`."""
+
+    def __init__(self, pages, fail_on=None):
+        self.pages = pages
+        self.fail_on = fail_on
+
+    def get_current_mirror(self):
+        return "https://esgf.example"
+
+    async def with_all_available_mirrors(self, func, *args, **kwargs):
+        return await func(*args, **kwargs)
+
+    async def request(self, mirror, params):
+        activity = params.get("activity_id")
+        if activity is None:
+            body = {"facet_counts": {"facet_fields": {"activity_id": [a for name in self.pages for a in (name, 1)]}}}
+        elif activity == self.fail_on:
+            raise ConnectionError("node went away")
+        else:
+            docs = self.pages[activity]
+            body = {"response": {"docs": docs, "numFound": len(docs)}}
+        return SimpleNamespace(status_code=200, url=mirror, json=lambda: body)
+
+
+def test_interrupted_harvest_keeps_the_watermark(index):
+    index.set_meta("watermark", "2019-01-01T00:00:00Z")
+    newer = dict(document("MIROC6", "tas"), _timestamp="2021-01-01T00:00:00Z")
+    older = dict(document("MIROC6", "pr"), _timestamp="2020-01-01T00:00:00Z")
+    pages = {"ScenarioMIP": [newer], "CMIP": [older]}
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(harvest(FlakyESGF(pages, fail_on="CMIP"), index))
+    assert index.watermark == "2019-01-01T00:00:00Z"
+
+    asyncio.run(harvest(FlakyESGF(pages), index))
+    assert index.watermark == "2021-01-01T00:00:00Z"
+    assert source_ids(index, "variable_id:pr AND source_id:MIROC6") == ["MIROC6"]
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from beaker_climate.beaker_climate.search import esgf_search
+from beaker_climate.beaker_climate.search.esgf_index import LocalDatasetIndex
+from beaker_climate.beaker_climate.search.esgf_search import ESGFProvider
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    settings = esgf_search.default_settings
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "local_index_path", str(tmp_path / "missing.sqlite"))
+    monkeypatch.setattr(settings, "facet_auto_refresh", False)
+    return settings
+
+
+def test_missing_facet_seed_file_is_ignored(settings, tmp_path):
+    provider = ESGFProvider(None, facet_seed_file=str(tmp_path / "does-not-exist.json"))
+    assert provider.facet_possibilities is None
+
+
+def test_chunked_clauses_fit_the_limit(settings, monkeypatch):
+    monkeypatch.setattr(settings, "batch_query_max_chars", 120)
+    provider = ESGFProvider(None)
+    terms = [f'CMIP6.CMIP.NCAR.CESM2.historical.r{i}i1p1f1 "x"' for i in range(20)]
+    chunks = provider.chunk_query_terms(terms, "dataset_id", esgf_search.quoted_term)
+    assert [term for chunk in chunks for term in chunk] == terms
+    for chunk in chunks:
+        clause = esgf_search.or_clause("dataset_id", [esgf_search.quoted_term(t) for t in chunk])
+        assert len(esgf_search.quote(clause)) <= 120
+
+
+def test_gather_bounded_cancels_siblings_on_failure(settings):
+    provider = ESGFProvider(None)
+    cancelled = []
+
+    async def fail():
+        raise ConnectionError("node down")
+
+    async def slow(i):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await provider.gather_bounded([slow(0), fail(), slow(1)])
+
+    asyncio.run(run())
+    assert sorted(cancelled) == [0, 1]
+
+
+@pytest.mark.parametrize("enabled", [None, True])
+def test_speculation_is_off_by_default(settings, monkeypatch, enabled):
+    if enabled is not None:
+        monkeypatch.setattr(settings, "speculative_search", enabled)
+    provider = ESGFProvider(None)
+    provider.facet_possibilities = {"source_id": ["CESM2"], "variable_id": ["tas"]}
+    keyword_searches, searches = [], []
+
+    async def translate(query, retries=0):
+        await asyncio.sleep(0.01)
+        return {"source_id": "CESM2", "variable_id": "tas"}
+
+    async def keyword_search(query, page):
+        keyword_searches.append(query)
+        return {"results": []}
+
+    async def search_datasets(query, page):
+        searches.append(query)
+        return []
+
+    provider.translate_natural_language = translate
+    provider.keyword_search = keyword_search
+    provider.search_datasets = search_datasets
+    response = asyncio.run(provider.natural_language_search("cesm2 tas", 1))
+    assert response["results"] == []
+    assert keyword_searches == ([] if enabled is None else ["cesm2 tas"])
+    assert len(searches) == 1
+
+
+def test_only_facet_value_queries_are_worth_speculating(settings):
+    provider = ESGFProvider(None)
+    provider.facet_possibilities = {"source_id": ["CESM2-WACCM"], "variable_id": ["tas"]}
+    assert provider.worth_speculating("cesm2-waccm tas")
+    assert not provider.worth_speculating("surface temperature from CESM2-WACCM")
+
+
+def harvested_index(path):
+    index = LocalDatasetIndex(path)
+    index.upsert([
+        {"id": f"CMIP6.CMIP.NCAR.CESM2.historical.r{i}i1p1f1.Amon.{variable}.gn.v20190308|node",
+         "variable_id": [variable], "source_id": ["CESM2"]}
+        for i in range(3) for variable in ("tas", "pr")
+    ])
+    index.set_meta("harvested_at", str(time.time()))
+    index.connection.commit()
+    return index
+
+
+def test_keyword_search_is_answered_from_the_local_index(settings, tmp_path):
+    provider = ESGFProvider(None, local_index=harvested_index(str(tmp_path / "index.sqlite")))
+
+    async def offline(*args, **kwargs):
+        raise AssertionError("searched the mirrors")
+
+    provider.with_all_available_mirrors = offline
+    response = asyncio.run(provider.keyword_search("tas", 1))
+    assert len(response["results"]) == 3
+    with pytest.raises(AssertionError, match="searched the mirrors"):
+        # free text over an unindexed field has to go to ESGF
+        asyncio.run(provider.keyword_search("title:tas AND x", 1))
+
+
+def test_search_returns_json_documents_in_solr_shape(settings, tmp_path):
+    provider = ESGFProvider(None, local_index=harvested_index(str(tmp_path / "index.sqlite")))
+    response = asyncio.run(provider.search("tas", 1, True))
+    assert json.loads(json.dumps(response)) == response
+    assert {result["source_id"][0] for result in response["results"]} == {"CESM2"}
+    assert all(result["variable_id"] == ["tas"] for result in response["results"])
@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+pytest.importorskip('intake')
+pytest.importorskip('zarr')
+
+from beaker_climate.beaker_climate.pangeo import CMIP6Catalog
+
+
+def test_opens_store_without_consolidated_metadata(tmp_path):
+    path = tmp_path / 'store.zarr'
+    xr.Dataset({'tas': (('time', 'lat'), np.ones((4, 3)))}).to_zarr(path, consolidated=False)
+    cat = CMIP6Catalog.__new__(CMIP6Catalog)
+    cat._chunk_cache = None
+    ds = cat._open_zarr(f"file://{path}", None)
+    assert ds['tas'].shape == (4, 3)
+
+
+def results(*rows):
+    columns = ['source_id', 'member_id', 'experiment_id', 'table_id', 'variable_id', 'grid_label', 'zstore']
+    return pd.DataFrame([row + (f"gs://cmip6/{i}",) for i, row in enumerate(rows)], columns=columns)
+
+
+def test_ensemble_rejects_mixed_experiments_or_tables():
+    cat = CMIP6Catalog.__new__(CMIP6Catalog)
+    mixed = results(
+        ('CESM2', 'r1i1p1f1', 'historical', 'Amon', 'tas', 'gn'),
+        ('CESM2', 'r2i1p1f1', 'historical', 'day', 'tas', 'gn'),
+    )
+    with pytest.raises(ValueError, match='combinations'):
+        cat.get_ensemble(mixed)
+
+
+def test_ensemble_rejects_repeated_members():
+    cat = CMIP6Catalog.__new__(CMIP6Catalog)
+    repeated = results(
+        ('CESM2', 'r1i1p1f1', 'historical', 'Amon', 'tas', 'gn'),
+        ('CESM2', 'r1i1p1f1', 'historical', 'Amon', 'tas', 'gn'),
+        ('MIROC6', 'r1i1p1f1', 'historical', 'Amon', 'tas', 'gn'),
+    )
+    with pytest.raises(ValueError, match=r"\('CESM2', 'r1i1p1f1'\)"):
+        cat.get_ensemble(repeated)
+
+
+def test_ensemble_records_the_first_rows_chunk_plan(monkeypatch):
+    cat = CMIP6Catalog.__new__(CMIP6Catalog)
+    cat.chunks = None
+    cat.target_chunk_bytes = 1024 ** 2
+    cat.workers = 1
+    sizes = {'gs://cmip6/0': 12, 'gs://cmip6/1': 24}
+
+    def open_zarr(url, chunks, **kwargs):
+        if url == 'gs://cmip6/1':
+            # the second member finishes opening last
+            time.sleep(0.2)
+        return xr.Dataset({'tas': (('time',), np.zeros(sizes[url]))}, coords={'time': np.arange(sizes[url])})
+
+    monkeypatch.setattr(cat, '_open_zarr', open_zarr)
+    ensemble = cat.get_ensemble(results(
+        ('CESM2', 'r1i1p1f1', 'historical', 'Amon', 'tas', 'gn'),
+        ('CESM2', 'r2i1p1f1', 'historical', 'Amon', 'tas', 'gn'),
+    ), model_join='outer')
+    assert ensemble.sizes['member_id'] == 2
+    assert cat.last_chunk_plan.sizes == {'time': 12}
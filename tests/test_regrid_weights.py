@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+import xarray as xr
+# flowcast is a dependency of the package, these tests must not be skipped without it
+from flowcast.regrid import RegridType, regrid_1d
+
+from beaker_climate.beaker_climate.regrid_weights import RegridWeights, apply_weights
+
+OLD_LAT = np.arange(-10.25, 10, 0.5)
+OLD_LON = np.arange(0.25, 20, 0.5)
+# coarser, and reaching past the source grid so some target cells have no source cells
+COARSE_LAT = np.arange(-14.0, 14.1, 2.0)
+COARSE_LON = np.arange(-4.0, 24.1, 2.0)
+# finer, offset so no target coordinate coincides with a source one
+FINE_LAT = np.arange(-12.1, 12, 0.2)
+FINE_LON = np.arange(-2.1, 22, 0.2)
+
+
+def dataset(dtype=np.float64, nans=False):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3, len(OLD_LAT), len(OLD_LON))).astype(dtype)
+    if nans:
+        data[rng.random(data.shape) < 0.2] = np.nan
+        data[:, :6, :6] = np.nan
+    return xr.Dataset(
+        {'tas': (('time', 'lat', 'lon'), data)},
+        coords={'time': [0, 1, 2], 'lat': OLD_LAT, 'lon': OLD_LON},
+    )
+
+
+def flowcast_regrid(ds, lats, lons, aggregation):
+    regridded = regrid_1d(ds['tas'], lats, 'lat', aggregation=aggregation)
+    return regrid_1d(regridded, lons, 'lon', aggregation=aggregation)
+
+
+@pytest.mark.parametrize('nans', [False, True])
+@pytest.mark.parametrize('aggregation, lats, lons', [
+    (RegridType.mean, COARSE_LAT, COARSE_LON),
+    (RegridType.conserve, COARSE_LAT, COARSE_LON),
+    (RegridType.interp_or_mean, COARSE_LAT, COARSE_LON),
+    (RegridType.interp_or_mean, FINE_LAT, FINE_LON),
+    (RegridType.nearest_or_mode, FINE_LAT, FINE_LON),
+])
+def test_matches_flowcast(aggregation, lats, lons, nans):
+    ds = dataset(nans=nans)
+    weights = RegridWeights.build(OLD_LAT, OLD_LON, lats, lons, aggregation)
+    result = apply_weights(ds, weights, lats, lons)['tas']
+    expected = flowcast_regrid(ds, lats, lons, aggregation).transpose('time', 'lat', 'lon')
+    assert result.dtype == np.float64
+    np.testing.assert_allclose(result.values, expected.values, rtol=1e-10, atol=1e-12)
+    if lats is COARSE_LAT:
+        # target cells without any source cell are NaN, except for sums of data without NaNs
+        outside = result.values[:, 0, :]
+        if aggregation == RegridType.conserve and not nans:
+            assert (outside == 0).all()
+        else:
+            assert np.isnan(outside).all()
+
+
+def test_nearest_mode_of_coarser_grid_isnt_linear():
+    assert RegridWeights.build(OLD_LAT, OLD_LON, COARSE_LAT, COARSE_LON, RegridType.nearest_or_mode) is None
+
+
+def test_nearest_with_coincident_coordinates_falls_back_to_flowcast():
+    # every other target coordinate is a source one
+    lats = np.arange(-10.25, 10, 0.25)
+    assert RegridWeights.build(OLD_LAT, OLD_LON, lats, FINE_LON, RegridType.nearest_or_mode) is None
+
+
+@pytest.mark.parametrize('dtype, expected', [(np.float32, np.float32), (np.float64, np.float64), (np.int64, np.float64)])
+def test_keeps_float_precision(dtype, expected):
+    ds = dataset(dtype=dtype)
+    weights = RegridWeights.build(OLD_LAT, OLD_LON, COARSE_LAT, COARSE_LON, RegridType.mean)
+    assert apply_weights(ds, weights, COARSE_LAT, COARSE_LON)['tas'].dtype == expected
+    assert apply_weights(ds.chunk({'time': 1}), weights, COARSE_LAT, COARSE_LON)['tas'].dtype == expected
+
+
+def test_mixed_precision_variables_keep_their_own_dtype():
+    ds = dataset(dtype=np.float32).assign(pr=dataset()['tas'])
+    weights = RegridWeights.build(OLD_LAT, OLD_LON, COARSE_LAT, COARSE_LON, RegridType.mean)
+    result = apply_weights(ds, weights, COARSE_LAT, COARSE_LON)
+    assert result['tas'].dtype == np.float32
+    assert result['pr'].dtype == np.float64
+
+
+def test_round_trips_through_bytes():
+    ds = dataset(nans=True)
+    weights = RegridWeights.build(OLD_LAT, OLD_LON, COARSE_LAT, COARSE_LON, RegridType.mean)
+    restored = RegridWeights.from_bytes(weights.to_bytes())
+    np.testing.assert_array_equal(
+        apply_weights(ds, restored, COARSE_LAT, COARSE_LON)['tas'].values,
+        apply_weights(ds, weights, COARSE_LAT, COARSE_LON)['tas'].values,
+    )
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from beaker_climate.beaker_climate.subset import find_coordinate, open_intake_source
+
+
+def grid(x_attrs, y_attrs):
+    return xr.Dataset(
+        {'tas': (('y', 'x'), np.zeros((3, 4)))},
+        coords={'y': ('y', np.arange(3.0), y_attrs), 'x': ('x', np.arange(4.0), x_attrs)},
+    )
+
+
+def test_x_y_are_lat_lon_only_in_degrees():
+    metres = grid({'units': 'm'}, {'units': 'm'})
+    assert find_coordinate(metres, 'latitude') is None
+    assert find_coordinate(metres, 'longitude') is None
+    degrees = grid({'units': 'degrees'}, {'units': 'degrees'})
+    assert find_coordinate(degrees, 'latitude') == 'y'
+    assert find_coordinate(degrees, 'longitude') == 'x'
+
+
+def test_projected_axis_is_not_lat_lon():
+    projected = grid({'axis': 'X', 'standard_name': 'projection_x_coordinate', 'units': 'km'},
+                     {'axis': 'Y', 'standard_name': 'projection_y_coordinate', 'units': 'km'})
+    assert find_coordinate(projected, 'longitude') is None
+    rotated = grid({'axis': 'X', 'standard_name': 'grid_longitude', 'units': 'degrees'},
+                   {'axis': 'Y', 'standard_name': 'grid_latitude', 'units': 'degrees'})
+    assert find_coordinate(rotated, 'latitude') == 'y'
+
+
+class ZarrSource:
+    """Stand-in for an intake-xarray zarr source."""
+
+    def __init__(self, urlpath):
+        self.urlpath = urlpath
+        self.kwargs = {}
+        self.storage_options = {}
+        self.opened = False
+
+    def to_dask(self):
+        self.opened = True
+        return xr.open_dataset(self.urlpath, engine='zarr', chunks={})
+
+
+@pytest.fixture
+def source(tmp_path):
+    pytest.importorskip('zarr')
+    path = str(tmp_path / 'store.zarr')
+    xr.Dataset(
+        {'tas': (('time', 'lat', 'lon'), np.ones((6, 4, 8))), 'pr': (('time', 'lat', 'lon'), np.ones((6, 4, 8)))},
+        coords={'lat': np.linspace(-60, 60, 4), 'lon': np.arange(0, 360, 45.0)},
+    ).to_zarr(path, encoding={'tas': {'chunks': (2, 4, 8)}}, zarr_format=2)
+    return ZarrSource(path)
+
+
+def test_source_without_selection_keeps_its_chunks(source):
+    ds = open_intake_source(source)
+    assert source.opened
+    assert ds['tas'].chunks == ((2, 2, 2), (4,), (8,))
+
+
+def test_selection_is_pushed_down(source):
+    ds = open_intake_source(source, bbox=(0, -10, 90, 90), variables=['tas'])
+    assert not source.opened
+    assert list(ds.data_vars) == ['tas']
+    assert ds.sizes == {'time': 6, 'lat': 2, 'lon': 3}
+    assert ds['tas'].chunks is not None